@@ -0,0 +1,52 @@
+""" Runs the driver assignments for several configuration directories in parallel.
+Each directory holds its own map.txt, sheet_ids.json, and other configuration files, and caches its data in a pickle subdirectory.
+"""
+
+import argparse
+from cfg.config import *
+from concurrent.futures import ProcessPoolExecutor
+import os
+import pandas as pd
+import rides
+
+PARAM_CFG_DIRS = 'cfg_dirs'
+PARAM_WORKERS = 'workers'
+
+
+def main(args: dict) -> pd.DataFrame:
+    """ Runs every configuration directory in a separate worker process, then prints a combined summary.
+    """
+    runs = []
+    for cfg_dir in args[PARAM_CFG_DIRS]:
+        run_args = {key: val for key, val in args.items() if key not in (PARAM_CFG_DIRS, PARAM_WORKERS)}
+        run_args[PARAM_CFG_DIR] = os.path.realpath(cfg_dir)
+        run_args[PARAM_DATA_DIR] = os.path.join(os.path.realpath(cfg_dir), 'pickle')
+        runs.append(run_args)
+
+    with ProcessPoolExecutor(max_workers=args[PARAM_WORKERS]) as pool:
+        summaries = list(pool.map(_run, runs))
+
+    summary = pd.DataFrame(summaries)
+    counts = ['riders', 'assigned', 'drivers']
+    summary.loc['total', counts] = summary[counts].sum()
+    summary[counts] = summary[counts].astype(int)
+    print(summary.fillna('').to_string())
+    return summary
+
+
+def _run(args: dict) -> dict:
+    """Runs one configuration directory, reporting failures in the summary instead of stopping the batch.
+    """
+    try:
+        return rides.main(args)
+    except Exception as e:
+        return {PARAM_CFG_DIR: args[PARAM_CFG_DIR], 'status': f'{type(e).__name__}: {e}', 'riders': 0, 'assigned': 0, 'drivers': 0}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(parents=[rides.create_parser(add_help=False)])
+    parser.add_argument(PARAM_CFG_DIRS, nargs='+',
+                        help='configuration directories to run, one per campus or ministry')
+    parser.add_argument(f'--{PARAM_WORKERS}', type=int, default=None,
+                        help='set how many runs can execute at once (default: number of CPUs)')
+    main(vars(parser.parse_args()))
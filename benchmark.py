@@ -0,0 +1,210 @@
+""" Benchmarks the assignment pipeline on synthetic data at several scales.
+The results are saved per commit, so a run can be compared against the results of an earlier commit.
+"""
+
+import argparse
+import cfg
+from cfg.config import *
+import datetime
+import json
+import lib.assignments as core
+import lib.cache as cache
+import lib.custom_log as my_logger
+import lib.postprocessing as post
+import lib.rides_data as data
+import lib.routing as routing
+import lib.setup as setup
+import lib.synthetic as synthetic
+import os
+import pandas as pd
+import platform
+import rides
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PARAM_SCALES = 'scales'
+PARAM_REPEAT = 'repeat'
+PARAM_OUTPUT = 'output'
+PARAM_COMPARE = 'compare'
+PARAM_SEED = 'seed'
+PARAM_STAGES = 'stages'
+
+STAGES = ['startup.import_rides', 'startup.first_assignment', 'setup.filter_friday', 'setup.filter_sunday', 'assignments.assign', 'assignments.assign_v2', 'assignments.organize', 'routing.order_pickups', 'postprocessing.clean_output']
+
+### Number of map areas, permanent riders, weekly riders and drivers at each scale
+SCALES = {
+    'small':  (10,  60,   20,  15),
+    'medium': (25,  600,  200, 120),
+    'large':  (40,  3000, 1000, 600),
+    'xlarge': (48,  8000, 2000, 1500),
+}
+
+
+def main(args: dict) -> pd.DataFrame:
+    """Times every stage at every scale, saves the results and prints them, compared to earlier results if given.
+    """
+    results = []
+    for scale in args[PARAM_SCALES]:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cfg_dir = os.path.join(tmp_dir, 'cfg')
+            data_dir = os.path.join(tmp_dir, 'pickle')
+            synthetic.write_config(cfg_dir, data_dir, *SCALES[scale], seed=args[PARAM_SEED])
+            for (stage, riders, drivers, times) in _run_scale(cfg_dir, data_dir, args):
+                results.append({'scale': scale, 'stage': stage, 'areas': SCALES[scale][0], 'riders': riders, 'drivers': drivers,
+                                'min_s': min(times), 'median_s': statistics.median(times)})
+
+    commit = _git_commit()
+    output = args[PARAM_OUTPUT] or f'benchmark-{commit or "local"}.json'
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as output_file:
+        json.dump({'commit': commit, 'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                   'python': platform.python_version(), 'results': results}, output_file, indent=2)
+
+    table = pd.DataFrame(results)
+    if args[PARAM_COMPARE] is not None:
+        with open(args[PARAM_COMPARE]) as base_file:
+            base = pd.DataFrame(json.load(base_file)['results'])
+        table = table.merge(base[['scale', 'stage', 'min_s']].rename(columns={'min_s': 'base_min_s'}), on=['scale', 'stage'], how='left')
+        table['speedup'] = (table['base_min_s'] / table['min_s']).round(2)
+    print(table.to_string(index=False))
+    print(f'Saved results to {output}')
+    return table
+
+
+def _run_scale(cfg_dir: str, data_dir: str, args: dict) -> list[tuple[str, int, int, list[float]]]:
+    """Returns the stage name, rider count, driver count and run times of every stage on the synthetic data of one scale.
+    Each run gets fresh copies of its inputs, which are made outside the timing.
+    """
+    timings = []
+    repeat = args[PARAM_REPEAT]
+    stages = args[PARAM_STAGES]
+
+    if 'startup.import_rides' in stages or 'startup.first_assignment' in stages:
+        (import_times, run_times) = _time_startup(cfg_dir, data_dir, repeat)
+        if 'startup.import_rides' in stages:
+            timings.append(('startup.import_rides', 0, 0, import_times))
+        if 'startup.first_assignment' in stages:
+            timings.append(('startup.first_assignment', 0, 0, run_times))
+
+    _init(ARG_FRIDAY, cfg_dir, data_dir, args)
+    (drivers, riders) = data.get_cached_input()
+    if 'setup.filter_friday' in stages:
+        times = _time(repeat, lambda: (drivers.copy(), riders.copy()), setup.filter_friday)
+        timings.append(('setup.filter_friday', len(riders.index), len(drivers.index), times))
+
+    _init(ARG_SUNDAY, cfg_dir, data_dir, args)
+    (drivers, riders) = data.get_cached_input()
+    if 'setup.filter_sunday' in stages:
+        times = _time(repeat, lambda: (drivers.copy(), riders.copy()), setup.filter_sunday)
+        timings.append(('setup.filter_sunday', len(riders.index), len(drivers.index), times))
+
+    # The assignment stages run on the Sunday riders and drivers of both services at once
+    (drivers, riders) = setup.filter_sunday(drivers, riders)
+    setup.split_sunday_services(drivers, riders)
+    prepared = drivers.copy()
+    setup.add_assignment_vars(prepared)
+    setup.prioritize_drivers_with_preferences(prepared, riders)
+    rider_map = setup.create_rider_map(riders)
+    prepared = setup.fetch_necessary_drivers(prepared, len(riders.index))
+    sizes = (len(riders.index), len(prepared.index))
+
+    if 'assignments.assign' in stages:
+        times = _time(repeat, lambda: (prepared.copy(), riders.copy()), core.assign)
+        timings.append(('assignments.assign', *sizes, times))
+    if 'assignments.assign_v2' in stages:
+        times = _time(repeat, lambda: (prepared.copy(), riders.copy(), {loc: list(r_idxs) for loc, r_idxs in rider_map.items()}), core.assign_v2)
+        timings.append(('assignments.assign_v2', *sizes, times))
+    if 'assignments.organize' in stages:
+        times = _time(repeat, lambda: (drivers.copy(), riders.copy()), core.organize)
+        timings.append(('assignments.organize', len(riders.index), len(drivers.index), times))
+
+    out = core.organize(drivers.copy(), riders.copy())
+    if 'routing.order_pickups' in stages:
+        # Routes are memoized, so only the first run finds them
+        times = _time(repeat, lambda: (out.copy(),), routing.order_pickups)
+        timings.append(('routing.order_pickups', len(out.index), sizes[1], times))
+    if 'postprocessing.clean_output' in stages:
+        routing.order_pickups(out)
+        times = _time(repeat, lambda: (out.copy(),), post.clean_output)
+        timings.append(('postprocessing.clean_output', len(out.index), sizes[1], times))
+    return timings
+
+
+def _time_startup(cfg_dir: str, data_dir: str, repeat: int) -> tuple[list[float], list[float]]:
+    """Returns the times to import rides.py and the times from starting the interpreter to the first written assignment,
+    for an offline Sunday run in a new process. The import times come from python -X importtime.
+    """
+    root = os.path.dirname(os.path.realpath(__file__))
+    code = '; '.join([
+        f'import sys; sys.path.insert(0, {root!r})',
+        'import rides',
+        f"args = vars(rides.create_parser().parse_args(['--{PARAM_DAY}', '{ARG_SUNDAY}', '--no-download', '--no-upload', '--{PARAM_LOG}', 'ERROR']))",
+        f'args.update({{{PARAM_CFG_DIR!r}: {cfg_dir!r}, {PARAM_DATA_DIR!r}: {data_dir!r}}})',
+        'rides.main(args)',
+    ])
+
+    import_times = []
+    run_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True, check=True)
+        run_times.append(time.perf_counter() - start)
+        # Lines are "import time: <self us> | <cumulative us> | <module>", indented by nesting
+        cumulative = [int(line.split('|')[1]) for line in result.stderr.splitlines() if line.startswith('import time:') and line.split('|')[2].strip() == 'rides']
+        import_times.append(cumulative[-1] / 1e6)
+    return (import_times, run_times)
+
+
+def _init(day: str, cfg_dir: str, data_dir: str, args: dict):
+    """Sets up the run arguments and loads the configuration of the synthetic data for the day.
+    """
+    ARGS.clear()
+    ARGS.update(vars(rides.create_parser().parse_args([f'--{PARAM_DAY}', day, '--no-download', '--no-upload', f'--{PARAM_LOG}', args[PARAM_LOG]])))
+    ARGS[PARAM_CFG_DIR] = cfg_dir
+    ARGS[PARAM_DATA_DIR] = data_dir
+    my_logger.init()
+    cfg.init()
+    cache.init()
+
+
+def _time(repeat: int, make_inputs, func) -> list[float]:
+    times = []
+    for _ in range(repeat):
+        inputs = make_inputs()
+        start = time.perf_counter()
+        func(*inputs)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def _git_commit() -> str:
+    """Returns the short hash of the checked out commit, or None outside a git repository.
+    """
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.realpath(__file__)),
+                                capture_output=True, text=True, check=True)
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(f'--{PARAM_SCALES}', nargs='+', default=['small', 'medium'], choices=list(SCALES),
+                        help='choose the sizes of the synthetic data to run')
+    parser.add_argument(f'--{PARAM_STAGES}', nargs='+', default=STAGES, choices=STAGES,
+                        help='choose the stages to time (the original assign is slow from the large scale up)')
+    parser.add_argument(f'--{PARAM_REPEAT}', type=int, default=3,
+                        help='set how many times each stage is run, the fastest and median times are reported')
+    parser.add_argument(f'--{PARAM_SEED}', type=int, default=0,
+                        help='set the seed of the synthetic data')
+    parser.add_argument(f'--{PARAM_OUTPUT}', default=None,
+                        help='set the file for the results (default: benchmark-<commit>.json in the current directory)')
+    parser.add_argument(f'--{PARAM_COMPARE}', default=None, metavar='RESULTS',
+                        help='compare against the results file of an earlier run')
+    parser.add_argument(f'--{PARAM_LOG}', type=str.upper, default='ERROR', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+                        help='set a level of verbosity for logging')
+    main(vars(parser.parse_args()))
@@ -1,62 +1,414 @@
 from cfg.config import *
+import csv
+import hashlib
+import lib.spatial as spatial
+import lib.validation as prep
 import logging
+import math
+import numpy as np
 import os
+import pandas as pd
+import pickle
+import time
+import zipfile
+
+### Bumped when the compiled tables change, so snapshots of older versions are compiled again
+SNAPSHOT_VERSION = 1
+### Files modified this recently are compared by hash, since a quick rewrite may not change their modification time
+RACY_NS = 2 * 10**9
+
+
+def cfg_path(file: str) -> str:
+    """Returns the path of a file in the configuration directory of the current run.
+    """
+    return os.path.join(ARGS.get(PARAM_CFG_DIR, CFG_PATH), file)
+
+
+def data_path(key: str) -> str:
+    """Returns the path of a cache file in the data directory of the current run.
+    """
+    return os.path.join(ARGS.get(PARAM_DATA_DIR, DATA_PATH), key)
+
+
+def reset():
+    """Clears the configuration loaded by a previous run in this process.
+    """
+    LOC_MAP.clear()
+    CAMPUS_LOCS.clear()
+    SERVICES.clear()
+    IGNORED_DRIVERS.clear()
+    IGNORED_RIDERS.clear()
+    DRIVER_PREFS.clear()
+    LOC_INDEX.clear()
+    LOC_NEIGHBORS.clear()
+    LOC_DIST.clear()
+    LOC_ROUTES.clear()
+
+
+def snapshot() -> dict:
+    """Returns a copy of the configuration loaded for the current run, which can be restored in a later run.
+    """
+    return {
+        'loc_map': dict(LOC_MAP),
+        'campus_locs': set(CAMPUS_LOCS),
+        'services': dict(SERVICES),
+        'ignored_drivers': set(IGNORED_DRIVERS),
+        'ignored_riders': set(IGNORED_RIDERS),
+        'driver_prefs': dict(DRIVER_PREFS),
+        'loc_index': dict(LOC_INDEX),
+        'loc_neighbors': dict(LOC_NEIGHBORS),
+        'loc_dist': list(LOC_DIST),
+        'loc_routes': dict(LOC_ROUTES),
+    }
+
+
+def restore(tables: dict):
+    """Replaces the loaded configuration with a snapshot, without reading the configuration files.
+    """
+    reset()
+    LOC_MAP.update(tables['loc_map'])
+    CAMPUS_LOCS.update(tables['campus_locs'])
+    SERVICES.update(tables['services'])
+    IGNORED_DRIVERS.update(tables['ignored_drivers'])
+    IGNORED_RIDERS.update(tables['ignored_riders'])
+    DRIVER_PREFS.update(tables['driver_prefs'])
+    LOC_INDEX.update(tables['loc_index'])
+    LOC_NEIGHBORS.update(tables['loc_neighbors'])
+    LOC_DIST.extend(tables['loc_dist'])
+    LOC_ROUTES.update(tables['loc_routes'])
 
 
 def load_map():
-    """Loads map.txt into a dictionary of bitmaps for the hardcoded locations.
+    """Loads map.txt and locations.csv into a dictionary of route codes, one bit per area, and the distances between the areas.
     """
-    if os.path.isfile(MAP_FILE):
-        map_file = MAP_FILE
+    has_locations = os.path.isfile(cfg_path(LOCATIONS_FILE))
+    if os.path.isfile(cfg_path(MAP_FILE)):
+        map_file = cfg_path(MAP_FILE)
+    elif has_locations:
+        map_file = None
     else:
-        logging.warning(f'{os.path.basename(MAP_FILE)} not found. Location optimizations are ignored.')
+        logging.warning(f'{MAP_FILE} not found. Location optimizations are ignored.')
         return
     
     if ARGS[PARAM_DAY] == ARG_FRIDAY:
-        if os.path.isfile(CAMPUS_FILE):
-            with open(CAMPUS_FILE) as campus:
+        if os.path.isfile(cfg_path(CAMPUS_FILE)):
+            with open(cfg_path(CAMPUS_FILE)) as campus:
                 for place in campus:
                     place = place.strip().lower()
                     CAMPUS_LOCS.add(place)
         else:
-            logging.warning(f'{os.path.basename(CAMPUS_FILE)} not found. Friday campus riders are not filtered.')
+            logging.warning(f'{CAMPUS_FILE} not found. Friday campus riders are not filtered.')
+
+    map_text = ''
+    if map_file is not None:
+        with open(map_file, 'r') as map:
+            map_text = map.read()
 
+    areas = {}  # place => areas of the place, before campus places are merged
     cnt = 0
-    with open(map_file, 'r') as map:
-        loc = 0b1
-        for line in map:
-            if (line.startswith('#')):
-                continue
-            places = line.split(',')
-            places = [place.strip().lower() for place in places]
-            for place in places:
-                if ARGS[PARAM_DAY] == ARG_FRIDAY and place in CAMPUS_LOCS:
-                    place = CAMPUS.strip().lower()
-                if place not in LOC_MAP:
-                    LOC_MAP[place] = LOC_NONE
-                LOC_MAP[place] |= loc
-            loc <<= 1
+    for line in map_text.splitlines():
+        if (line.startswith('#')):
+            continue
+        places = line.split(',')
+        places = [place.strip().lower() for place in places]
+        for place in places:
+            _add_place(areas, place, cnt)
+        cnt += 1
+    map_width = cnt
+
+    # Locations with coordinates that are not on map.txt get an area of their own
+    (coords, locations_text) = load_locations() if has_locations else ({}, '')
+    points = {}
+    for (place, lat_lon) in coords.items():
+        if place not in areas:
+            _add_place(areas, place, cnt)
             cnt += 1
+        points.setdefault(areas[place][0], lat_lon)
+
+    edges_text = None
+    if os.path.isfile(cfg_path(EDGES_FILE)):
+        with open(cfg_path(EDGES_FILE), 'r') as edges_file:
+            edges_text = edges_file.read()
+
+    # The edges are only needed when the distances of these files are not saved yet
+    digest = hashlib.sha256(f'{MAX_ROUTE_DIST}\n{LOC_STEP_KM}\n{map_text}\n{edges_text}\n{locations_text}'.encode()).hexdigest()
+    make_edges = lambda: load_edges(areas, map_width, edges_text) + _coordinate_edges(points)
+    build_loc_tables(_load_dist(cnt, make_edges, digest))
+    if map_file is not None:
+        logging.info(f'{os.path.basename(map_file)} loaded with size={cnt}')
+
+
+def _add_place(areas: dict[str, list[int]], place: str, area: int):
+    areas.setdefault(place, []).append(area)
+    if ARGS[PARAM_DAY] == ARG_FRIDAY and place in CAMPUS_LOCS:
+        place = CAMPUS.strip().lower()
+    if place not in LOC_MAP:
+        LOC_MAP[place] = LOC_NONE
+    LOC_MAP[place] |= 1 << area
+
+
+def load_locations() -> tuple[dict[str, tuple[float, float]], str]:
+    """Returns the latitude and longitude of every location in locations.csv, and the text of the file.
+    """
+    with open(cfg_path(LOCATIONS_FILE), 'r') as locations_file:
+        locations_text = locations_file.read()
+
+    coords = {}
+    rows = csv.reader(line for line in locations_text.splitlines() if not line.startswith('#') and line.strip() != '')
+    for row in rows:
+        fields = [field.strip() for field in row]
+        if fields == LOCATIONS_HDRS or fields == [hdr.lower() for hdr in LOCATIONS_HDRS]:
+            continue
+        try:
+            (place, lat, lon) = fields
+            coords[place.lower()] = (float(lat), float(lon))
+        except ValueError:
+            logging.warning(f'Ignoring invalid location in {LOCATIONS_FILE}: {",".join(row)}')
+    logging.info(f'{LOCATIONS_FILE} loaded with {len(coords)} locations')
+    return (coords, locations_text)
+
+
+def _coordinate_edges(points: dict[int, tuple[float, float]]) -> list[tuple[int, int, int]]:
+    """Returns edges between the areas with coordinates, for every pair close enough to pick up from each other,
+    weighted by how many LOC_STEP_KM apart they are. Areas with nobody close by are linked to the nearest one.
+    """
+    if len(points) < 2:
+        return []
+    area_of = list(points)
+    xy = spatial.project(list(points.values()))
+    radius = ARG_DISTANCE_MAX * LOC_STEP_KM
+    index = spatial.GridIndex(xy, radius)
+
+    edges = []
+    for i in range(len(area_of)):
+        near = [j for j in index.within(xy[i], radius) if j != i]
+        if len(near) == 0:
+            near = [index.nearest(xy[i], exclude=i)]
+        for j in near:
+            weight = max(math.ceil(float(np.hypot(*(xy[i] - xy[j]))) / LOC_STEP_KM), 1)
+            edges.append((area_of[i], area_of[j], weight))
+    return edges
+
+
+def load_edges(areas: dict[str, list[int]], width: int, edges_text: str) -> list[tuple[int, int, int]]:
+    """Returns the weighted edges between the areas of map.txt listed in the text of edges.txt.
+    Without edges.txt, consecutive lines of map.txt are one apart.
+    """
+    if edges_text is None:
+        return [(area, area + 1, 1) for area in range(width - 1)]
+
+    edges = []
+    for line in edges_text.splitlines():
+        if line.startswith('#') or line.strip() == '':
+            continue
+        fields = [field.strip().lower() for field in line.split(',')]
+        if len(fields) == 2:
+            fields.append('1')
+        if len(fields) != 3 or not fields[2].isdigit():
+            logging.warning(f'Ignoring invalid edge in {EDGES_FILE}: {line.strip()}')
+            continue
+        (place1, place2, weight) = fields
+        if place1 not in areas or place2 not in areas:
+            logging.warning(f'Ignoring edge in {EDGES_FILE} to a location not in {MAP_FILE}: {line.strip()}')
+            continue
+        edges += [(area1, area2, int(weight)) for area1 in areas[place1] for area2 in areas[place2]]
+    logging.info(f'{EDGES_FILE} loaded with {len(edges)} edges')
+    return edges
+
+
+def _load_dist(width: int, make_edges, digest: str) -> np.ndarray:
+    """Returns the all-pairs distances between the areas, read from the data directory if they were computed for the same files.
+    """
+    path = data_path(LOC_DIST_FILE)
+    if os.path.isfile(path):
+        try:
+            with np.load(path) as cached:
+                if str(cached['digest']) == digest:
+                    return cached['dist']
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            logging.debug(f'Ignoring unreadable {LOC_DIST_FILE}')
 
-    logging.info(f'{os.path.basename(map_file)} loaded with size={cnt}')
+    dist = shortest_paths(width, make_edges())
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(path, digest=digest, dist=dist)
+    except OSError as e:
+        logging.debug(f'Could not save {LOC_DIST_FILE}: {e}')
+    return dist
 
 
-def create_pickles():
-    """Create cache files in pickle directory.
+def shortest_paths(width: int, edges: list[tuple[int, int, int]]) -> np.ndarray:
+    """Returns the shortest path distances between every pair of areas, capped at MAX_ROUTE_DIST for areas that are not connected.
     """
-    if (not os.path.isdir(DATA_PATH)):
-        os.makedirs(DATA_PATH)
-    import pandas as pd
-    if (not os.path.exists(os.path.join(DATA_PATH, PERMANENT_SHEET_KEY))):
-        pd.DataFrame().to_pickle(os.path.join(DATA_PATH, PERMANENT_SHEET_KEY))
-    if (not os.path.exists(os.path.join(DATA_PATH, WEEKLY_SHEET_KEY))):
-        pd.DataFrame().to_pickle(os.path.join(DATA_PATH, WEEKLY_SHEET_KEY))
-    if (not os.path.exists(os.path.join(DATA_PATH, DRIVER_SHEET_KEY))):
-        pd.DataFrame().to_pickle(os.path.join(DATA_PATH, DRIVER_SHEET_KEY))
-    if (not os.path.exists(os.path.join(DATA_PATH, OUTPUT_SHEET_KEY))):
-        pd.DataFrame().to_pickle(os.path.join(DATA_PATH, OUTPUT_SHEET_KEY))
+    dist = np.full((width, width), np.inf)
+    np.fill_diagonal(dist, 0)
+    for (area1, area2, weight) in edges:
+        dist[area1, area2] = dist[area2, area1] = min(dist[area1, area2], weight)
+
+    # Floyd-Warshall, one row of relaxations at a time
+    for area in range(width):
+        np.minimum(dist, dist[:, area, None] + dist[None, area, :], out=dist)
+    return np.minimum(dist, MAX_ROUTE_DIST).astype(np.int64)
+
+
+def build_loc_tables(dist: np.ndarray):
+    """Builds the location index and the neighbor rings of the route codes in LOC_MAP from the distances between areas.
+    """
+    width = len(dist)
+    LOC_DIST.clear()
+    LOC_DIST.extend(dist.tolist())
+
+    LOC_INDEX.clear()
+    LOC_NEIGHBORS.clear()
+    connected = dist[dist < MAX_ROUTE_DIST]
+    rings = int(connected.max()) + 1 if len(connected) > 0 else 0
+    for code in set(LOC_MAP.values()):
+        idx = [area for area in range(width) if (code >> area) & 1]
+        LOC_INDEX[code] = idx
+
+        # Row d marks the areas exactly d away from any area of the code
+        is_at = np.zeros((rings, width), dtype=bool)
+        for row in dist[idx]:
+            near = np.flatnonzero(row < rings)
+            is_at[row[near], near] = True
+        LOC_NEIGHBORS[code] = [_areas_to_code(is_at[d]) for d in range(rings)]
+
+
+def _areas_to_code(is_area: np.ndarray) -> int:
+    """Returns the route code of the areas marked in a boolean array.
+    """
+    return int.from_bytes(np.packbits(is_area, bitorder='little').tobytes(), 'little')
+
+
+def load_services():
+    """Loads the services of the day of the run from services.txt, or the default services if it lists none.
+    Each line is a day, a service, and the words in the notes that ask for that service.
+    """
+    if os.path.isfile(cfg_path(SERVICES_FILE)):
+        with open(cfg_path(SERVICES_FILE)) as services_file:
+            for line in services_file:
+                if line.startswith('#') or line.strip() == '':
+                    continue
+                words = [word.strip() for word in line.split(',')]
+                if len(words) < 2:
+                    logging.warning(f'Ignoring line of {SERVICES_FILE} without a service: {line.strip()}')
+                    continue
+                (day, service, *keywords) = words
+                if day.lower() == ARGS[PARAM_DAY]:
+                    SERVICES[service] = [keyword.lower() for keyword in keywords if keyword != '']
+    if len(SERVICES) == 0:
+        SERVICES.update(DEFAULT_SERVICES[ARGS[PARAM_DAY]])
+    logging.debug(f'Services: {SERVICES}')
+
+
+def load_people(file: str) -> list[tuple[str, int, list[str]]]:
+    """Returns the name, phone key and other fields of every line of a list of people, skipping comments.
+    Lines without a name and a valid phone number are skipped with a warning.
+    """
+    if not os.path.isfile(cfg_path(file)):
+        return []
+    with open(cfg_path(file), newline='') as people_file:
+        rows = [row for row in csv.reader(people_file, skipinitialspace=True) if len(row) > 0 and not row[0].startswith('#')]
+    rows = [row + [''] * (2 - len(row)) for row in rows]
+    keys = prep.phone_keys(pd.Series([row[1] for row in rows], dtype=object)).tolist()
+    people = []
+    for (row, key) in zip(rows, keys):
+        name = normalize_name(row[0])
+        if name == '' or key == 0:
+            logging.warning(f'Ignoring line of {file} without a name and phone number: {", ".join(row)}')
+            continue
+        people.append((name, key, [field.strip() for field in row[2:]]))
+    return people
+
+
+def normalize_name(name: str) -> str:
+    return ' '.join(str(name).lower().split())
+
+
+def load_people_tables():
+    """Loads the ignored drivers and riders by name and phone key, and the driver preferences by phone key.
+    """
+    IGNORED_DRIVERS.update((name, key) for (name, key, _) in load_people(IGNORE_DRIVERS_FILE))
+    IGNORED_RIDERS.update((name, key) for (name, key, _) in load_people(IGNORE_RIDERS_FILE))
+    for (_, key, fields) in load_people(DRIVER_PREFS_FILE):
+        fields += [''] * (2 - len(fields))
+        DRIVER_PREFS[key] = (fields[0].lower(), fields[1])
+    logging.debug(f'Loaded {len(IGNORED_DRIVERS)} ignored drivers, {len(IGNORED_RIDERS)} ignored riders and {len(DRIVER_PREFS)} driver preferences')
+
+
+def _snapshot_key() -> str:
+    """Returns what a compiled snapshot depends on besides the configuration files.
+    """
+    constants = [SNAPSHOT_VERSION, ARGS[PARAM_DAY], os.path.realpath(cfg_path('')), MAX_ROUTE_DIST, LOC_STEP_KM, ARG_DISTANCE_MAX, DEFAULT_SERVICES, PHONE_KEY_DIGITS, CAMPUS]
+    return hashlib.sha256(repr(constants).encode()).hexdigest()
+
+
+def _file_stat(path: str) -> tuple[int, int]:
+    return (os.stat(path).st_mtime_ns, os.stat(path).st_size) if os.path.isfile(path) else None
+
+
+def _file_hash(path: str) -> str:
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'rb') as config_file:
+        return hashlib.sha256(config_file.read()).hexdigest()
+
+
+def _load_snapshot() -> bool:
+    """Restores the configuration compiled by an earlier run, if it was compiled from the same files.
+    Files are compared by modification time and size, and by their hash when those changed.
+    """
+    path = data_path(CFG_SNAPSHOT_FILE.format(day=ARGS[PARAM_DAY]))
+    try:
+        with open(path, 'rb') as snapshot_file:
+            saved = pickle.load(snapshot_file)
+        if saved['key'] != _snapshot_key():
+            return False
+        stats = {file: _file_stat(cfg_path(file)) for file in CONFIG_FILES}
+        changed = [file for file in CONFIG_FILES if stats[file] != saved['stats'].get(file)]
+        if any(_file_hash(cfg_path(file)) != saved['hashes'].get(file) for file in changed):
+            return False
+        restore(saved['tables'])
+    except (OSError, pickle.UnpicklingError, EOFError, KeyError, TypeError, AttributeError):
+        return False
+
+    if len(changed) > 0:
+        # Only the modification times changed, so the next run can skip the hashes
+        _save_snapshot(saved['hashes'])
+    logging.debug(f'Loaded the configuration from {os.path.basename(path)}')
+    return True
+
+
+def _save_snapshot(hashes: dict[str, str] = None):
+    """Saves the configuration compiled by this run, with the files it was compiled from.
+    """
+    path = data_path(CFG_SNAPSHOT_FILE.format(day=ARGS[PARAM_DAY]))
+    if hashes is None:
+        hashes = {file: _file_hash(cfg_path(file)) for file in CONFIG_FILES}
+    stats = {file: _file_stat(cfg_path(file)) for file in CONFIG_FILES}
+    now = time.time_ns()
+    saved = {
+        'key': _snapshot_key(),
+        'stats': {file: None if stat is not None and stat[0] > now - RACY_NS else stat for (file, stat) in stats.items()},
+        'hashes': hashes,
+        'tables': snapshot(),
+    }
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'wb') as snapshot_file:
+            pickle.dump(saved, snapshot_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+    except OSError as e:
+        logging.debug(f'Could not save {os.path.basename(path)}: {e}')
 
 
 def init():
+    """Loads the configuration of the run, from the snapshot compiled by an earlier run if the files did not change.
+    """
+    if _load_snapshot():
+        return
+    reset()
     load_map()
-    create_pickles()
\ No newline at end of file
+    load_services()
+    load_people_tables()
+    _save_snapshot()
\ No newline at end of file
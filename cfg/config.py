@@ -5,6 +5,7 @@
 OUTPUT_DRIVER_NAME_HDR = 'Driver'
 OUTPUT_DRIVER_PHONE_HDR = 'Driver Phone #'
 OUTPUT_DRIVER_CAPACITY_HDR = 'Seats'
+OUTPUT_PICKUP_ORDER_HDR = 'Pickup #'
 
 DRIVER_TIMESTAMP_HDR = 'Timestamp'
 DRIVER_NAME_HDR = 'Name'
@@ -38,6 +39,9 @@ WEEKLY_RIDER_FRIDAY_HDR = 'Friday Night Bible Study (Friday @7pm) (Rides from Ca
 WEEKLY_RIDER_SUNDAY_HDR = 'Sunday Service '
 WEEKLY_RIDER_NOTES_HDR = 'Additional Comments / Questions / Concerns'
 
+PERMANENT_RIDER_HDRS = [PERMANENT_RIDER_TIMESTAMP_HDR, PERMANENT_RIDER_NAME_HDR, PERMANENT_RIDER_PHONE_HDR, PERMANENT_RIDER_LOCATION_HDR, PERMANENT_RIDER_FRIDAY_HDR, PERMANENT_RIDER_SUNDAY_HDR, PERMANENT_RIDER_NOTES_HDR]
+WEEKLY_RIDER_HDRS = [WEEKLY_RIDER_TIMESTAMP_HDR, WEEKLY_RIDER_NAME_HDR, WEEKLY_RIDER_PHONE_HDR, WEEKLY_RIDER_LOCATION_HDR, WEEKLY_RIDER_FRIDAY_HDR, WEEKLY_RIDER_SUNDAY_HDR, WEEKLY_RIDER_NOTES_HDR]
+
 
 ### For parsing the responses for attending the Friday/Sunday services
 PERMANENT_RIDE_THERE_KEYWORD = 'yes'
@@ -46,31 +50,55 @@ RIDE_THERE_KEYWORD = 'yes'
 DRIVER_FRIDAY_KEYWORD = 'College Life'
 DRIVER_SUNDAY_KEYWORD = 'Sunday'
 IGNORE_KEYWORD = 'ignore'
+TIMESTAMP_FORMAT = '%m/%d/%Y %H:%M:%S'  # Google Forms timestamps, other formats are inferred
 
 ### Temporaries for assignments
 DRIVER_OPENINGS_HDR = 'Open seats'
 DRIVER_ROUTE_HDR = 'Locations'
 TMP_DRIVER_PREF_LOC = 'Pref loc'
+TMP_DRIVER_PHONE = 'Phone key'
+TMP_RIDER_PHONE = 'Rider phone key'
+### Digits kept of a phone number key, enough for international numbers
+PHONE_KEY_DIGITS = 15
 DRIVER_GROUP_HDR = 'Group'
 RIDER_SERVICE_HDR = 'Preferred service'
 
-### File paths
+### File paths, the default directories can be overridden per run with PARAM_CFG_DIR and PARAM_DATA_DIR
 import os
 DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'pickle')
 CFG_PATH = os.path.dirname(os.path.realpath(__file__))
-MAP_FILE = os.path.join(CFG_PATH, 'map.txt')
-CAMPUS_FILE = os.path.join(CFG_PATH, 'campus.txt')
-IGNORE_DRIVERS_FILE = os.path.join(CFG_PATH, 'ignore_drivers.txt')
-IGNORE_RIDERS_FILE = os.path.join(CFG_PATH, 'ignore_riders.txt')
-DRIVER_PREFS_FILE = os.path.join(CFG_PATH, 'driver_preferences.csv')
-SERVICE_ACCT_FILE = os.path.join(CFG_PATH, 'service_account.json')
-SHEET_IDS_FILE = os.path.join(CFG_PATH, 'sheet_ids.json')
+MAP_FILE = 'map.txt'
+CAMPUS_FILE = 'campus.txt'
+EDGES_FILE = 'edges.txt'
+LOCATIONS_FILE = 'locations.csv'
+IGNORE_DRIVERS_FILE = 'ignore_drivers.txt'
+IGNORE_RIDERS_FILE = 'ignore_riders.txt'
+DRIVER_PREFS_FILE = 'driver_preferences.csv'
+SERVICES_FILE = 'services.txt'
+SERVICE_ACCT_FILE = 'service_account.json'
+SHEET_IDS_FILE = 'sheet_ids.json'
+PROFILE_FILE = 'profile.json'  # written to the data directory unless a path is given to --profile
+LOC_DIST_FILE = 'map_dist.npz' # all-pairs distances of the last map, written to the data directory
+LOC_ROUTES_FILE = 'map_routes.json' # pickup orders found for the last map, written to the data directory
+LOC_RESOLVED_FILE = 'locations_resolved.json' # map locations matched to answers not in the map, written to the data directory
+HISTORY_FILE = 'history.db' # drivers of every run, written to the data directory
+CFG_SNAPSHOT_FILE = 'config_{day}.pickle' # configuration compiled from the files below for a day, written to the data directory
+CONFIG_FILES = [MAP_FILE, CAMPUS_FILE, EDGES_FILE, LOCATIONS_FILE, SERVICES_FILE, IGNORE_DRIVERS_FILE, IGNORE_RIDERS_FILE, DRIVER_PREFS_FILE]
 
 ### Sheet ID keys
 PERMANENT_SHEET_KEY = 'permanent'
 WEEKLY_SHEET_KEY = 'weekly'
 DRIVER_SHEET_KEY = 'drivers'
 OUTPUT_SHEET_KEY = 'out'
+### Sheets the assignments are made from, a run stops if one of them could not be downloaded
+INPUT_SHEET_KEYS = [PERMANENT_SHEET_KEY, WEEKLY_SHEET_KEY, DRIVER_SHEET_KEY]
+
+### Timestamp column of each sheet that can be synced incrementally
+SYNC_TIMESTAMP_HDRS = {
+    PERMANENT_SHEET_KEY: PERMANENT_RIDER_TIMESTAMP_HDR,
+    WEEKLY_SHEET_KEY: WEEKLY_RIDER_TIMESTAMP_HDR,
+    DRIVER_SHEET_KEY: DRIVER_TIMESTAMP_HDR,
+}
 
 CAMPUS = 'Campus'
 
@@ -82,8 +110,18 @@ ARG_SUNDAY = 'sunday'
 PARAM_SERVICE = 'service'
 ARG_FIRST_SERVICE = '1'
 ARG_SECOND_SERVICE = '2'
+### Services of each day when services.txt does not list them, and the words in the notes that ask for them, in priority order.
+### On Friday the first service is the regular one, the others are late cars from campus.
+DEFAULT_SERVICES = {
+    ARG_FRIDAY: {ARG_FIRST_SERVICE: [], ARG_SECOND_SERVICE: ['late', '6', '7']},
+    ARG_SUNDAY: {ARG_FIRST_SERVICE: ['first', '1st', '8'], ARG_SECOND_SERVICE: ['second', '2nd', '10', '11']},
+}
+### Riders needed before the services are organized in parallel worker processes
+ORGANIZE_PARALLEL_MIN = 2000
 
 PARAM_ROTATE = 'rotate'
+### Date of the rides, recorded in the driver history
+PARAM_DATE = 'date'
 PARAM_JUST_WEEKLY = 'weekly'
 PARAM_UPLOAD = 'upload'
 PARAM_DOWNLOAD = 'download'
@@ -96,7 +134,45 @@ ARG_GROUP_SZ_MAX = 3
 
 PARAM_LOG = 'log'
 
-MAX_ROUTE_DIST = 40 # > map width
+PARAM_SYNC = 'sync'
+ARG_DELTA_SYNC = 'delta'
+ARG_FULL_SYNC = 'full'
+
+PARAM_REWRITE = 'rewrite'
+
+PARAM_INCREMENTAL = 'incremental'
+
+PARAM_PROFILE = 'profile'
+
+### How many sheets can be downloaded at once
+PARAM_CONNECTIONS = 'connections'
+DOWNLOAD_RETRIES = 3
+DOWNLOAD_BACKOFF = 1.0 # seconds before the first retry, doubles every retry
+
+PARAM_CFG_DIR = 'cfg_dir'
+PARAM_DATA_DIR = 'data_dir'
+
+PARAM_SOLVER = 'solver'
+ARG_GREEDY = 'greedy'
+ARG_OPTIMAL = 'optimal'
+### Seconds the optimal solver may spend improving on the greedy assignments
+PARAM_TIME_BUDGET = 'budget'
+
+### Columns of locations.csv, and the kilometers between pickup locations that count as one area apart
+LOCATIONS_HDRS = ['Location', 'Latitude', 'Longitude']
+LOC_STEP_KM = 1.0
+
+### Confidence from 0 to 1 needed to match a location answer to a map location, and the confidence of abbreviations
+LOC_MATCH_THRESHOLD = 0.75
+LOC_MATCH_ABBREVIATION = 0.9
+### Names with the most trigrams in common with an answer that are compared to it, and sets of matches kept on disk
+LOC_MATCH_CANDIDATES = 5
+LOC_RESOLVED_KEEP = 4
+
+### Cars with up to this many pickup locations get the shortest pickup order, larger ones a close one
+ROUTE_EXACT_MAX = 8
+
+MAX_ROUTE_DIST = 40 # cap of every distance, and the distance between areas that are not connected
 
 ### Route codes
 LOC_NONE = 0b0
@@ -104,4 +180,14 @@ LOC_NONE = 0b0
 ### Configuration lists to be filled in later.
 LOC_MAP = {
 }
-CAMPUS_LOCS = set()
\ No newline at end of file
+CAMPUS_LOCS = set()
+SERVICES = {}       # service of the day of the run => words in the notes that ask for it, in priority order
+IGNORED_DRIVERS = set() # (name, phone key) of the drivers in ignore_drivers.txt
+IGNORED_RIDERS = set()  # (name, phone key) of the riders in ignore_riders.txt
+DRIVER_PREFS = {}       # phone key => (location, service) of the drivers in driver_preferences.csv, '' if not given
+
+### Location tables built by load_map
+LOC_INDEX = {}      # route code => indices of the map areas it covers
+LOC_NEIGHBORS = {}  # route code => route codes of the areas exactly dist away, indexed by dist
+LOC_DIST = []       # all-pairs shortest path distances between map areas
+LOC_ROUTES = {}     # sorted route codes of a car => the codes in pickup order
\ No newline at end of file
@@ -3,7 +3,10 @@ Includes group optimization for common pickup locations.
 """
 
 from cfg.config import *
+import lib.optimal as opt
 import lib.setup as setup
+import logging
+import numpy as np
 import pandas as pd
 
 
@@ -90,148 +93,300 @@ def assign(drivers_df: pd.DataFrame, riders_df: pd.DataFrame) -> pd.DataFrame:
 
 def assign_v2(drivers_df: pd.DataFrame, riders_df: pd.DataFrame, rider_map: dict[int, list[int]]) -> pd.DataFrame:
     """Assigns rider to drivers in the returned dataframe, uses a secondary map to help optimize assignments.
+
+    The driver state is loaded once into a _DriverState, every phase runs against its arrays,
+    and the assignments are written back to the output in one step.
+    """
+    out = pd.concat([pd.DataFrame(columns=[OUTPUT_DRIVER_NAME_HDR, OUTPUT_DRIVER_PHONE_HDR, OUTPUT_DRIVER_CAPACITY_HDR, DRIVER_GROUP_HDR]), riders_df[[RIDER_NAME_HDR, RIDER_PHONE_HDR, RIDER_LOCATION_HDR, RIDER_NOTES_HDR]]], axis='columns')
+    drivers = _DriverState(drivers_df, out)
+    _assign_greedy(drivers, rider_map)
+    drivers.write_back(drivers_df, out)
+    return out
+
+
+def assign_optimal(drivers_df: pd.DataFrame, riders_df: pd.DataFrame, rider_map: dict[int, list[int]]) -> pd.DataFrame:
+    """Assigns rider to drivers in the returned dataframe by solving a min-cost flow, seeded with the assign_v2 result.
     """
     out = pd.concat([pd.DataFrame(columns=[OUTPUT_DRIVER_NAME_HDR, OUTPUT_DRIVER_PHONE_HDR, OUTPUT_DRIVER_CAPACITY_HDR, DRIVER_GROUP_HDR]), riders_df[[RIDER_NAME_HDR, RIDER_PHONE_HDR, RIDER_LOCATION_HDR, RIDER_NOTES_HDR]]], axis='columns')
+    greedy = _DriverState(drivers_df, out)
+    _assign_greedy(greedy, {loc: list(riders) for loc, riders in rider_map.items()})
+
+    rider_groups = {loc: [greedy.rider_pos[r_idx] for r_idx in riders] for loc, riders in rider_map.items()}
+    assigned = opt.solve(drivers_df, rider_groups, greedy.assigned)
+
+    drivers = _DriverState(drivers_df, out)
+    for r_idx in out.index:
+        d = assigned[drivers.rider_pos[r_idx]]
+        if d >= 0:
+            drivers.add_rider(r_idx, d)
+    drivers.write_back(drivers_df, out)
+    return out
+
+
+def patch_assignments(drivers_df: pd.DataFrame, riders_df: pd.DataFrame, rider_map: dict[int, list[int]], prev_groups: dict[int, int]) -> pd.DataFrame:
+    """Assigns riders to drivers by patching the previous grouping, which maps rider phone keys to driver phone keys.
 
+    Riders keep their previous driver while that driver is still available and has a seat. Only the other riders go through
+    the assign_v2 phases, into the cars already in use plus as many of the remaining drivers as their count needs.
+    This keeps cars stable, but every rider and driver is still prepared, so it is not faster than a full run.
+    Returns None if a rider could not be placed while some drivers were left out.
+    """
+    prev_drivers = riders_df[TMP_RIDER_PHONE].map(prev_groups)
+    is_used = drivers_df[TMP_DRIVER_PHONE].isin(set(prev_drivers.dropna())).to_numpy()
+    used = drivers_df[is_used]
+    extra = setup.fetch_necessary_drivers(drivers_df[~is_used], max(len(riders_df.index) - int(used[DRIVER_CAPACITY_HDR].sum()), 0))
+    is_short = len(used.index) + len(extra.index) == len(drivers_df.index)
+    drivers_df = pd.concat([used, extra]).sort_values(by=DRIVER_CAPACITY_HDR, ascending=False, kind='stable')
+
+    out = pd.concat([pd.DataFrame(columns=[OUTPUT_DRIVER_NAME_HDR, OUTPUT_DRIVER_PHONE_HDR, OUTPUT_DRIVER_CAPACITY_HDR, DRIVER_GROUP_HDR]), riders_df[[RIDER_NAME_HDR, RIDER_PHONE_HDR, RIDER_LOCATION_HDR, RIDER_NOTES_HDR]]], axis='columns')
+    drivers = _DriverState(drivers_df, out)
+    driver_pos = {phone: d for d, phone in enumerate(drivers_df[TMP_DRIVER_PHONE])}
+    kept = set()
+    for r_idx, prev_driver in zip(riders_df.index, prev_drivers):
+        d = driver_pos.get(prev_driver, -1)
+        if d >= 0 and drivers.has_opening(d):
+            drivers.add_rider(r_idx, d)
+            kept.add(r_idx)
+
+    rider_map = {loc: [r_idx for r_idx in riders if r_idx not in kept] for loc, riders in rider_map.items()}
+    _assign_greedy(drivers, rider_map)
+    # Every car is full when riders are left, so reassigning helps only if there are drivers left too
+    if (drivers.assigned < 0).any() and not is_short:
+        return None
+
+    drivers.write_back(drivers_df, out)
+    logging.info(f'Kept {len(kept)} riders in their previous cars, placed {int((drivers.assigned >= 0).sum()) - len(kept)} more')
+    return out
+
+
+def _assign_greedy(drivers: '_DriverState', rider_map: dict[int, list[int]]):
+    """Runs every phase of the greedy assignment, popping assigned riders from the rider map.
+    """
     # Assign drivers with preferences first
-    for d_idx in drivers_df.index:
-        loc = drivers_df.at[d_idx, TMP_DRIVER_PREF_LOC]
+    for d in range(drivers.size):
+        loc = int(drivers.pref_loc[d])
         if loc == LOC_NONE or rider_map.get(loc, []) == []:
             continue
 
-        while _has_opening(drivers_df, d_idx) and len(rider_map[loc]) > 0:
-            r_idx = rider_map[loc].pop()
-            _add_rider(out, r_idx, drivers_df, d_idx)
+        while drivers.has_opening(d) and len(rider_map[loc]) > 0:
+            drivers.add_rider(rider_map[loc].pop(), d)
 
     # Assign cars that are partly full where leftover capacity matches location
     for dist in range(1, ARGS[PARAM_DISTANCE]):
-        for d_idx in drivers_df.index:
-            if not _is_unused(drivers_df, d_idx):
+        for d in range(drivers.size):
+            if not drivers.is_unused(d):
                 continue
-            if not _has_opening(drivers_df, d_idx):
+            if not drivers.has_opening(d):
                 continue
 
             for loc in rider_map:
-                is_matched = False
-                if _is_nearby_dist(drivers_df, d_idx, loc, dist) and _is_matching(drivers_df, d_idx, rider_map[loc]):
+                if drivers.is_nearby_dist(d, loc, dist) and drivers.is_matching(d, rider_map[loc]):
                     # Assign perfect match
-                    is_matched = True
                     while len(rider_map[loc]) > 0:
-                        r_idx = rider_map[loc].pop()
-                        _add_rider(out, r_idx, drivers_df, d_idx)
-                if is_matched:
+                        drivers.add_rider(rider_map[loc].pop(), d)
                     break
 
     # Assign cars that are empty where capacity matches location
-    for d_idx in drivers_df.index:
-        if not _is_unused(drivers_df, d_idx):
-            continue
-        
-        # Find match with empty car
-        for loc in rider_map:
-            is_matched = False
-            if _is_matching(drivers_df, d_idx, rider_map[loc]):
-                # Assign perfect match
-                is_matched = True
-                while len(rider_map[loc]) > 0:
-                    r_idx = rider_map[loc].pop()
-                    _add_rider(out, r_idx, drivers_df, d_idx)
-            if is_matched:
-                break
+    _assign_empty_matches(drivers, rider_map)
 
     # Assign at locations that are greater than capacity, as long as leftover is greater than OVERFLOW_BOUND
     # Essentially, splits up riders in a single location among multiple cars
     MIN_GROUP_SZ = 2
-    for d_idx in drivers_df.index:
-        if not _has_opening(drivers_df, d_idx):
+    for d in range(drivers.size):
+        if not drivers.has_opening(d):
             continue
 
         for loc in rider_map:
-            is_matched = False
-            if len(rider_map[loc]) - drivers_df.at[d_idx, DRIVER_OPENINGS_HDR] >= MIN_GROUP_SZ:
+            if len(rider_map[loc]) - drivers.openings[d] >= MIN_GROUP_SZ:
                 # Fill up car
-                is_matched = True
-                while len(rider_map[loc]) > 0 and _has_opening(drivers_df, d_idx):
-                    r_idx = rider_map[loc].pop()
-                    _add_rider(out, r_idx, drivers_df, d_idx)
-            if is_matched:
+                while len(rider_map[loc]) > 0 and drivers.has_opening(d):
+                    drivers.add_rider(rider_map[loc].pop(), d)
                 break
 
     # Assign cars that are empty where capacity matches location (step 3)
-    for d_idx in drivers_df.index:
-        if not _is_unused(drivers_df, d_idx):
-            continue
-        
-        # Find match with empty car
-        for loc in rider_map:
-            is_matched = False
-            if _is_matching(drivers_df, d_idx, rider_map[loc]):
-                # Assign perfect match
-                is_matched = True
-                while len(rider_map[loc]) > 0:
-                    r_idx = rider_map[loc].pop()
-                    _add_rider(out, r_idx, drivers_df, d_idx)
-            if is_matched:
-                break
+    _assign_empty_matches(drivers, rider_map)
 
     # Assign at locations within dist
-    for d_idx in drivers_df.index:
-        if _is_unused(drivers_df, d_idx):
+    for d in range(drivers.size):
+        if drivers.is_unused(d):
             for loc in rider_map:
-                is_matched = False
                 if len(rider_map[loc]) > 0:
-                    is_matched = True
-                    while len(rider_map[loc]) > 0 and _has_opening(drivers_df, d_idx):
-                        r_idx = rider_map[loc].pop()
-                        _add_rider(out, r_idx, drivers_df, d_idx)
-                if is_matched:
+                    while len(rider_map[loc]) > 0 and drivers.has_opening(d):
+                        drivers.add_rider(rider_map[loc].pop(), d)
                     break
 
         for dist in range(0, ARGS[PARAM_DISTANCE] + 1):
-            if not _has_opening(drivers_df, d_idx):
+            if not drivers.has_opening(d):
                 break
 
             for loc in rider_map:
                 if len(rider_map[loc]) == 0:
                     continue
 
-                oflow = len(rider_map[loc]) - drivers_df.at[d_idx, DRIVER_OPENINGS_HDR]
-                if _is_nearby_dist(drivers_df, d_idx, loc, dist) and (oflow >= MIN_GROUP_SZ or oflow <= 0):
-                    while len(rider_map[loc]) > 0 and _has_opening(drivers_df, d_idx):
-                        r_idx = rider_map[loc].pop()
-                        _add_rider(out, r_idx, drivers_df, d_idx)
-                
-                if not _has_opening(drivers_df, d_idx):
+                oflow = len(rider_map[loc]) - drivers.openings[d]
+                if drivers.is_nearby_dist(d, loc, dist) and (oflow >= MIN_GROUP_SZ or oflow <= 0):
+                    while len(rider_map[loc]) > 0 and drivers.has_opening(d):
+                        drivers.add_rider(rider_map[loc].pop(), d)
+
+                if not drivers.has_opening(d):
                     break
 
     # Assign remaining riders, last resort
     for loc in rider_map:
         for r_idx in rider_map[loc]:
             # Find any driver with space and with the lightest route.
-            open_driver_idx = -1
-            open_driver_found = False
-            cost = 100 # arbitrarily high, but > MAP_WIDTH + 10 is good
-            for d_idx in drivers_df.index:
-                if _has_opening(drivers_df, d_idx):
-                    new_cost = _route_cost(drivers_df.at[d_idx, DRIVER_ROUTE_HDR], loc)
-                    if not open_driver_found or (new_cost < cost):
-                        open_driver_found = True
-                        open_driver_idx = d_idx
-                        cost = new_cost
-            if open_driver_found:
-                _add_rider(out, r_idx, drivers_df, open_driver_idx)
-                is_matched = True
-    
-    return out
+            d = drivers.find_cheapest_route(loc)
+            if d >= 0:
+                drivers.add_rider(r_idx, d)
+
 
+def _assign_empty_matches(drivers: '_DriverState', rider_map: dict[int, list[int]]):
+    """Fills empty cars with every rider at the first location whose rider count matches the open seats.
+    """
+    for d in range(drivers.size):
+        if not drivers.is_unused(d):
+            continue
+
+        # Find match with empty car
+        for loc in rider_map:
+            if drivers.is_matching(d, rider_map[loc]):
+                # Assign perfect match
+                while len(rider_map[loc]) > 0:
+                    drivers.add_rider(rider_map[loc].pop(), d)
+                break
 
-def organize(drivers_df: pd.DataFrame, riders_df: pd.DataFrame) -> pd.DataFrame:
+
+class _DriverState:
+    """Array-backed driver state used by assign_v2.
+
+    Drivers are addressed by position in the drivers dataframe, riders are addressed by their index label in the output.
+    Routes are kept as Python ints, so maps can have any number of areas.
+    """
+
+    def __init__(self, drivers_df: pd.DataFrame, out: pd.DataFrame):
+        self.size = len(drivers_df.index)
+        self.openings = drivers_df[DRIVER_OPENINGS_HDR].to_numpy(dtype=np.int64, copy=True)
+        self.route = drivers_df[DRIVER_ROUTE_HDR].to_numpy(dtype=object, copy=True)
+        self.pref_loc = drivers_df[TMP_DRIVER_PREF_LOC].to_numpy(dtype=object, copy=True)
+        self.capacity = drivers_df[DRIVER_CAPACITY_HDR].to_numpy(copy=True)
+        self.group = drivers_df[DRIVER_GROUP_HDR].to_numpy(dtype=object, copy=True)
+
+        # Route length and distance from each route to every map area, kept up to date by add_rider
+        width = len(LOC_DIST)
+        self.loc_dist = np.array(LOC_DIST, dtype=np.int64).reshape(width, width)
+        self.reach = {}
+        self.route_len = np.zeros(self.size, dtype=np.int64)
+        self.route_dist = np.full((self.size, width), MAX_ROUTE_DIST, dtype=np.int64)
+        for d in np.flatnonzero(self.route):
+            self._extend_route(d, int(self.route[d]))
+
+        self.rider_pos = {r_idx: pos for pos, r_idx in enumerate(out.index)}
+        self.rider_loc = [LOC_MAP.get(loc.strip().lower(), LOC_NONE) for loc in out[RIDER_LOCATION_HDR]]
+        self.assigned = np.full(len(out.index), -1, dtype=np.int64)
+
+    def add_rider(self, r_idx: int, d: int):
+        """Assigns rider to driver and updates driver openings and locations.
+        """
+        pos = self.rider_pos[r_idx]
+        self.assigned[pos] = d
+        self.openings[d] -= 1
+        self._extend_route(d, self.rider_loc[pos])
+
+    def _extend_route(self, d: int, rider_loc: int):
+        new_areas = rider_loc & ~int(self.route[d])
+        if new_areas == LOC_NONE:
+            return
+        self.route[d] |= rider_loc
+        self.route_len[d] += _route_len(new_areas)
+        np.minimum(self.route_dist[d], self._reach(rider_loc), out=self.route_dist[d])
+
+    def _reach(self, loc: int) -> np.ndarray:
+        """Returns the distance from a location to every map area.
+        """
+        if loc not in self.reach:
+            areas = LOC_INDEX.get(loc, [])
+            if len(areas) > 0:
+                self.reach[loc] = self.loc_dist[areas].min(axis=0)
+            else:
+                self.reach[loc] = np.full(len(self.loc_dist), MAX_ROUTE_DIST, dtype=np.int64)
+        return self.reach[loc]
+
+    def has_opening(self, d: int) -> bool:
+        """Checks if driver has space to take a rider.
+        """
+        return self.openings[d] > 0
+
+    def is_unused(self, d: int) -> bool:
+        """Checks if driver has no riders yet.
+        """
+        return self.route[d] == 0
+
+    def is_matching(self, d: int, riders: list[int]) -> bool:
+        """Checks if the spaces in a car matches the number of riders at a location.
+        """
+        return self.openings[d] == len(riders)
+
+    def is_intersecting(self, d: int, rider_loc: int) -> bool:
+        """Checks if a driver route intersects with a rider's location.
+        """
+        return (int(self.route[d]) & rider_loc) != 0
+
+    def is_nearby_dist(self, d: int, rider_loc: int, dist: int) -> bool:
+        """Checks if driver has an opening and is picking up dist areas away from the rider.
+        """
+        return self.has_opening(d) and self.is_intersecting(d, _neighbors(rider_loc, dist))
+
+    def find_cheapest_route(self, new_loc: int) -> int:
+        """Returns the first driver with an opening whose route is the cheapest to extend to new_loc, or -1 if all cars are full.
+        """
+        open_drivers = np.flatnonzero(self.openings > 0)
+        if len(open_drivers) == 0:
+            return -1
+        areas = LOC_INDEX.get(new_loc, [])
+        if len(areas) > 0:
+            dist = np.minimum(self.route_dist[np.ix_(open_drivers, areas)].min(axis=1), MAX_ROUTE_DIST)
+        else:
+            dist = MAX_ROUTE_DIST
+        cost = self.route_len[open_drivers] + dist
+        return int(open_drivers[np.argmin(cost)])
+
+    def write_back(self, drivers_df: pd.DataFrame, out: pd.DataFrame):
+        """Writes the assignments to the output and the driver state to the drivers dataframe in bulk.
+        """
+        is_assigned = self.assigned >= 0
+        d = self.assigned[is_assigned]
+        driver_cols = {
+            OUTPUT_DRIVER_NAME_HDR:     drivers_df[DRIVER_NAME_HDR].to_numpy(dtype=object),
+            OUTPUT_DRIVER_PHONE_HDR:    drivers_df[DRIVER_PHONE_HDR].to_numpy(dtype=object),
+            OUTPUT_DRIVER_CAPACITY_HDR: self.capacity.astype(str).astype(object),
+            DRIVER_GROUP_HDR:           self.group,
+        }
+        for hdr, values in driver_cols.items():
+            col = out[hdr].to_numpy(dtype=object, copy=True)
+            col[is_assigned] = values[d]
+            out[hdr] = col
+
+        drivers_df[DRIVER_OPENINGS_HDR] = self.openings
+        drivers_df[DRIVER_ROUTE_HDR] = self.route
+
+
+def organize(drivers_df: pd.DataFrame, riders_df: pd.DataFrame, prev_groups: dict[int, int] = None) -> pd.DataFrame:
     setup.add_assignment_vars(drivers_df)
     setup.prioritize_drivers_with_preferences(drivers_df, riders_df)
     rider_map = setup.create_rider_map(riders_df)
+    if prev_groups is not None:
+        if ARGS[PARAM_SOLVER] == ARG_OPTIMAL:
+            logging.warning('New riders of incremental runs are placed by the greedy phases, the optimal solver is only used if everyone is reassigned')
+        out = patch_assignments(drivers_df, riders_df, {loc: list(riders) for loc, riders in rider_map.items()}, prev_groups)
+        if out is not None:
+            return out
+        logging.info('Some riders could not be placed in the previous groups, reassigning everyone')
     drivers = setup.fetch_necessary_drivers(drivers_df, len(riders_df))
     # out = assign(drivers, riders_df)
-    out = assign_v2(drivers, riders_df, rider_map)
+    if ARGS[PARAM_SOLVER] == ARG_OPTIMAL:
+        out = assign_optimal(drivers, riders_df, rider_map)
+    else:
+        out = assign_v2(drivers, riders_df, rider_map)
     return out
 
 
@@ -250,7 +405,14 @@ def _add_rider(out: pd.DataFrame, r_idx: int, drivers_df: pd.DataFrame, d_idx: i
 def _is_nearby_dist(drivers_df: pd.DataFrame, d_idx: int, rider_loc: int, dist: int) -> bool:
     """Checks if driver has no assignments or is already picking up at the same area as the rider.
     """
-    return _has_opening(drivers_df, d_idx) and (_is_intersecting(drivers_df, d_idx, rider_loc << dist) or _is_intersecting(drivers_df, d_idx, rider_loc >> dist))
+    return _has_opening(drivers_df, d_idx) and _is_intersecting(drivers_df, d_idx, _neighbors(rider_loc, dist))
+
+
+def _neighbors(loc: int, dist: int) -> int:
+    """Returns the route code of the areas exactly dist away from a location.
+    """
+    rings = LOC_NEIGHBORS.get(loc, [])
+    return rings[dist] if dist < len(rings) else LOC_NONE
 
 
 def _is_there(drivers_df: pd.DataFrame, d_idx: int, rider_loc: int) -> bool:
@@ -300,17 +462,12 @@ def _route_dist(route: int, new_loc: int) -> int:
     # force cast numpy.int64 => int
     route = int(route)
 
-    for dist in range(0, MAX_ROUTE_DIST):
-        tmp = (new_loc << dist) | (new_loc >> dist)
-        if (route & tmp) != 0:
+    for dist, ring in enumerate(LOC_NEIGHBORS.get(new_loc, [])[:MAX_ROUTE_DIST]):
+        if (route & ring) != 0:
             return dist
     return MAX_ROUTE_DIST
 
 def _route_len(route: int) -> int:
     """Returns the number of locations a driver is picking up from.
     """
-    cnt = 0
-    while route != 0:
-        route &= route - 1
-        cnt += 1
-    return cnt
\ No newline at end of file
+    return bin(route).count('1')
@@ -0,0 +1,123 @@
+"""Implements the local cache of the sheets data.
+Each key is stored as a directory with one typed .npy file per column, which is memory-mapped on load.
+Text columns are dictionary-encoded: the codes are memory-mapped, and each distinct value is decoded once from a UTF-8 buffer.
+"""
+
+import cfg
+from cfg.config import *
+import json
+import logging
+import numpy as np
+import os
+import pandas as pd
+import pickle
+import shutil
+
+CACHE_KEYS = [PERMANENT_SHEET_KEY, WEEKLY_SHEET_KEY, DRIVER_SHEET_KEY, OUTPUT_SHEET_KEY]
+MANIFEST_FILE = 'columns.json'
+INDEX_FILE = 'index.npy'
+
+### How a column is stored
+KIND_VALUES = 'values'  # numbers, booleans and datetimes, stored as is
+KIND_STRINGS = 'strings'  # everything else, stored as codes into the distinct values, which are offsets into a UTF-8 buffer
+KIND_TEXT = 'text'      # fixed width strings with a mask of the missing cells, written by older versions
+
+
+def init():
+    """Creates the cache for every key, migrating caches pickled by older versions.
+    """
+    os.makedirs(cfg.data_path(''), exist_ok=True)
+    for key in CACHE_KEYS:
+        if os.path.isfile(cfg.data_path(key)):
+            _migrate(key)
+        if not os.path.isdir(cfg.data_path(key)):
+            write(key, pd.DataFrame())
+
+
+def write(key: str, df: pd.DataFrame):
+    """Replaces the cache of the key with the given dataframe.
+    """
+    path = cfg.data_path(key)
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    columns = []
+    for pos, name in enumerate(df.columns):
+        col = df[name]
+        file = f'{pos}.npy'
+        if _is_stored_as_values(col):
+            np.save(os.path.join(tmp_path, file), col.to_numpy())
+            columns.append({'name': name, 'file': file, 'kind': KIND_VALUES})
+        else:
+            (codes, uniques) = pd.factorize(col.where(col.isna(), col.astype(str)))
+            encoded = [val.encode() for val in uniques]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum([len(val) for val in encoded])
+            (buffer_file, offsets_file) = (f'{pos}.utf8.npy', f'{pos}.offsets.npy')
+            np.save(os.path.join(tmp_path, file), codes.astype(np.int32))
+            np.save(os.path.join(tmp_path, buffer_file), np.frombuffer(b''.join(encoded), dtype=np.uint8))
+            np.save(os.path.join(tmp_path, offsets_file), offsets)
+            columns.append({'name': name, 'file': file, 'kind': KIND_STRINGS, 'buffer': buffer_file, 'offsets': offsets_file})
+
+    has_index = not df.index.equals(pd.RangeIndex(len(df.index)))
+    if has_index:
+        np.save(os.path.join(tmp_path, INDEX_FILE), df.index.to_numpy())
+    with open(os.path.join(tmp_path, MANIFEST_FILE), 'w') as manifest:
+        json.dump({'rows': len(df.index), 'columns': columns, 'index': has_index}, manifest)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+
+def read(key: str, columns: list[str] = None) -> pd.DataFrame:
+    """Returns the cached dataframe of the key. If columns are given, only the ones that exist are loaded.
+    """
+    path = cfg.data_path(key)
+    with open(os.path.join(path, MANIFEST_FILE)) as manifest:
+        meta = json.load(manifest)
+
+    # Empty files cannot be memory-mapped, and copy on write keeps the cache intact when a frame is changed in place
+    mmap_mode = 'c' if meta['rows'] > 0 else None
+
+    data = {}
+    for col in meta['columns']:
+        if columns is not None and col['name'] not in columns:
+            continue
+        values = np.load(os.path.join(path, col['file']), mmap_mode=mmap_mode)
+        if col['kind'] == KIND_STRINGS:
+            values = _decode(values, np.load(os.path.join(path, col['buffer'])), np.load(os.path.join(path, col['offsets'])))
+        elif col['kind'] == KIND_TEXT:
+            values = values.astype(object)
+            if col['missing'] is not None:
+                values[np.load(os.path.join(path, col['missing']))] = np.nan
+        data[col['name']] = values
+
+    index = np.load(os.path.join(path, INDEX_FILE)) if meta['index'] else None
+    if len(data) == 0:
+        return pd.DataFrame(index=index)
+    return pd.DataFrame(data, index=index, copy=False)
+
+
+def _decode(codes: np.ndarray, buffer: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Returns the text of every code, sharing one string per distinct value, with NaN for the missing cells.
+    """
+    raw = buffer.tobytes()
+    # Missing cells have the code -1, which picks the NaN at the end
+    uniques = np.array([raw[start:end].decode() for (start, end) in zip(offsets[:-1].tolist(), offsets[1:].tolist())] + [np.nan], dtype=object)
+    return uniques[codes]
+
+
+def _is_stored_as_values(col: pd.Series) -> bool:
+    return pd.api.types.is_numeric_dtype(col.dtype) or pd.api.types.is_bool_dtype(col.dtype) or pd.api.types.is_datetime64_dtype(col.dtype)
+
+
+def _migrate(key: str):
+    """Converts a pickle cache of records or of a dataframe into the columnar cache.
+    """
+    path = cfg.data_path(key)
+    with open(path, 'rb') as pickle_file:
+        df = pd.DataFrame(pickle.load(pickle_file))
+    os.remove(path)
+    write(key, df)
+    logging.info(f'Migrated {key} cache with {len(df.index)} rows')
@@ -32,6 +32,10 @@ def init():
     logger = logging.getLogger()
     logger.setLevel(lvl)
 
+    # Replace the handler of a previous run in this process
+    for handler in [h for h in logger.handlers if isinstance(h.formatter, CustomFormatter)]:
+        logger.removeHandler(handler)
+
     ch = logging.StreamHandler()
     ch.setLevel(lvl)
     ch.setFormatter(CustomFormatter())
@@ -0,0 +1,133 @@
+"""Implements an offline stand-in for the Google Sheets client and worksheets used by rides_data.
+The fake counts the requests it serves and the cells it returns or writes, and can simulate network latency and failures,
+so download strategies can be compared without the API.
+"""
+
+from gspread.utils import a1_range_to_grid_range, numericise_all
+import threading
+import time
+
+
+class FakeClient:
+    """Stand-in for gspread.Client, serving one worksheet per sheet ID.
+    """
+
+    def __init__(self, sheets: dict[str, 'FakeWorksheet'], latency: float = 0.0):
+        self.sheets = sheets
+        self.latency = latency
+
+    def open_by_key(self, sheet_id: str) -> 'FakeSpreadsheet':
+        time.sleep(self.latency)
+        return FakeSpreadsheet(self.sheets[sheet_id])
+
+
+class FakeSpreadsheet:
+
+    def __init__(self, ws: 'FakeWorksheet'):
+        self.ws = ws
+
+    def get_worksheet(self, index: int) -> 'FakeWorksheet':
+        return self.ws
+
+
+class FakeWorksheet:
+    """In-memory worksheet holding formatted cell values, with the header in the first row.
+    Every request waits for the latency, and the first failures requests raise ConnectionError.
+    """
+
+    def __init__(self, values: list[list], latency: float = 0.0, failures: int = 0):
+        self.values = [[str(val) for val in row] for row in values]
+        self.latency = latency
+        self.failures = failures
+        self.requests = 0
+        self.cells_read = 0
+        self.cells_written = 0
+        self.lock = threading.Lock()
+
+    def _request(self):
+        with self.lock:
+            self.requests += 1
+            failing = self.failures > 0
+            self.failures -= 1 if failing else 0
+        time.sleep(self.latency)
+        if failing:
+            raise ConnectionError('simulated connection failure')
+
+    def get_all_values(self) -> list[list[str]]:
+        self._request()
+        values = _trim(self.values)
+        width = max([len(row) for row in values], default=0)
+        values = [row + [''] * (width - len(row)) for row in values]
+        self.cells_read += sum(len(row) for row in values)
+        return values
+
+    def get_all_records(self) -> list[dict]:
+        values = self.get_all_values()
+        if len(values) == 0:
+            return []
+        return [dict(zip(values[0], numericise_all(row))) for row in values[1:]]
+
+    def row_values(self, row: int) -> list[str]:
+        return self.batch_get([f'{row}:{row}'])[0][0]
+
+    def batch_get(self, ranges: list[str]) -> list[list[list[str]]]:
+        """Returns the values of each range, dropping trailing empty rows and cells like the Sheets API.
+        """
+        self._request()
+        result = []
+        for name in ranges:
+            grid = a1_range_to_grid_range(name)
+            row_start = grid.get('startRowIndex', 0)
+            row_end = grid.get('endRowIndex', len(self.values))
+            col_start = grid.get('startColumnIndex', 0)
+            col_end = grid.get('endColumnIndex', None)
+            block = _trim([row[col_start:col_end] for row in self.values[row_start:row_end]])
+            self.cells_read += sum(len(row) for row in block)
+            result.append(block)
+        return result
+
+    def resize(self, rows: int):
+        self._request()
+        self.values = self.values[:rows] + [[] for _ in range(rows - len(self.values))]
+
+    def update(self, values: list[list], range_name: str = 'A1'):
+        self._request()
+        self._write(range_name, values)
+
+    def batch_update(self, data: list[dict]):
+        self._request()
+        for block in data:
+            self._write(block['range'], block['values'])
+
+    def _write(self, range_name: str, values: list[list]):
+        grid = a1_range_to_grid_range(range_name)
+        row_start = grid.get('startRowIndex', 0)
+        col_start = grid.get('startColumnIndex', 0)
+        for r, row in enumerate(values):
+            while len(self.values) <= row_start + r:
+                self.values.append([])
+            cells = self.values[row_start + r]
+            cells.extend([''] * (col_start + len(row) - len(cells)))
+            cells[col_start:col_start + len(row)] = ['' if val is None or val != val else str(val) for val in row]
+            self.cells_written += len(row)
+
+    def update_row(self, row: int, values: list):
+        """Overwrites a row of the sheet, 1-indexed like the Sheets API, appending rows as needed.
+        """
+        while len(self.values) < row:
+            self.values.append([])
+        self.values[row - 1] = [str(val) for val in values]
+
+
+def _trim(rows: list[list[str]]) -> list[list[str]]:
+    rows = [_trim_row(row) for row in rows]
+    while len(rows) > 0 and len(rows[-1]) == 0:
+        rows.pop()
+    return rows
+
+
+def _trim_row(row: list[str]) -> list[str]:
+    end = len(row)
+    while end > 0 and row[end - 1] == '':
+        end -= 1
+    return row[:end]
@@ -1,43 +1,97 @@
 """Contains complex operations directly associated with what the user wants to accomplish.
 """
 
+import cfg
 from cfg.config import *
+from concurrent.futures import ProcessPoolExecutor
+import itertools
 import lib.assignments as core
+import lib.history as history
+import lib.profiling as profiling
+import lib.resolver as resolver
 import lib.rides_data as data
 import lib.setup as setup
 import lib.trace as trace
+import logging
 import pandas as pd
 
 
+@profiling.profiled('rotate drivers')
 def rotate_drivers(drivers_df: pd.DataFrame):
     setup.mark_unused_drivers(drivers_df)
     drivers_df.sort_values(by=DRIVER_TIMESTAMP_HDR, inplace=True, ascending=False)
     data.update_drivers_locally(drivers_df)
 
 
+@profiling.profiled('assign sunday')
 def assign_sunday(drivers_df: pd.DataFrame, riders_df: pd.DataFrame) -> pd.DataFrame:
     """Assigns Sunday rides.
     """
-    (drivers, riders) = setup.filter_sunday(drivers_df, riders_df)
-    (drivers1, riders1, drivers2, riders2) = setup.split_sunday_services(drivers, riders)
+    with profiling.stage('filter') as stage:
+        resolver.resolve_locations(pd.concat([riders_df[RIDER_LOCATION_HDR], drivers_df[DRIVER_PREF_LOC_HDR], pd.Series([loc for (loc, _) in DRIVER_PREFS.values()], dtype=object)]))
+        (drivers, riders) = setup.filter_sunday(drivers_df, riders_df)
+        groups = setup.split_sunday_services(drivers, riders)
+        stage.rows = [len(drivers.index), len(riders.index)]
 
-    assignments1 = core.organize(drivers1, riders1)
-    assignments2 = core.organize(drivers2, riders2)
-    out = pd.concat([assignments1, assignments2])
+    out = _organize_services(groups, _get_prev_groups())
     trace.info_unassigned_riders(out)
     trace.info_unused_drivers(out, drivers)
     return out
 
 
+@profiling.profiled('assign friday')
 def assign_friday(drivers_df: pd.DataFrame, riders_df: pd.DataFrame) -> pd.DataFrame:
     """Assigns Friday rides.
     """
-    (drivers, riders) = setup.filter_friday(drivers_df, riders_df)
-    (drivers1, riders1, drivers2, riders2) = setup.split_friday_late_cars(drivers, riders)
+    with profiling.stage('filter') as stage:
+        resolver.resolve_locations(pd.concat([riders_df[RIDER_LOCATION_HDR], drivers_df[DRIVER_PREF_LOC_HDR], pd.Series([loc for (loc, _) in DRIVER_PREFS.values()], dtype=object)]))
+        (drivers, riders) = setup.filter_friday(drivers_df, riders_df)
+        groups = setup.split_friday_late_cars(drivers, riders)
+        stage.rows = [len(drivers.index), len(riders.index)]
 
-    assignments1 = core.organize(drivers1, riders1)
-    assignments2 = core.organize(drivers2, riders2)
-    out = pd.concat([assignments1, assignments2])
+    out = _organize_services(groups, _get_prev_groups())
     trace.info_unassigned_riders(out)
     trace.info_unused_drivers(out, drivers)
-    return out
\ No newline at end of file
+    return out
+
+
+def _organize_services(groups: dict[str, tuple[pd.DataFrame, pd.DataFrame]], prev_groups: dict[int, int]) -> pd.DataFrame:
+    """Organizes the drivers and riders of every service, and merges the assignments with the service in the group column.
+    Large runs with several services organize each service in its own worker process.
+    """
+    cnt_riders = sum(len(riders.index) for (_, riders) in groups.values())
+    if len(groups) > 1 and cnt_riders >= ORGANIZE_PARALLEL_MIN:
+        with profiling.stage('organize') as stage:
+            with ProcessPoolExecutor(max_workers=len(groups), initializer=_init_worker, initargs=(dict(ARGS), cfg.snapshot())) as pool:
+                results = list(pool.map(core.organize, *zip(*groups.values()), itertools.repeat(prev_groups)))
+            stage.rows = [sum(len(assignments.index) for assignments in results)]
+    else:
+        results = []
+        for (service, (drivers, riders)) in groups.items():
+            with profiling.stage(f'organize {service}') as stage:
+                results.append(core.organize(drivers, riders, prev_groups))
+                stage.rows = [len(results[-1].index)]
+
+    for (service, assignments) in zip(groups, results):
+        assignments[DRIVER_GROUP_HDR] = service
+    return pd.concat(results)
+
+
+def _init_worker(args: dict, tables: dict):
+    """Sets up a worker process with the arguments and configuration of the run.
+    """
+    ARGS.clear()
+    ARGS.update(args)
+    cfg.restore(tables)
+
+
+def _get_prev_groups() -> dict[int, int]:
+    """Returns the grouping of the last assignments of the same day and date for incremental runs, or None to assign
+    everyone again.
+    """
+    if not ARGS[PARAM_INCREMENTAL]:
+        return None
+    groups = history.last_groups()
+    if groups is None:
+        logging.warning(f'No previous assignments found for {ARGS[PARAM_DAY]} {history.run_date()}, assigning everyone')
+    return groups
@@ -0,0 +1,136 @@
+"""Keeps every run's drivers in a SQLite database in the data directory, so rotation can look up who drove when.
+The cars of every run are kept too, so an incremental run can patch the last assignments of its day and date.
+"""
+
+import cfg
+from cfg.config import *
+import lib.validation as prep
+import logging
+import numpy as np
+import os
+import pandas as pd
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS drives (
+    run INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    day TEXT NOT NULL,
+    service TEXT NOT NULL,
+    driver_phone TEXT NOT NULL,
+    riders INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS drives_phone_date ON drives (driver_phone, date);
+CREATE INDEX IF NOT EXISTS drives_run ON drives (run);
+CREATE TABLE IF NOT EXISTS groups (
+    run INTEGER NOT NULL,
+    rider_phone TEXT NOT NULL,
+    driver_phone TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS groups_run ON groups (run);
+"""
+### Bumped when the stored values change, so older databases are migrated when they are opened
+### 1: driver phones are stored as phone keys instead of as written in the sheet
+SCHEMA_VERSION = 1
+
+### Columns of the driver loads returned by lookup
+LOAD_COLS = ['last_run', 'last_date', 'drives', 'riders']
+
+
+def record(out: pd.DataFrame):
+    """Records how many riders every driver took in these assignments, and the driver of every rider, for the date and
+    day of the run. Running the same day again for the same date replaces the earlier run.
+    """
+    date = run_date()
+    is_assigned = out[OUTPUT_DRIVER_PHONE_HDR].notna()
+    phones = prep.phone_keys(out.loc[is_assigned, OUTPUT_DRIVER_PHONE_HDR])
+    loads = out[is_assigned].groupby([out.loc[is_assigned, DRIVER_GROUP_HDR].astype(str), phones]).size()
+    rider_phones = prep.phone_keys(out.loc[is_assigned, RIDER_PHONE_HDR])
+
+    conn = _connect(create=True)
+    with conn:
+        conn.execute('DELETE FROM groups WHERE run IN (SELECT run FROM drives WHERE date = ? AND day = ?)', (date, ARGS[PARAM_DAY]))
+        conn.execute('DELETE FROM drives WHERE date = ? AND day = ?', (date, ARGS[PARAM_DAY]))
+        run = conn.execute('SELECT COALESCE(MAX(run), 0) + 1 FROM drives').fetchone()[0]
+        conn.executemany('INSERT INTO drives VALUES (?, ?, ?, ?, ?, ?)',
+                         [(run, date, ARGS[PARAM_DAY], service, str(phone), int(riders)) for ((service, phone), riders) in loads.items()])
+        conn.executemany('INSERT INTO groups VALUES (?, ?, ?)',
+                         [(run, str(rider), str(driver)) for (rider, driver) in zip(rider_phones.tolist(), phones.tolist()) if rider != 0])
+    conn.close()
+    logging.debug(f'Recorded {len(loads)} drivers for {ARGS[PARAM_DAY]} {date} in {HISTORY_FILE}')
+
+
+def lookup(phones: pd.Series) -> tuple[int, pd.DataFrame]:
+    """Returns the last recorded run, or None if there is none, and the loads of the given drivers by phone key:
+    the last run and date they drove, how many runs they drove in, and how many riders they took in total.
+    Drivers who never drove are left out.
+    """
+    empty = pd.DataFrame(columns=LOAD_COLS, index=pd.Index([], dtype=np.int64, name=TMP_DRIVER_PHONE))
+    phones = [str(phone) for phone in pd.unique(phones)]
+    conn = _connect()
+    if conn is None:
+        return (None, empty)
+
+    with conn:
+        latest = conn.execute('SELECT MAX(run) FROM drives').fetchone()[0]
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS phones (phone TEXT PRIMARY KEY)')
+        conn.execute('DELETE FROM phones')
+        conn.executemany('INSERT OR IGNORE INTO phones VALUES (?)', [(phone,) for phone in phones])
+        rows = conn.execute('SELECT driver_phone, MAX(run), MAX(date), COUNT(DISTINCT run), SUM(riders) FROM phones '
+                            'JOIN drives ON drives.driver_phone = phones.phone GROUP BY driver_phone').fetchall()
+    conn.close()
+    if len(rows) == 0:
+        return (latest, empty)
+    loads = pd.DataFrame(rows, columns=[TMP_DRIVER_PHONE, *LOAD_COLS])
+    return (latest, loads.set_index(loads[TMP_DRIVER_PHONE].astype(np.int64)).drop(columns=[TMP_DRIVER_PHONE]))
+
+
+def last_groups() -> dict[int, int]:
+    """Returns the phone key of the driver of every rider in the last run of the same day and date, by the phone key of
+    the rider, or None if there is no such run.
+    """
+    conn = _connect()
+    if conn is None:
+        return None
+    with conn:
+        run = conn.execute('SELECT MAX(run) FROM drives WHERE date = ? AND day = ?', (run_date(), ARGS[PARAM_DAY])).fetchone()[0]
+        rows = conn.execute('SELECT rider_phone, driver_phone FROM groups WHERE run = ?', (run,)).fetchall()
+    conn.close()
+    if len(rows) == 0:
+        return None
+    return {int(rider): int(driver) for (rider, driver) in rows}
+
+
+def run_date() -> str:
+    """Returns the date of the rides being assigned, which is today unless the run gives one.
+    """
+    return pd.Timestamp(ARGS.get(PARAM_DATE) or pd.Timestamp.now()).strftime('%Y-%m-%d')
+
+
+def _connect(create: bool = False) -> sqlite3.Connection:
+    """Opens the history database, or returns None if it does not exist and is not to be created.
+    """
+    path = cfg.data_path(HISTORY_FILE)
+    if not create and not os.path.isfile(path):
+        return None
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    _migrate(conn)
+    return conn
+
+
+def _migrate(conn: sqlite3.Connection):
+    """Rewrites the rows of older versions of the database to the current schema version.
+    """
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+    with conn:
+        if version < 1:
+            rows = conn.execute('SELECT rowid, driver_phone FROM drives').fetchall()
+            if len(rows) > 0:
+                keys = prep.phone_keys(pd.Series([phone for (_, phone) in rows], dtype=object))
+                conn.executemany('UPDATE drives SET driver_phone = ? WHERE rowid = ?', [(str(key), rowid) for (key, (rowid, _)) in zip(keys, rows)])
+                logging.info(f'Migrated {len(rows)} rows of {HISTORY_FILE} to phone keys')
+        conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
@@ -0,0 +1,198 @@
+"""Implements the optimal assignment mode.
+Riders at each location flow into driver seats as a min-cost flow problem, where the cost of a seat is how far
+the rider is from the area the car is centered on, plus a penalty past the --distance a car picks up at before
+falling back to last resort pickups. Unlike assign_v2, the result does not depend on iteration order.
+"""
+
+from cfg.config import *
+import logging
+import numpy as np
+import pandas as pd
+import time
+
+### Cost added to riders farther than --distance from the center of their car, so they are only picked up as a last resort
+LAST_RESORT_COST = MAX_ROUTE_DIST
+### Cost of leaving a rider without a car, larger than any route cost so that every open seat is used first
+UNASSIGNED_COST = 10 * MAX_ROUTE_DIST
+
+
+def solve(drivers_df: pd.DataFrame, rider_groups: dict[int, list[int]], initial: np.ndarray) -> np.ndarray:
+    """Returns the driver position of every rider position, or -1 for riders left without a car.
+
+    Starting from the initial assignment, alternates between centering each car on the area closest to its riders
+    and solving the min-cost flow of riders into cars centered there, until the centers settle or the time budget runs out.
+    Each step can only lower the objective, so the result is never worse than the initial assignment.
+    """
+    model = _FlowModel(drivers_df, rider_groups)
+    deadline = time.perf_counter() + ARGS[PARAM_TIME_BUDGET]
+
+    best = initial.copy()
+    best_cost = initial_cost = model.objective(best)
+    anchors = model.best_anchors(best)
+    while True:
+        assigned = model.assign(anchors, best, deadline)
+        cost = model.objective(assigned)
+        if cost < best_cost:
+            best, best_cost = assigned, cost
+        if time.perf_counter() >= deadline:
+            logging.warning(f'Optimal solver ran out of time after {ARGS[PARAM_TIME_BUDGET]}s, keeping the best assignments found')
+            break
+        next_anchors = model.best_anchors(best)
+        if np.array_equal(next_anchors, anchors):
+            break
+        anchors = next_anchors
+
+    logging.info(f'Objective: greedy={initial_cost}, optimal={best_cost}')
+    return best
+
+
+class _FlowModel:
+    """Location groups, cars and distances of one organize call.
+    """
+
+    def __init__(self, drivers_df: pd.DataFrame, rider_groups: dict[int, list[int]]):
+        width = max(len(LOC_DIST), 1)
+        loc_dist = np.array(LOC_DIST, dtype=np.int64).reshape(len(LOC_DIST), len(LOC_DIST))
+
+        self.locs = [loc for loc in rider_groups if len(rider_groups[loc]) > 0]
+        self.groups = [rider_groups[loc] for loc in self.locs]
+        self.counts = np.array([len(group) for group in self.groups], dtype=np.int64)
+        self.capacity = drivers_df[DRIVER_OPENINGS_HDR].to_numpy(dtype=np.int64)
+
+        # Distance from each location group to every area, riders outside the map are far from everything
+        self.reach = np.full((len(self.locs), width), MAX_ROUTE_DIST, dtype=np.int64)
+        for l, loc in enumerate(self.locs):
+            areas = LOC_INDEX.get(loc, [])
+            if len(areas) > 0:
+                self.reach[l] = np.minimum(loc_dist[areas].min(axis=0), MAX_ROUTE_DIST)
+        self.reach[self.reach > ARGS[PARAM_DISTANCE]] += LAST_RESORT_COST
+
+        # Drivers with a preferred location are centered there
+        self.allowed = np.ones((len(self.capacity), width), dtype=bool)
+        for d, pref in enumerate(drivers_df[TMP_DRIVER_PREF_LOC]):
+            areas = LOC_INDEX.get(int(pref), [])
+            if len(areas) > 0:
+                self.allowed[d] = False
+                self.allowed[d, areas] = True
+
+    def _counts(self, assigned: np.ndarray) -> np.ndarray:
+        """Returns how many riders of each location group ride in each car.
+        """
+        counts = np.zeros((len(self.locs), len(self.capacity)), dtype=np.int64)
+        for l, group in enumerate(self.groups):
+            drivers = assigned[group]
+            np.add.at(counts[l], drivers[drivers >= 0], 1)
+        return counts
+
+    def _car_costs(self, counts: np.ndarray) -> np.ndarray:
+        """Returns the cost of centering each car on each area.
+        """
+        cost = (counts.T @ self.reach).astype(float)
+        cost[~self.allowed] = np.inf
+        return cost
+
+    def objective(self, assigned: np.ndarray) -> int:
+        """Returns the distance of every rider from the center of their car, plus a penalty per rider without a car.
+        """
+        counts = self._counts(assigned)
+        unassigned = int(self.counts.sum() - counts.sum())
+        return int(self._car_costs(counts).min(axis=1).sum()) + UNASSIGNED_COST * unassigned
+
+    def best_anchors(self, assigned: np.ndarray) -> np.ndarray:
+        """Returns the area each car should be centered on. Empty cars are centered on the riders still left without a car.
+        """
+        counts = self._counts(assigned)
+        cost = self._car_costs(counts)
+        leftover = self.counts - counts.sum(axis=1)
+        if leftover.sum() == 0:
+            leftover = self.counts
+        empty = counts.sum(axis=0) == 0
+        cost[empty] = np.where(self.allowed[empty], leftover @ self.reach, np.inf)
+        return cost.argmin(axis=1)
+
+    def assign(self, anchors: np.ndarray, prev: np.ndarray, deadline: float = None) -> np.ndarray:
+        """Solves the min-cost flow of riders into cars centered on the anchors.
+        Riders keep their car from the previous assignment when the flow allows it.
+        If the deadline passes first, the riders the flow has not reached yet are left without a car.
+        """
+        n_locs = len(self.locs)
+        n_drivers = len(self.capacity)
+        src = 0
+        unassigned = n_locs + n_drivers + 1
+        sink = n_locs + n_drivers + 2
+        loc_nodes = np.arange(1, n_locs + 1)
+        driver_nodes = np.arange(n_locs + 1, n_locs + n_drivers + 1)
+
+        total = int(self.counts.sum())
+        cap = np.zeros((sink + 1, sink + 1), dtype=np.int64)
+        cost = np.zeros((sink + 1, sink + 1), dtype=np.int64)
+        cap[src, loc_nodes] = self.counts
+        cap[np.ix_(loc_nodes, driver_nodes)] = total
+        cost[np.ix_(loc_nodes, driver_nodes)] = self.reach[:, anchors]
+        cap[loc_nodes, unassigned] = total
+        cost[loc_nodes, unassigned] = UNASSIGNED_COST
+        cap[driver_nodes, sink] = self.capacity
+        cap[unassigned, sink] = total
+
+        flow = _min_cost_flow(cap, cost, src, sink, deadline)
+        seats = flow[np.ix_(loc_nodes, driver_nodes)]
+
+        assigned = np.full(len(prev), -1, dtype=np.int64)
+        for l, group in enumerate(self.groups):
+            left = []
+            for pos in group:
+                d = prev[pos]
+                if d >= 0 and seats[l, d] > 0:
+                    assigned[pos] = d
+                    seats[l, d] -= 1
+                else:
+                    left.append(pos)
+            for d in np.flatnonzero(seats[l]):
+                for _ in range(seats[l, d]):
+                    if len(left) > 0:
+                        assigned[left.pop()] = d
+        return assigned
+
+
+def _min_cost_flow(cap: np.ndarray, cost: np.ndarray, src: int, sink: int, deadline: float = None) -> np.ndarray:
+    """Returns a maximum flow of minimum cost on a dense graph, using successive shortest paths with potentials.
+    Costs must be non-negative, and no two nodes may have edges in both directions.
+    If the deadline passes first, returns the flow pushed so far, which is of minimum cost for its value.
+    """
+    n = len(cap)
+    flow = np.zeros((n, n), dtype=np.int64)
+    cost = np.where(cap > 0, cost, -cost.T)
+    potential = np.zeros(n, dtype=np.int64)
+
+    while deadline is None or time.perf_counter() < deadline:
+        # Dijkstra over the residual graph with reduced costs
+        residual = cap - flow
+        reduced = cost + potential[:, None] - potential[None, :]
+        dist = np.full(n, np.iinfo(np.int64).max, dtype=np.int64)
+        prev = np.full(n, -1, dtype=np.int64)
+        done = np.zeros(n, dtype=bool)
+        dist[src] = 0
+        for _ in range(n):
+            u = int(np.argmin(np.where(done, np.iinfo(np.int64).max, dist)))
+            if done[u] or dist[u] == np.iinfo(np.int64).max:
+                break
+            done[u] = True
+            relax = (residual[u] > 0) & ~done & (dist[u] + reduced[u] < dist)
+            dist[relax] = dist[u] + reduced[u, relax]
+            prev[relax] = u
+
+        if not done[sink]:
+            return flow
+
+        # Push as much as the path allows
+        path = [sink]
+        while path[-1] != src:
+            path.append(int(prev[path[-1]]))
+        path.reverse()
+        push = min(residual[u, v] for u, v in zip(path, path[1:]))
+        for u, v in zip(path, path[1:]):
+            flow[u, v] += push
+            flow[v, u] -= push
+
+        potential += np.minimum(dist, dist[sink])
+    return flow
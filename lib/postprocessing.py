@@ -14,79 +14,47 @@ def clean_output(out: pd.DataFrame) -> pd.DataFrame:
 
 def _format_output(out: pd.DataFrame) -> pd.DataFrame:
     """Organizes the output to order by driver. Removes redundant driver details. Also spaces out driver groups.
+
+    Each driver gets a block of rows as long as their capacity, in pickup order, followed by a blank row.
+    Riders without a driver sort last and are listed after the last block, with '?' as their driver.
+    The pickup order is left blank if the pickups were not ordered.
     """
     if len(out) == 0:
         return
     
-    out.sort_values(by=[DRIVER_GROUP_HDR, OUTPUT_DRIVER_NAME_HDR, RIDER_LOCATION_HDR], inplace=True)
+    if OUTPUT_PICKUP_ORDER_HDR not in out.columns:
+        out[OUTPUT_PICKUP_ORDER_HDR] = np.nan
+    out.sort_values(by=[DRIVER_GROUP_HDR, OUTPUT_DRIVER_NAME_HDR, OUTPUT_PICKUP_ORDER_HDR, RIDER_LOCATION_HDR], inplace=True)
     out.reset_index(inplace=True, drop=True)
 
-    driver_cnt = 1
-    unassigned_cnt = 0
-    total_capacity = int(out.at[0, OUTPUT_DRIVER_CAPACITY_HDR])
-    for idx in range(1, len(out)):
-        if out.at[idx, OUTPUT_DRIVER_NAME_HDR] is not np.nan and out.at[idx, OUTPUT_DRIVER_NAME_HDR] != out.at[idx - 1, OUTPUT_DRIVER_NAME_HDR]:
-            total_capacity += int(out.at[idx, OUTPUT_DRIVER_CAPACITY_HDR])
-            driver_cnt += 1
-        
-        if out.at[idx, OUTPUT_DRIVER_NAME_HDR] is np.nan:
-            unassigned_cnt += 1
-
-    if unassigned_cnt > 0:
-        driver_cnt += 1
- 
-    # Append enough rows to space out drivers
-    total_rows = total_capacity + driver_cnt + unassigned_cnt
-    new_out = pd.DataFrame({
-        OUTPUT_DRIVER_NAME_HDR:     [''] * total_rows,
-        OUTPUT_DRIVER_PHONE_HDR:    [''] * total_rows,
-        OUTPUT_DRIVER_CAPACITY_HDR: [''] * total_rows,
-        RIDER_NAME_HDR:             [''] * total_rows,
-        RIDER_PHONE_HDR:            [''] * total_rows,
-        RIDER_LOCATION_HDR:         [''] * total_rows,
-        RIDER_NOTES_HDR:            [''] * total_rows
-    })
-
-    # Edge case for 1st rider
-    _copy_output_row(new_out, out, 1, 0)
-    prev_driver_name = out.at[0, OUTPUT_DRIVER_NAME_HDR]
-    curr_driver_capacity = int(out.at[0, OUTPUT_DRIVER_CAPACITY_HDR]) if out.at[0, OUTPUT_DRIVER_CAPACITY_HDR] is not np.nan else 0
-    new_idx = 2
-    new_driver_idx = 1
-
-    for old_idx in range(1, len(out)):
-
-        # Handle formatting for a new driver
-        curr_driver_name = out.at[old_idx, OUTPUT_DRIVER_NAME_HDR] 
-        is_next_driver = prev_driver_name is not np.nan and prev_driver_name != curr_driver_name
-        if is_next_driver:
-            prev_driver_name = curr_driver_name
-            new_driver_idx += curr_driver_capacity + 1
-            curr_driver_capacity = int(out.at[old_idx, OUTPUT_DRIVER_CAPACITY_HDR]) if out.at[old_idx, OUTPUT_DRIVER_CAPACITY_HDR] is not np.nan else 0
-            new_idx = new_driver_idx
-
-        if curr_driver_name is np.nan:
-            # No driver assigned
-            out.at[old_idx, OUTPUT_DRIVER_NAME_HDR]     = '?'
-            out.at[old_idx, OUTPUT_DRIVER_PHONE_HDR]    = '?'
-            out.at[old_idx, OUTPUT_DRIVER_CAPACITY_HDR] = '?'
-        elif not is_next_driver:
-            # Remove redundant driver details.
-            out.at[old_idx, OUTPUT_DRIVER_NAME_HDR]     = ''
-            out.at[old_idx, OUTPUT_DRIVER_PHONE_HDR]    = ''
-            out.at[old_idx, OUTPUT_DRIVER_CAPACITY_HDR] = ''
-
-        _copy_output_row(new_out, out, new_idx, old_idx)
-        new_idx += 1
+    names = out[OUTPUT_DRIVER_NAME_HDR]
+    is_unassigned = names.isna().to_numpy()
+    is_assigned = ~is_unassigned
+    is_next_driver = is_assigned & (names != names.shift()).to_numpy()
+
+    # Offset of each driver block from the capacities of the drivers before it
+    first_rows = np.flatnonzero(is_next_driver)
+    capacities = out[OUTPUT_DRIVER_CAPACITY_HDR].to_numpy()[first_rows].astype(int)
+    block_ends = 1 + np.cumsum(capacities + 1)
+    block_starts = block_ends - capacities - 1
+
+    new_idx = np.empty(len(out), dtype=int)
+    block = np.cumsum(is_next_driver)[is_assigned] - 1
+    new_idx[is_assigned] = block_starts[block] + np.flatnonzero(is_assigned) - first_rows[block]
+    unassigned_start = block_ends[-1] if len(block_ends) > 0 else 1
+    new_idx[is_unassigned] = unassigned_start + np.arange(is_unassigned.sum())
+
+    total_rows = max(unassigned_start - 1, new_idx.max() + 1)
+    order = out[OUTPUT_PICKUP_ORDER_HDR].to_numpy(dtype=float)
+    out[OUTPUT_PICKUP_ORDER_HDR] = np.where(np.isnan(order), '', np.nan_to_num(order).astype(int).astype(str)).astype(object)
+    new_out = {}
+    for hdr in [OUTPUT_DRIVER_NAME_HDR, OUTPUT_DRIVER_PHONE_HDR, OUTPUT_DRIVER_CAPACITY_HDR, OUTPUT_PICKUP_ORDER_HDR, RIDER_NAME_HDR, RIDER_PHONE_HDR, RIDER_LOCATION_HDR, RIDER_NOTES_HDR]:
+        values = out[hdr].to_numpy(dtype=object)
+        if hdr in [OUTPUT_DRIVER_NAME_HDR, OUTPUT_DRIVER_PHONE_HDR, OUTPUT_DRIVER_CAPACITY_HDR]:
+            # Remove redundant driver details
+            values = np.where(is_next_driver, values, np.where(is_unassigned, '?', '').astype(object))
+        col = np.full(total_rows, '', dtype=object)
+        col[new_idx] = values
+        new_out[hdr] = col
     
-    return new_out
-
-        
-def _copy_output_row(dst: pd.DataFrame, src: pd.DataFrame, dst_idx: int, src_idx: int):
-    dst.at[dst_idx, OUTPUT_DRIVER_NAME_HDR]     = src.at[src_idx, OUTPUT_DRIVER_NAME_HDR]
-    dst.at[dst_idx, OUTPUT_DRIVER_PHONE_HDR]    = src.at[src_idx, OUTPUT_DRIVER_PHONE_HDR]
-    dst.at[dst_idx, OUTPUT_DRIVER_CAPACITY_HDR] = src.at[src_idx, OUTPUT_DRIVER_CAPACITY_HDR]
-    dst.at[dst_idx, RIDER_NAME_HDR]     = src.at[src_idx, RIDER_NAME_HDR]
-    dst.at[dst_idx, RIDER_PHONE_HDR]    = src.at[src_idx, RIDER_PHONE_HDR]
-    dst.at[dst_idx, RIDER_LOCATION_HDR] = src.at[src_idx, RIDER_LOCATION_HDR]
-    dst.at[dst_idx, RIDER_NOTES_HDR]    = src.at[src_idx, RIDER_NOTES_HDR]
\ No newline at end of file
+    return pd.DataFrame(new_out)
@@ -0,0 +1,130 @@
+"""Implements the per-stage timing and memory report of a run, enabled with --profile.
+When profiling is off, stages run their code directly without measuring anything.
+"""
+
+import cfg
+from cfg.config import *
+from contextlib import contextmanager
+import functools
+import json
+import logging
+import pandas as pd
+import time
+import tracemalloc
+
+### Stages measured in the current run, in the order they started
+STAGES = []
+_open_stages = []
+
+
+class _Stage:
+    """Measurements of one stage. Rows can be set by the stage to the number of rows it produced.
+    """
+
+    def __init__(self, name: str, depth: int):
+        self.name = name
+        self.depth = depth
+        self.rows = None
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak = 0
+        self._start_mem = 0
+
+
+class _NoStage:
+    """Stand-in for a stage when profiling is off, ignoring the rows it is given.
+    """
+    rows = None
+
+
+_NO_STAGE = _NoStage()
+
+
+def init():
+    """Clears the stages of a previous run, and starts tracing memory allocations if profiling is on.
+    """
+    STAGES.clear()
+    _open_stages.clear()
+    if is_enabled() and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def is_enabled() -> bool:
+    return ARGS.get(PARAM_PROFILE) is not None
+
+
+@contextmanager
+def stage(name: str):
+    """Measures the wall time, CPU time and peak memory of the code in the with block.
+    Stages can be nested, and the peak memory of a stage includes the stages inside it.
+    """
+    if not is_enabled():
+        yield _NO_STAGE
+        return
+
+    record = _Stage(name, len(_open_stages))
+    STAGES.append(record)
+    (record._start_mem, peak) = tracemalloc.get_traced_memory()
+
+    # The peak is reset for this stage, so carry the peak so far over to the stages around it first
+    for outer in _open_stages:
+        outer.peak = max(outer.peak, peak - outer._start_mem)
+    _open_stages.append(record)
+    tracemalloc.reset_peak()
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    try:
+        yield record
+    finally:
+        record.wall = time.perf_counter() - start_wall
+        record.cpu = time.process_time() - start_cpu
+        (_, peak) = tracemalloc.get_traced_memory()
+        record.peak = max(record.peak, peak - record._start_mem)
+        _open_stages.pop()
+
+        # The peak was reset for this stage, so carry it over to the stages around it
+        for outer in _open_stages:
+            outer.peak = max(outer.peak, peak - outer._start_mem)
+
+
+def profiled(name: str):
+    """Decorates a function to run as a stage. The rows of the dataframes it returns are recorded.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not is_enabled():
+                return func(*args, **kwargs)
+            with stage(name) as record:
+                result = func(*args, **kwargs)
+                record.rows = _count_rows(result)
+                return result
+        return wrapper
+    return decorator
+
+
+def _count_rows(result) -> list[int]:
+    frames = result if isinstance(result, tuple) else (result,)
+    rows = [len(df.index) for df in frames if isinstance(df, pd.DataFrame)]
+    return rows if len(rows) > 0 else None
+
+
+def report():
+    """Writes the stages of the run to the JSON report and prints them as a table, then stops tracing memory allocations.
+    """
+    if not is_enabled():
+        return
+    tracemalloc.stop()
+
+    stages = [{'stage': record.name, 'depth': record.depth, 'wall_s': round(record.wall, 6), 'cpu_s': round(record.cpu, 6),
+               'peak_mb': round(record.peak / 2**20, 3), 'rows': record.rows} for record in STAGES]
+    path = ARGS[PARAM_PROFILE] or cfg.data_path(PROFILE_FILE)
+    with open(path, 'w') as report_file:
+        json.dump({'day': ARGS[PARAM_DAY], 'solver': ARGS[PARAM_SOLVER], 'stages': stages}, report_file, indent=2)
+    logging.info(f'Wrote profile to {path}')
+
+    table = pd.DataFrame(stages, columns=['stage', 'depth', 'wall_s', 'cpu_s', 'peak_mb', 'rows'])
+    table['stage'] = ['  ' * depth + name for (name, depth) in zip(table['stage'], table['depth'])]
+    table['stage'] = table['stage'].str.ljust(table['stage'].str.len().max())
+    table['rows'] = ['' if rows is None else '/'.join(str(cnt) for cnt in rows) for rows in table['rows']]
+    print(table.drop(columns=['depth']).to_string(index=False, justify='left'))
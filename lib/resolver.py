@@ -0,0 +1,174 @@
+"""Resolves free-text locations that are not in the map to the closest map location.
+Resolved answers are added to LOC_MAP as aliases, so every later lookup finds them.
+"""
+
+import bisect
+import cfg
+from cfg.config import *
+import hashlib
+import json
+import logging
+import os
+import pandas as pd
+import re
+
+
+class LocationIndex:
+    """Trigram index over location names, with edit distance, prefix and initials checks on the best candidates.
+    """
+
+    def __init__(self, names: list[str]):
+        self.names = sorted(set(names) - {''})
+        self.prefixes = sorted((_normalize(name), i) for i, name in enumerate(self.names))
+        self.trigrams = {}
+        self.initials = {}
+        for i, name in enumerate(self.names):
+            for gram in _trigrams(_normalize(name)):
+                self.trigrams.setdefault(gram, set()).add(i)
+            words = _normalize(name).split()
+            if len(words) > 1:
+                self.initials.setdefault(''.join(word[0] for word in words), set()).add(i)
+
+    def match(self, text: str) -> tuple[str, float]:
+        """Returns the name that best matches the text and how confident the match is from 0 to 1, or None if no name is
+        close or the best names are tied.
+        """
+        text = _normalize(text)
+        if text == '':
+            return (None, 0.0)
+
+        # Names sharing the most trigrams with the text, plus names the text abbreviates
+        grams = _trigrams(text)
+        shared = {}
+        for gram in grams:
+            for i in self.trigrams.get(gram, ()):
+                shared[i] = shared.get(i, 0) + 1
+        candidates = set(sorted(shared, key=lambda i: (-shared[i], i))[:LOC_MATCH_CANDIDATES])
+        candidates |= self.initials.get(text.replace(' ', ''), set())
+        if len(text) >= 3:
+            start = bisect.bisect_left(self.prefixes, (text, -1))
+            for (name, i) in self.prefixes[start:]:
+                if not name.startswith(text):
+                    break
+                candidates.add(i)
+
+        scores = sorted(((self._score(text, i, shared.get(i, 0), len(grams)), self.names[i]) for i in candidates), reverse=True)
+        if len(scores) == 0:
+            return (None, 0.0)
+        (best, name) = scores[0]
+        if len(scores) > 1 and scores[1][0] == best and LOC_MAP.get(scores[1][1]) != LOC_MAP.get(name):
+            return (None, best)
+        return (name, best)
+
+    def _score(self, text: str, i: int, shared: int, text_grams: int) -> float:
+        name = _normalize(self.names[i])
+        words = name.split()
+        score = max(
+            2 * shared / (text_grams + len(_trigrams(name))),
+            1 - _edit_distance(text, name) / max(len(text), len(name)),
+        )
+        if len(text) >= 3 and name.startswith(text):
+            score = max(score, LOC_MATCH_ABBREVIATION)
+        if len(words) > 1 and text.replace(' ', '') == ''.join(word[0] for word in words):
+            score = max(score, LOC_MATCH_ABBREVIATION)
+        if set(words) <= set(text.split()):
+            score = max(score, LOC_MATCH_ABBREVIATION)
+        return round(score, 3)
+
+
+def resolve_locations(locations: pd.Series):
+    """Adds the locations that are not in the map to LOC_MAP, under the map location they match, if the match is
+    confident enough. Each distinct answer is only matched once, and matches are saved in the data directory.
+    """
+    unknown = [loc for loc in pd.unique(locations.astype(str).str.strip().str.lower()) if loc not in LOC_MAP and loc not in CAMPUS_LOCS and loc != '']
+    if len(unknown) == 0 or len(LOC_MAP) == 0:
+        return
+
+    # The Friday campus location is made up by merging the campus places, so answers are matched to the places instead
+    names = sorted((set(LOC_MAP) | CAMPUS_LOCS) - {CAMPUS.strip().lower()})
+    digest = hashlib.sha256(json.dumps([names, LOC_MATCH_THRESHOLD]).encode()).hexdigest()
+    saved = _load_resolved(digest)
+    index = None
+    cnt_new = 0
+    for loc in unknown:
+        if loc not in saved:
+            if index is None:
+                index = LocationIndex(names)
+            (name, confidence) = index.match(loc)
+            saved[loc] = name if confidence >= LOC_MATCH_THRESHOLD else None
+            cnt_new += 1
+            logging.debug(f'Matched location "{loc}" to "{name}" with confidence {confidence}')
+
+        name = saved[loc]
+        if name is None:
+            continue
+        if name in CAMPUS_LOCS:
+            CAMPUS_LOCS.add(loc)
+        if name in LOC_MAP:
+            LOC_MAP[loc] = LOC_MAP[name]
+
+    if cnt_new > 0:
+        _save_resolved(digest, saved)
+    unresolved = [loc for loc in unknown if saved[loc] is None]
+    logging.info(f'Resolved {len(unknown) - len(unresolved)}/{len(unknown)} locations not in {MAP_FILE}')
+    if len(unresolved) > 0:
+        logging.debug(f'Locations not resolved: {unresolved}')
+
+
+def _normalize(text: str) -> str:
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', text.lower()).split())
+
+
+def _trigrams(text: str) -> set[str]:
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _edit_distance(a: str, b: str) -> int:
+    """Returns the Levenshtein distance between two strings.
+    """
+    prev = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        curr = [i]
+        for j, char_b in enumerate(b, start=1):
+            curr.append(min(prev[j] + 1, curr[j - 1] + 1, prev[j - 1] + (char_a != char_b)))
+        prev = curr
+    return prev[-1]
+
+
+def _load_saved() -> dict[str, dict[str, str]]:
+    """Returns the saved matches of each set of location names, by the hash of the names.
+    """
+    path = cfg.data_path(LOC_RESOLVED_FILE)
+    if os.path.isfile(path):
+        try:
+            with open(path) as resolved_file:
+                saved = json.load(resolved_file)
+            if isinstance(saved, dict):
+                return saved
+        except (OSError, ValueError):
+            logging.debug(f'Ignoring unreadable {LOC_RESOLVED_FILE}')
+    return {}
+
+
+def _load_resolved(digest: str) -> dict[str, str]:
+    """Returns the saved matches, if they were made against the same location names.
+    """
+    return dict(_load_saved().get(digest, {}))
+
+
+def _save_resolved(digest: str, resolved: dict[str, str]):
+    """Saves the matches of the location names, keeping the matches of the last few other sets of names, such as the
+    other day's map.
+    """
+    saved = _load_saved()
+    saved.pop(digest, None)
+    saved = dict(list(saved.items())[-(LOC_RESOLVED_KEEP - 1):] if LOC_RESOLVED_KEEP > 1 else [])
+    saved[digest] = resolved
+    path = cfg.data_path(LOC_RESOLVED_FILE)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as resolved_file:
+            json.dump(saved, resolved_file, indent=1)
+    except OSError as e:
+        logging.debug(f'Could not save {LOC_RESOLVED_FILE}: {e}')
@@ -1,33 +1,177 @@
 """Implements usage of the Google Sheets API, including reading driver/rider data and writing to the output sheet.
 """
 
+import cfg
 from cfg.config import *
-import gspread
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import json
+import lib.cache as cache
+import lib.profiling as profiling
+import lib.trace as trace
 import lib.validation as prep
 import logging
 import numpy as np
 import os
 import pandas as pd
-import pickle
+import time
 from typing import Tuple
 
 
-def update_pickles():
-    """Pull riders and drivers from the Google Sheets and write to the pickle files.
+@profiling.profiled('download')
+def update_pickles() -> list[str]:
+    """Pull riders and drivers from the Google Sheets and write to the cache.
+    Returns the keys of the sheets that could not be downloaded.
     """
+    import gspread  # loads the Google auth stack, so offline runs never import it
+
     # connect Google Sheets
-    gc = gspread.service_account(filename=SERVICE_ACCT_FILE)
+    gc = gspread.service_account(filename=cfg.cfg_path(SERVICE_ACCT_FILE))
 
-    with open(os.path.join(CFG_PATH, SHEET_IDS_FILE)) as gid_json:
+    with open(cfg.cfg_path(SHEET_IDS_FILE)) as gid_json:
         gid_data = json.load(gid_json)
 
-    for key in gid_data:
-        logging.info(f'Downloading {key}')
-        ws = gc.open_by_key(gid_data[key]).get_worksheet(0)
-        records = ws.get_all_records()
-        with open(os.path.join(DATA_PATH, key), 'wb') as pickle_file:
-            pickle.dump(records, pickle_file)
+    return download_sheets(gc, gid_data)
+
+
+def download_sheets(gc, gid_data: dict[str, str]) -> list[str]:
+    """Downloads the sheets concurrently over one client, caching each sheet as soon as it arrives.
+    Returns the keys that could not be downloaded, their previous cache is kept.
+    """
+    failed = []
+    with ThreadPoolExecutor(max_workers=ARGS[PARAM_CONNECTIONS]) as pool:
+        futures = {pool.submit(_download_sheet, gc, key, gid_data[key]): key for key in gid_data}
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                logging.error(f'Could not download {key}, using the previous data: {e}')
+                failed.append(key)
+    return failed
+
+
+def _download_sheet(gc, key: str, sheet_id: str):
+    """Syncs one sheet, retrying with exponential backoff when a request fails.
+    """
+    import gspread
+    import requests
+
+    for attempt in range(DOWNLOAD_RETRIES + 1):
+        try:
+            logging.info(f'Downloading {key}')
+            ws = gc.open_by_key(sheet_id).get_worksheet(0)
+            return sync_sheet(key, ws, ARGS[PARAM_SYNC] == ARG_FULL_SYNC)
+        except (gspread.exceptions.APIError, requests.exceptions.RequestException, ConnectionError) as e:
+            if attempt == DOWNLOAD_RETRIES:
+                raise
+            delay = DOWNLOAD_BACKOFF * 2 ** attempt
+            logging.warning(f'Downloading {key} failed, retrying in {delay}s: {e}')
+            time.sleep(delay)
+
+
+def sync_sheet(key: str, ws, full: bool = False) -> int:
+    """Updates the cache of a sheet, fetching only the rows added or edited since the last sync.
+    Form responses are edited in place with a new timestamp, so edits are found by comparing the timestamp column.
+    Cells edited by hand keep their timestamp and are not fetched, which is why a full sync is the default.
+    Downloads the whole sheet instead if requested, on the first sync, or when rows were removed or the headers changed.
+    Returns the number of rows fetched.
+    """
+    state = _load_sync_state(key)
+    ts_hdr = SYNC_TIMESTAMP_HDRS.get(key)
+    if full or state is None or ts_hdr not in state['header']:
+        return _full_sync(key, ws)
+
+    header = state['header']
+    ts_col = _col_letter(header.index(ts_hdr) + 1)
+    (header_rows, ts_rows) = ws.batch_get(['1:1', f'{ts_col}2:{ts_col}'])
+    timestamps = np.array([row[0] if len(row) > 0 else '' for row in ts_rows], dtype=object)
+    cached = cache.read(key)
+    rows = state['rows']
+    if _pad(header_rows[0] if len(header_rows) > 0 else [], len(header)) != header or len(timestamps) < rows or len(cached.index) != rows:
+        logging.info(f'{key} was restructured, downloading all rows')
+        return _full_sync(key, ws)
+
+    changed = np.flatnonzero(timestamps[:rows] != cached[ts_hdr].astype(str).to_numpy(dtype=object)).tolist()
+    last_col = _col_letter(len(header))
+    ranges = [f'A{pos + 2}:{last_col}{pos + 2}' for pos in changed]
+    if len(timestamps) > rows:
+        ranges.append(f'A{rows + 2}:{last_col}{len(timestamps) + 1}')
+    if len(ranges) == 0:
+        logging.info(f'{key} is up to date with {rows} rows')
+        return 0
+
+    fetched = ws.batch_get(ranges)
+    edited = [block[0] if len(block) > 0 else [] for block in fetched[:len(changed)]]
+    added = list(fetched[len(changed)]) if len(timestamps) > rows else []
+
+    merged = cached.astype(object)
+    if len(edited) > 0:
+        merged.iloc[changed] = _to_records_df(header, edited)[merged.columns].to_numpy(dtype=object)
+    if len(added) > 0:
+        merged = pd.concat([merged, _to_records_df(header, added)[merged.columns].astype(object)], ignore_index=True)
+    merged = merged.infer_objects()
+
+    cache.write(key, merged)
+    _save_sync_state(key, header, len(merged.index), timestamps[-1])
+    logging.info(f'Synced {key}: {len(edited)} edited and {len(added)} new rows')
+    return len(edited) + len(added)
+
+
+def _full_sync(key: str, ws) -> int:
+    """Downloads every row of a sheet into the cache, the same records as ws.get_all_records().
+    """
+    values = ws.get_all_values()
+    header = values[0] if len(values) > 0 else []
+    records = _to_records_df(header, values[1:])
+    cache.write(key, records)
+
+    ts_hdr = SYNC_TIMESTAMP_HDRS.get(key)
+    if ts_hdr in header and len(records.index) > 0:
+        _save_sync_state(key, header, len(records.index), str(values[-1][header.index(ts_hdr)]))
+    else:
+        _clear_sync_state(key)
+    if key == OUTPUT_SHEET_KEY:
+        _set_output_uploaded(True)
+    return len(records.index)
+
+
+def _to_records_df(header: list[str], rows: list[list[str]]) -> pd.DataFrame:
+    from gspread.utils import numericise_all
+    return pd.DataFrame([dict(zip(header, numericise_all(_pad(row, len(header))))) for row in rows])
+
+
+def _pad(row: list[str], width: int) -> list[str]:
+    return list(row) + [''] * (width - len(row))
+
+
+def _col_letter(col: int) -> str:
+    """Returns the A1 letters of a 1-indexed column.
+    """
+    letters = ''
+    while col > 0:
+        (col, rem) = divmod(col - 1, 26)
+        letters = chr(ord('A') + rem) + letters
+    return letters
+
+
+def _load_sync_state(key: str) -> dict:
+    """Returns the headers, row count and last timestamp of a sheet at its last sync, or None if it must be fully downloaded.
+    """
+    path = cfg.data_path(f'{key}.sync.json')
+    if not os.path.isfile(path) or not os.path.isdir(cfg.data_path(key)):
+        return None
+    with open(path) as state_file:
+        return json.load(state_file)
+
+
+def _save_sync_state(key: str, header: list[str], rows: int, last_timestamp: str):
+    with open(cfg.data_path(f'{key}.sync.json'), 'w') as state_file:
+        json.dump({'header': header, 'rows': rows, 'last_timestamp': last_timestamp}, state_file)
+
+
+def _clear_sync_state(key: str):
+    if os.path.isfile(cfg.data_path(f'{key}.sync.json')):
+        os.remove(cfg.data_path(f'{key}.sync.json'))
 
 
 def get_data() -> Tuple[pd.DataFrame, pd.DataFrame]:
@@ -39,24 +183,23 @@ def get_data() -> Tuple[pd.DataFrame, pd.DataFrame]:
     return get_cached_input()
 
 
+@profiling.profiled('load input')
 def get_cached_input() -> Tuple[pd.DataFrame, pd.DataFrame]:
     """Return a tuple of pandas DataFrames, ordered as (drivers, riders)
     """
-    with open(os.path.join(DATA_PATH, PERMANENT_SHEET_KEY), 'rb') as pickle_file:
-        permanent_riders = pd.DataFrame(pickle.load(pickle_file))
-    
-    with open(os.path.join(DATA_PATH, WEEKLY_SHEET_KEY), 'rb') as pickle_file:
-        weekly_riders = pd.DataFrame(pickle.load(pickle_file))
-    
-    with open(os.path.join(DATA_PATH, DRIVER_SHEET_KEY), 'rb') as pickle_file:
-        drivers = pd.DataFrame(pickle.load(pickle_file))
+    permanent_riders = cache.read(PERMANENT_SHEET_KEY, PERMANENT_RIDER_HDRS)
+    weekly_riders = cache.read(WEEKLY_SHEET_KEY, WEEKLY_RIDER_HDRS)
+    drivers = cache.read(DRIVER_SHEET_KEY)
+
+    # Print input
+    trace.dbg_pickles({PERMANENT_SHEET_KEY: permanent_riders, WEEKLY_SHEET_KEY: weekly_riders, DRIVER_SHEET_KEY: drivers})
     
     prep.standardize_permanent_responses(permanent_riders)
     prep.standardize_weekly_responses(weekly_riders)
     
     # Reorder and rename columns before merging
     if len(weekly_riders.index) > 0:
-        weekly_riders = weekly_riders[[WEEKLY_RIDER_TIMESTAMP_HDR, WEEKLY_RIDER_NAME_HDR, WEEKLY_RIDER_PHONE_HDR, WEEKLY_RIDER_LOCATION_HDR, WEEKLY_RIDER_FRIDAY_HDR, WEEKLY_RIDER_SUNDAY_HDR, WEEKLY_RIDER_NOTES_HDR]]
+        weekly_riders = weekly_riders[WEEKLY_RIDER_HDRS]
         weekly_riders.rename(columns={WEEKLY_RIDER_TIMESTAMP_HDR: RIDER_TIMESTAMP_HDR, WEEKLY_RIDER_NAME_HDR: RIDER_NAME_HDR, WEEKLY_RIDER_PHONE_HDR: RIDER_PHONE_HDR, WEEKLY_RIDER_LOCATION_HDR: RIDER_LOCATION_HDR, WEEKLY_RIDER_FRIDAY_HDR: RIDER_FRIDAY_HDR, WEEKLY_RIDER_SUNDAY_HDR: RIDER_SUNDAY_HDR, WEEKLY_RIDER_NOTES_HDR: RIDER_NOTES_HDR}, inplace=True)
         weekly_riders = weekly_riders[weekly_riders[RIDER_PHONE_HDR] != np.nan] # remove lines that have been deleted
     if len(permanent_riders.index) > 0:
@@ -72,34 +215,98 @@ def get_cached_input() -> Tuple[pd.DataFrame, pd.DataFrame]:
     return (drivers, riders)
 
 
+@profiling.profiled('write output')
 def write_assignments(assignments: pd.DataFrame, update: bool):
     """Write the given dataframe to the output file. If update is True, write to final Google Sheet.
     """
     logging.info('Writing assignments')
-    # write to pickle
-    assignments.to_pickle(os.path.join(DATA_PATH, OUTPUT_SHEET_KEY))
+    prev = get_cached_output() if update and not ARGS[PARAM_REWRITE] and _is_output_uploaded() else None
+
+    # write to cache
+    cache.write(OUTPUT_SHEET_KEY, assignments)
+    _set_output_uploaded(False)
 
     if update:
-        with open(SHEET_IDS_FILE) as gid_json:
+        import gspread
+
+        with open(cfg.cfg_path(SHEET_IDS_FILE)) as gid_json:
             gid_data = json.load(gid_json)
 
         # connect Google Sheets
-        gc = gspread.service_account(filename=SERVICE_ACCT_FILE)
+        gc = gspread.service_account(filename=cfg.cfg_path(SERVICE_ACCT_FILE))
         ws = gc.open_by_key(gid_data[OUTPUT_SHEET_KEY]).get_worksheet(0)
 
-        ws.resize(rows=len(assignments))
         logging.info('Uploading assignments')
-        ws.update([assignments.columns.values.tolist()] + assignments.values.tolist())
+        upload_assignments(ws, assignments, prev)
+        _set_output_uploaded(True)
+
+
+def upload_assignments(ws, assignments: pd.DataFrame, prev: pd.DataFrame = None) -> int:
+    """Uploads the assignments to the output worksheet, rewriting only the cells that differ from prev, the sheet as it was last uploaded.
+    The changed cells are grouped into row blocks and sent in one batch_update. Without prev, the whole sheet is rewritten.
+    Returns the number of cells sent.
+    """
+    values = [assignments.columns.values.tolist()] + assignments.values.tolist()
+    if prev is None or prev.columns.tolist() != assignments.columns.tolist():
+        ws.resize(rows=len(values))
+        ws.update(values)
+        return len(values) * len(assignments.columns)
+
+    if len(prev.index) != len(assignments.index):
+        ws.resize(rows=len(values))
+
+    # Compare the cells as the sheet displays them
+    old = np.vstack([prev.columns.to_numpy(dtype=str), prev.fillna('').astype(str).to_numpy(dtype=str)])
+    new = np.vstack([assignments.columns.to_numpy(dtype=str), assignments.fillna('').astype(str).to_numpy(dtype=str)])
+    changed = np.ones(new.shape, dtype=bool)
+    overlap = min(len(old), len(new))
+    changed[:overlap] = old[:overlap] != new[:overlap]
+
+    data = [{'range': block_range, 'values': [row[start:end] for row in values[first:last]]} for (block_range, first, last, start, end) in _changed_blocks(changed)]
+    if len(data) > 0:
+        ws.batch_update(data)
+    logging.info(f'Updated {int(changed.sum())} changed cells in {len(data)} ranges')
+    return sum(len(block['values']) * len(block['values'][0]) for block in data)
+
+
+def _changed_blocks(changed: np.ndarray) -> list[tuple[str, int, int, int, int]]:
+    """Groups the changed cells into blocks of consecutive rows sharing the same span of columns.
+    Returns the A1 range, first row, end row, first column and end column of each block, 0-indexed and exclusive at the end.
+    """
+    blocks = []
+    for row in np.flatnonzero(changed.any(axis=1)):
+        cols = np.flatnonzero(changed[row])
+        (start, end) = (int(cols[0]), int(cols[-1]) + 1)
+        if len(blocks) > 0 and blocks[-1][1] == row and blocks[-1][2:] == [start, end]:
+            blocks[-1][1] = row + 1
+        else:
+            blocks.append([int(row), int(row) + 1, start, end])
+    return [(f'{_col_letter(start + 1)}{first + 1}:{_col_letter(end)}{last}', first, last, start, end) for (first, last, start, end) in blocks]
+
+
+def _is_output_uploaded() -> bool:
+    """Checks if the cached output is what the output sheet holds, either downloaded from it or uploaded to it.
+    """
+    return os.path.isfile(cfg.data_path(f'{OUTPUT_SHEET_KEY}.uploaded'))
+
+
+def _set_output_uploaded(is_uploaded: bool):
+    path = cfg.data_path(f'{OUTPUT_SHEET_KEY}.uploaded')
+    if is_uploaded:
+        open(path, 'w').close()
+    elif os.path.isfile(path):
+        os.remove(path)
 
 
 def get_cached_output() -> pd.DataFrame:
     """Get the assignments that were calculated from the last grouping.
     """
-    with open(os.path.join(DATA_PATH, OUTPUT_SHEET_KEY), 'rb') as out:
-        return pd.DataFrame(pickle.load(out))
+    return cache.read(OUTPUT_SHEET_KEY)
 
 
 def update_drivers_locally(drivers_df: pd.DataFrame):
-    """Write the given dataframe to the drivers pickle file.
+    """Write the given dataframe to the drivers cache.
+    The cache no longer mirrors the sheet, so the next download fetches all drivers.
     """
-    drivers_df.to_pickle(os.path.join(DATA_PATH, DRIVER_SHEET_KEY))
\ No newline at end of file
+    cache.write(DRIVER_SHEET_KEY, drivers_df.drop(columns=[TMP_DRIVER_PHONE], errors='ignore'))
+    _clear_sync_state(DRIVER_SHEET_KEY)
\ No newline at end of file
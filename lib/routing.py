@@ -0,0 +1,152 @@
+"""Orders the pickups of every car along the shortest route over the map distances.
+"""
+
+import cfg
+from cfg.config import *
+import hashlib
+import itertools
+import json
+import logging
+import numpy as np
+import os
+import pandas as pd
+
+
+def order_pickups(out: pd.DataFrame):
+    """Numbers the riders of every car in the order the driver picks them up, in the pickup order column.
+    Riders at the same location share a number, riders outside the map are picked up last, and riders without a car get none.
+    """
+    order = np.full(len(out.index), np.nan)
+    is_assigned = out[OUTPUT_DRIVER_PHONE_HDR].notna().to_numpy()
+    codes = np.array([LOC_MAP.get(loc.strip().lower(), LOC_NONE) for loc in out[RIDER_LOCATION_HDR]], dtype=object)
+    cars = out[DRIVER_GROUP_HDR].astype(str) + '/' + out[OUTPUT_DRIVER_PHONE_HDR].astype(str)
+
+    digest = _dist_digest()
+    new_routes = _load_routes(digest)
+    for rows in pd.Series(np.arange(len(out.index)))[is_assigned].groupby(cars[is_assigned].to_numpy()).groups.values():
+        rows = np.asarray(rows)
+        stops = sorted({code for code in codes[rows] if code != LOC_NONE})
+        route = find_route(stops)
+        stop_num = {code: num for num, code in enumerate(route, start=1)}
+        order[rows] = [stop_num.get(code, len(route) + 1) for code in codes[rows]]
+    if new_routes < len(LOC_ROUTES):
+        _save_routes(digest)
+    out[OUTPUT_PICKUP_ORDER_HDR] = order
+
+
+def find_route(stops: list[int]) -> tuple[int]:
+    """Returns the pickup locations in the order of the shortest route through them, memoized by the set of locations.
+    Routes with up to ROUTE_EXACT_MAX stops are exact, longer ones are improved from the nearest neighbor route.
+    """
+    key = tuple(sorted(stops))
+    if key not in LOC_ROUTES:
+        dist = _stop_dist(key)
+        if len(key) <= ROUTE_EXACT_MAX:
+            order = _exact_route(dist)
+        else:
+            order = _two_opt(dist, _nearest_neighbor_route(dist))
+        # Routes start from the end closest to the top of map.txt
+        if len(order) > 1 and min(LOC_INDEX.get(key[order[-1]], [0])) < min(LOC_INDEX.get(key[order[0]], [0])):
+            order = order[::-1]
+        LOC_ROUTES[key] = tuple(key[i] for i in order)
+    return LOC_ROUTES[key]
+
+
+def _stop_dist(stops: tuple[int]) -> np.ndarray:
+    """Returns the distances between the stops, which are the closest areas of their route codes.
+    """
+    dist = np.full((len(stops), len(stops)), MAX_ROUTE_DIST, dtype=np.int64)
+    for i, code_i in enumerate(stops):
+        for j, code_j in enumerate(stops):
+            (areas_i, areas_j) = (LOC_INDEX.get(code_i, []), LOC_INDEX.get(code_j, []))
+            if len(areas_i) > 0 and len(areas_j) > 0:
+                dist[i, j] = min(LOC_DIST[a][b] for a in areas_i for b in areas_j)
+    return dist
+
+
+def _route_len(dist: np.ndarray, order: list[int]) -> int:
+    return int(sum(dist[a, b] for a, b in zip(order, order[1:])))
+
+
+def _exact_route(dist: np.ndarray) -> list[int]:
+    """Returns the shortest path through every stop, with the Held-Karp dynamic program over subsets of stops.
+    """
+    n = len(dist)
+    if n <= 2:
+        return list(range(n))
+
+    # best[(subset, last)] = (length of the shortest path through subset ending at last, previous stop)
+    best = {(1 << i, i): (0, -1) for i in range(n)}
+    for size in range(2, n + 1):
+        for subset in itertools.combinations(range(n), size):
+            bits = sum(1 << i for i in subset)
+            for last in subset:
+                prev_bits = bits & ~(1 << last)
+                best[(bits, last)] = min((best[(prev_bits, prev)][0] + dist[prev, last], prev) for prev in subset if prev != last)
+
+    full = (1 << n) - 1
+    last = min(range(n), key=lambda i: (best[(full, i)][0], i))
+    order = []
+    bits = full
+    while last >= 0:
+        order.append(last)
+        (bits, last) = (bits & ~(1 << last), best[(bits, last)][1])
+    return order[::-1]
+
+
+def _nearest_neighbor_route(dist: np.ndarray) -> list[int]:
+    """Returns the shortest of the routes that always go to the closest stop left, trying every stop as the first.
+    """
+    n = len(dist)
+    routes = []
+    for start in range(n):
+        order = [start]
+        left = set(range(n)) - {start}
+        while len(left) > 0:
+            order.append(min(left, key=lambda i: (dist[order[-1], i], i)))
+            left.remove(order[-1])
+        routes.append(order)
+    return min(routes, key=lambda order: _route_len(dist, order))
+
+
+def _two_opt(dist: np.ndarray, order: list[int]) -> list[int]:
+    """Reverses segments of the route while that makes it shorter.
+    """
+    improved = True
+    while improved:
+        improved = False
+        for i in range(len(order) - 1):
+            for j in range(i + 2, len(order) + 1):
+                candidate = order[:i] + order[i:j][::-1] + order[j:]
+                if _route_len(dist, candidate) < _route_len(dist, order):
+                    (order, improved) = (candidate, True)
+    return order
+
+
+def _dist_digest() -> str:
+    return hashlib.sha256(np.array(LOC_DIST, dtype=np.int64).tobytes()).hexdigest()
+
+
+def _load_routes(digest: str) -> int:
+    """Loads the routes saved for the same map distances, if none are in memory yet. Returns how many routes are in memory.
+    """
+    path = cfg.data_path(LOC_ROUTES_FILE)
+    if len(LOC_ROUTES) == 0 and os.path.isfile(path):
+        try:
+            with open(path) as routes_file:
+                saved = json.load(routes_file)
+            if saved['digest'] == digest:
+                LOC_ROUTES.update({tuple(stops): tuple(route) for (stops, route) in saved['routes']})
+        except (OSError, ValueError, KeyError, TypeError):
+            logging.debug(f'Ignoring unreadable {LOC_ROUTES_FILE}')
+    return len(LOC_ROUTES)
+
+
+def _save_routes(digest: str):
+    path = cfg.data_path(LOC_ROUTES_FILE)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as routes_file:
+            json.dump({'digest': digest, 'routes': [[list(stops), list(route)] for (stops, route) in LOC_ROUTES.items()]}, routes_file)
+    except OSError as e:
+        logging.debug(f'Could not save {LOC_ROUTES_FILE}: {e}')
@@ -1,49 +1,73 @@
 """Includes setup routines necessary to run the assignment algorithm.
 """
 
+import cfg
 from cfg.config import *
+import lib.history as history
 import lib.rides_data as data
 import lib.trace as trace
+import lib.validation as prep
 import logging
 import pandas as pd
-from sqlite3 import Timestamp
+import re
 
 
 #############################################################################
 ##                                 COMMON                                  ##
 #############################################################################
 def mark_unused_drivers(drivers_df: pd.DataFrame):
-    """Set timestamps of drivers that were not used the previous week.
+    """Set timestamps of drivers that did not drive in the last run, the ones who drove the fewest times first.
     """
-    prev_out = data.get_cached_output()
-    driver_nums = _get_prev_driver_phones(prev_out)
-
-    now = Timestamp.now()
-    for idx in drivers_df.index:
-        driver_phone = drivers_df.at[idx, DRIVER_PHONE_HDR]
-        if driver_phone not in driver_nums:
-            drivers_df.at[idx, DRIVER_TIMESTAMP_HDR] = now
+    phones = drivers_df[TMP_DRIVER_PHONE]
+    (latest, loads) = history.lookup(phones)
+    if latest is None:
+        # Nothing recorded yet, so fall back to the drivers of the cached output
+        is_unused = ~phones.isin(_get_prev_driver_phones(data.get_cached_output()))
+    else:
+        is_unused = phones.map(loads['last_run']) != latest
 
+    drivers_df.loc[is_unused, DRIVER_TIMESTAMP_HDR] = pd.Timestamp.now() - _load_offsets(phones[is_unused], loads)
     logging.info('Rotating drivers')
 
 
-def _get_prev_driver_phones(prev_out: pd.DataFrame) -> set:
-    """Returns all the phone numbers of the drivers from the previous grouping.
+def _load_offsets(phones: pd.Series, loads: pd.DataFrame) -> pd.Series:
+    """Returns a millisecond for every run each driver drove in, to order drivers given the same timestamp by their load.
+    """
+    return pd.to_timedelta(phones.map(loads['drives']).fillna(0).astype(int), unit='ms')
+
+
+def _get_prev_driver_phones(prev_out: pd.DataFrame) -> set[int]:
+    """Returns the phone keys of all the drivers from the previous grouping.
     """
-    phone_nums = set()
-    if len(prev_out.index) > 0:
-        for phone in prev_out[OUTPUT_DRIVER_PHONE_HDR]:
-            phone_nums.add(str(phone))
-    return phone_nums
+    if len(prev_out.index) == 0:
+        return set()
+    return set(prep.phone_keys(prev_out[OUTPUT_DRIVER_PHONE_HDR]).tolist()) - {0}
+
+
+def get_prev_groups(prev_out: pd.DataFrame) -> dict[int, int]:
+    """Returns the phone key of the driver of every rider in the previous grouping, by the phone key of the rider, read
+    back from the formatted output. Riders without a driver are left out.
+    """
+    if len(prev_out.index) == 0:
+        return {}
+
+    # Only the first rider of each car lists the driver, the rest of the car is blank
+    driver_phones = prev_out[OUTPUT_DRIVER_PHONE_HDR].fillna('').astype(str).str.strip()
+    driver_keys = prep.phone_keys(driver_phones.mask(driver_phones == '').ffill())
+    rider_keys = prep.phone_keys(prev_out[RIDER_PHONE_HDR])
+    is_assigned = (rider_keys != 0) & (driver_keys != 0)
+    return dict(zip(rider_keys[is_assigned].tolist(), driver_keys[is_assigned].tolist()))
 
 
 def prioritize_drivers_with_preferences(drivers_df: pd.DataFrame, riders_df: pd.DataFrame):
-    _mark_drivers_with_preferences(drivers_df, riders_df)
+    (_, loads) = history.lookup(drivers_df[TMP_DRIVER_PHONE])
+    _mark_drivers_with_preferences(drivers_df, riders_df, loads)
     drivers_df.sort_values(by=DRIVER_TIMESTAMP_HDR, inplace=True, ascending=False)
 
 
-def _mark_drivers_with_preferences(drivers_df: pd.DataFrame, riders_df: pd.DataFrame):
+def _mark_drivers_with_preferences(drivers_df: pd.DataFrame, riders_df: pd.DataFrame, loads: pd.DataFrame):
     """Set timestamp of drivers with location preferences, if those preferences will be useful.
+    Among them, the drivers who drove the fewest times are first.
     """
     # First, count how many riders are at each location
     loc_freq = {}
@@ -55,13 +79,14 @@ def _mark_drivers_with_preferences(drivers_df: pd.DataFrame, riders_df: pd.DataF
         loc_freq[loc_bit] = loc_freq.get(loc_bit, 0) + 1
 
     # Then, if a driver prefers that location, mark their timestamp to sort them to the top
-    now = Timestamp.now() + pd.Timedelta(seconds=1)
+    now = pd.Timestamp.now() + pd.Timedelta(seconds=1)
+    offsets = _load_offsets(drivers_df[TMP_DRIVER_PHONE], loads)
 
     for idx in drivers_df.index:
         driver_loc_bit = drivers_df.at[idx, TMP_DRIVER_PREF_LOC]
         if driver_loc_bit != LOC_NONE and loc_freq[driver_loc_bit] > 0:
             loc_freq[driver_loc_bit] -= drivers_df.at[idx, DRIVER_CAPACITY_HDR]
-            drivers_df.at[idx, DRIVER_TIMESTAMP_HDR] = now
+            drivers_df.at[idx, DRIVER_TIMESTAMP_HDR] = now - offsets[idx]
 
 
 def fetch_necessary_drivers(drivers_df: pd.DataFrame, cnt_riders: int) -> pd.DataFrame:
@@ -92,8 +117,9 @@ def add_assignment_vars(drivers_df: pd.DataFrame):
     """Adds temporary columns to the dataframes for calculating assignments.
     """
     drivers_df[DRIVER_OPENINGS_HDR] = drivers_df[DRIVER_CAPACITY_HDR]
-    drivers_df[DRIVER_ROUTE_HDR] = LOC_NONE
-    drivers_df[TMP_DRIVER_PREF_LOC] = LOC_NONE
+    # Route codes have a bit per map area, which may not fit in 64 bits
+    drivers_df[DRIVER_ROUTE_HDR] = pd.Series(LOC_NONE, index=drivers_df.index, dtype=object)
+    drivers_df[TMP_DRIVER_PREF_LOC] = pd.Series(LOC_NONE, index=drivers_df.index, dtype=object)
 
     # Load driver location preferences
     cnt_pref = 0
@@ -124,29 +150,53 @@ def create_rider_map(riders_df: pd.DataFrame):
 
 
 def _ignore_drivers(drivers_df: pd.DataFrame):
-    remove = drivers_df[drivers_df[DRIVER_NOTES_HDR].str.lower().str.contains(IGNORE_KEYWORD)]
-    logging.info(f'Ignoring {len(remove.index)} drivers')
-    drivers_df.drop(remove.index, inplace=True)
+    """Drops the drivers labeled "ignore" in their notes, and the drivers listed in ignore_drivers.txt.
+    """
+    is_ignored = drivers_df[DRIVER_NOTES_HDR].str.lower().str.contains(IGNORE_KEYWORD, regex=False) | _is_listed(drivers_df[DRIVER_NAME_HDR], drivers_df[TMP_DRIVER_PHONE], IGNORED_DRIVERS)
+    logging.info(f'Ignoring {int(is_ignored.sum())} drivers')
+    drivers_df.drop(drivers_df.index[is_ignored], inplace=True)
 
 
 def _ignore_riders(riders_df: pd.DataFrame):
-    remove = riders_df[riders_df[RIDER_NOTES_HDR].str.lower().str.contains(IGNORE_KEYWORD)]
-    logging.info(f'Ignoring {len(remove.index)} riders')
-    riders_df.drop(remove.index, inplace=True)
+    """Drops the riders labeled "ignore" in their notes, and the riders listed in ignore_riders.txt.
+    """
+    is_ignored = riders_df[RIDER_NOTES_HDR].str.lower().str.contains(IGNORE_KEYWORD, regex=False) | _is_listed(riders_df[RIDER_NAME_HDR], riders_df[TMP_RIDER_PHONE], IGNORED_RIDERS)
+    logging.info(f'Ignoring {int(is_ignored.sum())} riders')
+    riders_df.drop(riders_df.index[is_ignored], inplace=True)
+
+
+def _is_listed(names: pd.Series, phones: pd.Series, people: set[tuple[str, int]]) -> pd.Series:
+    """Returns whether each person is in the set of (name, phone key) pairs.
+    """
+    if len(people) == 0:
+        return pd.Series(False, index=names.index)
+    return pd.Series([person in people for person in zip(names.map(cfg.normalize_name), phones)], index=names.index, dtype=bool)
+
+
+def _apply_driver_preferences(drivers_df: pd.DataFrame):
+    """Fills in the preferred location from driver_preferences.csv for the drivers who did not give one in the sheet.
+    """
+    if len(DRIVER_PREFS) == 0:
+        return
+    listed = drivers_df[TMP_DRIVER_PHONE].map({key: loc for (key, (loc, _)) in DRIVER_PREFS.items() if loc != ''})
+    is_filled = (drivers_df[DRIVER_PREF_LOC_HDR].str.strip() == '') & listed.notna()
+    drivers_df.loc[is_filled, DRIVER_PREF_LOC_HDR] = listed[is_filled]
 
 
 def _drop_invalid(drivers_df: pd.DataFrame, riders_df: pd.DataFrame):
-    drivers_df.drop(drivers_df[ drivers_df[DRIVER_PHONE_HDR] == '' ].index, inplace=True)
-    drivers_df.drop_duplicates(subset=DRIVER_PHONE_HDR, inplace=True, keep='last')
+    """Drops drivers and riders without a phone number, and all but the last sign up of each phone number.
+    Phone numbers are compared by their keys, so the same number written differently is a duplicate.
+    """
+    drivers_df.drop(drivers_df.index[(drivers_df[TMP_DRIVER_PHONE] == 0) | drivers_df.duplicated(TMP_DRIVER_PHONE, keep='last')], inplace=True)
 
-    riders_df_no_phone = riders_df[riders_df[RIDER_PHONE_HDR] == '']
-    trace.warn_rider_no_phone(riders_df_no_phone)
-    riders_df.drop(riders_df_no_phone.index, inplace=True)
+    has_no_phone = riders_df[TMP_RIDER_PHONE] == 0
+    trace.warn_rider_no_phone(riders_df[has_no_phone])
+    riders_df.drop(riders_df.index[has_no_phone], inplace=True)
 
-    riders_df.sort_values(by=RIDER_TIMESTAMP_HDR, inplace=True)
-    riders_df_dup_phone = riders_df[riders_df.duplicated([RIDER_PHONE_HDR], keep=False)]
-    trace.warn_rider_dup_phone(riders_df_dup_phone)
-    riders_df.drop_duplicates(subset=RIDER_PHONE_HDR, inplace=True, keep='last')
+    riders_df.sort_values(by=RIDER_TIMESTAMP_HDR, inplace=True, kind='stable')
+    is_dup = riders_df.duplicated(TMP_RIDER_PHONE, keep=False)
+    trace.warn_rider_dup_phone(riders_df[is_dup])
+    riders_df.drop(riders_df.index[riders_df.duplicated(TMP_RIDER_PHONE, keep='last')], inplace=True)
     # keep the timestamp until we filter any outdated duplicates
     riders_df.drop(columns=[RIDER_TIMESTAMP_HDR], inplace=True)
 
@@ -168,6 +218,7 @@ def filter_friday(drivers_df: pd.DataFrame, riders_df: pd.DataFrame) -> tuple[pd
     _ignore_riders(riders)
 
     _drop_invalid(drivers, riders)
+    _apply_driver_preferences(drivers)
 
     num_riders = len(riders.index)
     riders = riders[~riders[RIDER_LOCATION_HDR].str.strip().str.lower().isin(CAMPUS_LOCS)]  # ~ negates isin(), removes campus ppl
@@ -178,29 +229,26 @@ def filter_friday(drivers_df: pd.DataFrame, riders_df: pd.DataFrame) -> tuple[pd
 
 
 def _mark_late_friday_riders(riders_df: pd.DataFrame):
-    """Marks late CL riders by assigning them to the CAMPUS location.
+    """Marks late CL riders by assigning them to the CAMPUS location, and to the late service their notes ask for.
     Assumes that they are late because of a class.
     """
-    for idx in riders_df.index:
-        note = riders_df.at[idx, RIDER_NOTES_HDR].lower()
-        if 'late' in note or '6' in note or '7' in note:
-            riders_df.at[idx, RIDER_LOCATION_HDR] = CAMPUS
+    regular = next(iter(SERVICES))
+    riders_df[RIDER_SERVICE_HDR] = _parse_services(riders_df[RIDER_NOTES_HDR], regular)
+    riders_df.loc[riders_df[RIDER_SERVICE_HDR] != regular, RIDER_LOCATION_HDR] = CAMPUS
 
 
-def split_friday_late_cars(drivers_df: pd.DataFrame, riders_df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
-    """Separates rides for late riders. Also designates drivers for the late riders.
+def split_friday_late_cars(drivers_df: pd.DataFrame, riders_df: pd.DataFrame) -> dict[str, tuple[pd.DataFrame, pd.DataFrame]]:
+    """Separates rides for late riders. Also designates drivers for the late riders, from the top of the list, for each
+    late service in order. The rest of the drivers take the regular service.
     """
-    riders1 = riders_df[~riders_df[RIDER_LOCATION_HDR].str.contains(CAMPUS)].copy()
-    riders2 = riders_df[riders_df[RIDER_LOCATION_HDR].str.contains(CAMPUS)].copy()
-
-    late_driver_cnt = _find_driver_cnt(drivers_df, len(riders2))
-    drivers1 = drivers_df[late_driver_cnt:].copy()
-    drivers2 = drivers_df[:late_driver_cnt].copy()
-
-    drivers1[DRIVER_GROUP_HDR] = 1
-    drivers2[DRIVER_GROUP_HDR] = 2
-
-    return (drivers1, riders1, drivers2, riders2)
+    services = list(SERVICES)
+    drivers_df[DRIVER_GROUP_HDR] = services[0]
+    start = 0
+    for service in services[1:]:
+        late_driver_cnt = _find_driver_cnt(drivers_df[start:], int((riders_df[RIDER_SERVICE_HDR] == service).sum()))
+        drivers_df.iloc[start:start + late_driver_cnt, drivers_df.columns.get_loc(DRIVER_GROUP_HDR)] = service
+        start += late_driver_cnt
+    return partition_services(drivers_df, riders_df)
 
 
 
@@ -220,52 +268,51 @@ def filter_sunday(drivers_df: pd.DataFrame, riders_df: pd.DataFrame) -> tuple[pd
     _ignore_riders(riders)
 
     _drop_invalid(drivers, riders)
+    _apply_driver_preferences(drivers)
 
     return (drivers, riders)
 
 
-def split_sunday_services(drivers_df: pd.DataFrame, riders_df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
-    """Splits the lists into first and second service lists.
-    @returns (drivers1, riders1, drivers2, riders2)
+def split_sunday_services(drivers_df: pd.DataFrame, riders_df: pd.DataFrame) -> dict[str, tuple[pd.DataFrame, pd.DataFrame]]:
+    """Splits the lists by the service each driver and rider will attend.
+    @returns {service: (drivers, riders)}
     """
     _add_service_vars(drivers_df, riders_df)
-    drivers1 = drivers_df[drivers_df[DRIVER_GROUP_HDR] == ARG_FIRST_SERVICE].copy()
-    drivers2 = drivers_df[drivers_df[DRIVER_GROUP_HDR] == ARG_SECOND_SERVICE].copy()
-    riders1  = riders_df[riders_df[RIDER_SERVICE_HDR] == ARG_FIRST_SERVICE].copy()
-    riders2  = riders_df[riders_df[RIDER_SERVICE_HDR] == ARG_SECOND_SERVICE].copy()
-    return (drivers1, riders1, drivers2, riders2)
+    return partition_services(drivers_df, riders_df)
 
 
-def _add_service_vars(drivers_df: pd.DataFrame, riders_df: pd.DataFrame):
-    """Adds temporary columns to the dataframes for splitting between first and second service.
+def partition_services(drivers_df: pd.DataFrame, riders_df: pd.DataFrame) -> dict[str, tuple[pd.DataFrame, pd.DataFrame]]:
+    """Splits the drivers by their group and the riders by their service, in the order of the services of the day.
+    Every service of the day is included even if it is empty, followed by any other service that was asked for.
+    @returns {service: (drivers, riders)}
     """
-    drivers_df[DRIVER_GROUP_HDR] = 0
-    for idx in drivers_df.index:
-        drivers_df.at[idx, DRIVER_GROUP_HDR] = _parse_service(drivers_df.at[idx, DRIVER_NOTES_HDR])
-
-    riders_df[RIDER_SERVICE_HDR] = 0
-    for idx in riders_df.index:
-        riders_df.at[idx, RIDER_SERVICE_HDR] = _parse_service(riders_df.at[idx, RIDER_NOTES_HDR])
+    driver_services = drivers_df[DRIVER_GROUP_HDR].astype(str)
+    rider_services = riders_df[RIDER_SERVICE_HDR].astype(str)
+    services = list(SERVICES) + sorted((set(driver_services) | set(rider_services)) - set(SERVICES))
+    return {service: (drivers_df[driver_services == service].copy(), riders_df[rider_services == service].copy()) for service in services}
 
 
-def _parse_service(s: str) -> str:
-    """Returns the service that a rider will attend.
-    If both services are mentioned, first service is used. This is an arbitrary choice that should be checked by the rides coordinator.
-    If no service is mentioned, the rider is assigned to the default service.
+def _add_service_vars(drivers_df: pd.DataFrame, riders_df: pd.DataFrame):
+    """Adds temporary columns to the dataframes for splitting between services.
     """
-    if _requested_first_service(s):
-        return ARG_FIRST_SERVICE
-    elif _requested_second_service(s):
-        return ARG_SECOND_SERVICE
-    else:
-        return ARGS[PARAM_SERVICE]
+    # Drivers without a service in their notes go to the service in driver_preferences.csv, if any
+    pref_services = drivers_df[TMP_DRIVER_PHONE].map({key: service for (key, (_, service)) in DRIVER_PREFS.items() if service != ''})
+    drivers_df[DRIVER_GROUP_HDR] = _parse_services(drivers_df[DRIVER_NOTES_HDR], pref_services.fillna(ARGS[PARAM_SERVICE]))
+    riders_df[RIDER_SERVICE_HDR] = _parse_services(riders_df[RIDER_NOTES_HDR], ARGS[PARAM_SERVICE])
 
 
-def _requested_first_service(s: str) -> bool:
-    s = s.lower()
-    return 'first' in s or '1st' in s or '8' in s
-
-
-def _requested_second_service(s: str) -> bool:
-    s = s.lower()
-    return 'second' in s or '2nd' in s or '10' in s or '11' in s
\ No newline at end of file
+def _parse_services(notes: pd.Series, default) -> pd.Series:
+    """Returns the service that each rider will attend, the first service of the day whose words are in their notes.
+    If several services are mentioned, the earlier one is used. This is an arbitrary choice that should be checked by the rides coordinator.
+    If no service is mentioned, the rider is assigned to the default service, which may differ for each rider.
+    """
+    notes = notes.astype(str).str.lower()
+    services = pd.Series(default, index=notes.index, dtype=object)
+    is_parsed = pd.Series(False, index=notes.index)
+    for (service, keywords) in SERVICES.items():
+        if len(keywords) == 0:
+            continue
+        is_service = ~is_parsed & notes.str.contains('|'.join(re.escape(keyword) for keyword in keywords))
+        services[is_service] = service
+        is_parsed |= is_service
+    return services
@@ -0,0 +1,85 @@
+"""Spatial index over pickup locations with coordinates.
+"""
+
+import math
+import numpy as np
+
+### Kilometers per degree of latitude
+KM_PER_DEGREE = 110.57
+
+
+def project(lat_lon: np.ndarray) -> np.ndarray:
+    """Returns the latitudes and longitudes as kilometers on a plane, which is accurate enough across a city.
+    """
+    lat_lon = np.asarray(lat_lon, dtype=float).reshape(-1, 2)
+    if len(lat_lon) == 0:
+        return lat_lon
+    scale = math.cos(math.radians(lat_lon[:, 0].mean()))
+    return np.column_stack([lat_lon[:, 1] * KM_PER_DEGREE * scale, lat_lon[:, 0] * KM_PER_DEGREE])
+
+
+class GridIndex:
+    """Uniform grid over 2-D points for nearest and within-radius queries.
+
+    Points are bucketed into square cells, so a query only looks at the cells around it instead of every point.
+    """
+
+    def __init__(self, points: np.ndarray, cell: float):
+        self.points = np.asarray(points, dtype=float).reshape(-1, 2)
+        self.cell = cell
+        self.cells = {}
+        keys = self._cell_of(self.points)
+        for i, key in enumerate(keys.tolist()):
+            self.cells.setdefault(tuple(key), []).append(i)
+        # Corner cells of the points, which bound how far a nearest query searches
+        self.bounds = (keys.min(axis=0), keys.max(axis=0)) if len(keys) > 0 else None
+
+    def _cell_of(self, points: np.ndarray) -> np.ndarray:
+        return np.floor(np.asarray(points, dtype=float) / self.cell).astype(np.int64)
+
+    def _ring(self, center: tuple[int, int], r: int) -> list[int]:
+        """Returns the points in the cells exactly r cells away from the center cell.
+        """
+        (cx, cy) = center
+        if r == 0:
+            return list(self.cells.get((cx, cy), []))
+        found = []
+        for dx in range(-r, r + 1):
+            for dy in ((-r, r) if abs(dx) < r else range(-r, r + 1)):
+                found += self.cells.get((cx + dx, cy + dy), [])
+        return found
+
+    def within(self, point: np.ndarray, radius: float) -> list[int]:
+        """Returns the indices of the points at most radius away, in index order.
+        """
+        center = tuple(self._cell_of(point).tolist())
+        candidates = []
+        for r in range(math.ceil(radius / self.cell) + 1):
+            candidates += self._ring(center, r)
+        if len(candidates) == 0:
+            return []
+        candidates = np.sort(np.array(candidates))
+        dist = np.hypot(*(self.points[candidates] - point).T)
+        return candidates[dist <= radius].tolist()
+
+    def nearest(self, point: np.ndarray, exclude: int = -1) -> int:
+        """Returns the index of the point closest to the given one, other than exclude, or -1 if there is none.
+        """
+        if self.bounds is None:
+            return -1
+        center = self._cell_of(point)
+        max_r = int(np.abs(np.concatenate([self.bounds[0] - center, self.bounds[1] - center])).max())
+        center = tuple(center.tolist())
+        (best, best_dist) = (-1, math.inf)
+        for r in range(max_r + 1):
+            # Points in farther rings are at least (r - 1) cells away
+            if best >= 0 and (r - 1) * self.cell > best_dist:
+                break
+            candidates = sorted(i for i in self._ring(center, r) if i != exclude)
+            if len(candidates) == 0:
+                continue
+            dist = np.hypot(*(self.points[candidates] - point).T)
+            i = int(np.argmin(dist))
+            if dist[i] < best_dist or (dist[i] == best_dist and candidates[i] < best):
+                (best, best_dist) = (candidates[i], float(dist[i]))
+        return best
@@ -0,0 +1,119 @@
+"""Generates synthetic maps, rider responses and driver responses for benchmarking the assignments.
+The frames have the same columns as the Google Sheets, so they can be written to the cache and run through the whole pipeline.
+"""
+
+from cfg.config import *
+import json
+import lib.cache as cache
+import numpy as np
+import os
+import pandas as pd
+
+FRIDAY_NOTES = ['', '', '', 'late', 'running late, class until 7']
+SUNDAY_NOTES = ['', '', '', '1st service', 'second service', 'ignore']
+DRIVER_NOTES = ['', '', '', 'first service', '2nd service', 'ignore']
+
+
+def make_map(areas: int, rng: np.random.Generator) -> list[list[str]]:
+    """Returns the lines of a map.txt with the given number of areas, one list of locations per line.
+    Empty lines space out the neighborhoods, and some areas have more than one location.
+    """
+    lines = []
+    for area in range(areas):
+        if area > 0 and rng.random() < 0.15:
+            lines.append([])
+        lines.append([f'Loc {area}'] + [f'Loc {area}{suffix}' for suffix in 'bc'[:rng.integers(0, 3)]])
+    return lines
+
+
+def make_permanent_riders(cnt: int, locs: list[str], rng: np.random.Generator) -> pd.DataFrame:
+    return pd.DataFrame({
+        PERMANENT_RIDER_TIMESTAMP_HDR: _timestamps(cnt, rng),
+        PERMANENT_RIDER_NAME_HDR:      [f'Permanent {i}' for i in range(cnt)],
+        PERMANENT_RIDER_PHONE_HDR:     _phones(cnt, 8580000000, rng),
+        PERMANENT_RIDER_LOCATION_HDR:  _locations(cnt, locs, rng),
+        PERMANENT_RIDER_FRIDAY_HDR:    rng.choice(['Yes', ''], cnt, p=[0.4, 0.6]),
+        PERMANENT_RIDER_SUNDAY_HDR:    rng.choice(['Yes', ''], cnt, p=[0.8, 0.2]),
+        PERMANENT_RIDER_NOTES_HDR:     rng.choice(FRIDAY_NOTES + SUNDAY_NOTES, cnt),
+    })
+
+
+def make_weekly_riders(cnt: int, locs: list[str], rng: np.random.Generator) -> pd.DataFrame:
+    return pd.DataFrame({
+        WEEKLY_RIDER_TIMESTAMP_HDR: _timestamps(cnt, rng),
+        WEEKLY_RIDER_NAME_HDR:      [f'Weekly {i}' for i in range(cnt)],
+        WEEKLY_RIDER_PHONE_HDR:     _phones(cnt, 6190000000, rng),
+        WEEKLY_RIDER_LOCATION_HDR:  _locations(cnt, locs, rng),
+        WEEKLY_RIDER_FRIDAY_HDR:    rng.choice(['Ride there', 'Ride there and back', 'No ride'], cnt),
+        WEEKLY_RIDER_SUNDAY_HDR:    rng.choice(['Ride there and back', 'Ride back', 'No ride'], cnt),
+        WEEKLY_RIDER_NOTES_HDR:     rng.choice(FRIDAY_NOTES + SUNDAY_NOTES, cnt),
+    })
+
+
+def make_drivers(cnt: int, locs: list[str], rng: np.random.Generator) -> pd.DataFrame:
+    return pd.DataFrame({
+        DRIVER_TIMESTAMP_HDR:    _timestamps(cnt, rng),
+        DRIVER_NAME_HDR:         [f'Driver {i}' for i in range(cnt)],
+        DRIVER_PHONE_HDR:        _phones(cnt, 7600000000, rng),
+        DRIVER_CAPACITY_HDR:     rng.choice([2, 3, 4, 4, 4, 5, 6], cnt),
+        DRIVER_AVAILABILITY_HDR: rng.choice([DRIVER_SUNDAY_KEYWORD, DRIVER_FRIDAY_KEYWORD, f'{DRIVER_FRIDAY_KEYWORD}, {DRIVER_SUNDAY_KEYWORD}'], cnt),
+        DRIVER_PREF_LOC_HDR:     np.where(rng.random(cnt) < 0.1, rng.choice(locs, cnt), ''),
+        DRIVER_NOTES_HDR:        rng.choice(DRIVER_NOTES, cnt),
+    })
+
+
+def write_config(cfg_dir: str, data_dir: str, areas: int, permanent: int, weekly: int, drivers: int, seed: int = 0):
+    """Writes a map.txt, campus.txt and sheet_ids.json to cfg_dir, and caches the generated sheets in data_dir.
+    """
+    rng = np.random.default_rng(seed)
+    lines = make_map(areas, rng)
+    locs = [loc for line in lines for loc in line]
+
+    os.makedirs(cfg_dir, exist_ok=True)
+    with open(os.path.join(cfg_dir, MAP_FILE), 'w') as map_file:
+        map_file.write('# Synthetic map\n')
+        map_file.writelines(', '.join(line) + '\n' for line in lines)
+    with open(os.path.join(cfg_dir, CAMPUS_FILE), 'w') as campus_file:
+        campus_file.writelines(f'{loc}\n' for loc in rng.choice(locs, max(1, len(locs) // 10), replace=False))
+    with open(os.path.join(cfg_dir, SHEET_IDS_FILE), 'w') as gid_json:
+        json.dump({key: f'synthetic-{key}' for key in cache.CACHE_KEYS}, gid_json)
+
+    sheets = {
+        PERMANENT_SHEET_KEY: make_permanent_riders(permanent, locs, rng),
+        WEEKLY_SHEET_KEY:    make_weekly_riders(weekly, locs, rng),
+        DRIVER_SHEET_KEY:    make_drivers(drivers, locs, rng),
+        OUTPUT_SHEET_KEY:    pd.DataFrame(),
+    }
+    os.makedirs(data_dir, exist_ok=True)
+    prev_data_dir = ARGS.get(PARAM_DATA_DIR)
+    ARGS[PARAM_DATA_DIR] = data_dir
+    try:
+        for key, df in sheets.items():
+            cache.write(key, df)
+    finally:
+        if prev_data_dir is None:
+            del ARGS[PARAM_DATA_DIR]
+        else:
+            ARGS[PARAM_DATA_DIR] = prev_data_dir
+
+
+def _timestamps(cnt: int, rng: np.random.Generator) -> list[str]:
+    start = pd.Timestamp('2022-01-01')
+    stamps = start + pd.to_timedelta(rng.integers(0, 365 * 24 * 3600, cnt), unit='s')
+    return [f'{ts.month}/{ts.day}/{ts.year} {ts.hour}:{ts.minute:02d}:{ts.second:02d}' for ts in stamps]
+
+
+def _phones(cnt: int, base: int, rng: np.random.Generator) -> list[str]:
+    """Returns unique phone numbers, with a few duplicates and blanks like real responses.
+    """
+    phones = [str(base + i) for i in range(cnt)]
+    for i in np.flatnonzero(rng.random(cnt) < 0.01):
+        phones[i] = phones[rng.integers(0, cnt)] if rng.random() < 0.5 else ''
+    return phones
+
+
+def _locations(cnt: int, locs: list[str], rng: np.random.Generator) -> list[str]:
+    """Returns pickup locations, mostly from the map with inconsistent case, and a few that are not on it.
+    """
+    picks = rng.choice(locs + ['Off the map'], cnt, p=[0.97 / len(locs)] * len(locs) + [0.03])
+    return [loc.upper() if upper else loc for loc, upper in zip(picks, rng.random(cnt) < 0.1)]
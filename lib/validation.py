@@ -2,27 +2,33 @@
 """
 
 from cfg.config import *
+import numpy as np
 import pandas as pd
 
+### Standardized responses for attending the Friday/Sunday services
+RESPONSE_DTYPE = pd.CategoricalDtype([RIDE_THERE_KEYWORD, ''])
+
 
 def standardize_permanent_responses(riders_df: pd.DataFrame):
     """Standardize the permanent responses for Friday and Sunday rides.
     """
-    for idx in riders_df.index:
-        response = riders_df.at[idx, PERMANENT_RIDER_FRIDAY_HDR]
-        riders_df.at[idx, PERMANENT_RIDER_FRIDAY_HDR] = RIDE_THERE_KEYWORD if PERMANENT_RIDE_THERE_KEYWORD in response.lower() else ''
-        response = riders_df.at[idx, PERMANENT_RIDER_SUNDAY_HDR]
-        riders_df.at[idx, PERMANENT_RIDER_SUNDAY_HDR] = RIDE_THERE_KEYWORD if PERMANENT_RIDE_THERE_KEYWORD in response.lower() else ''
+    _standardize_responses(riders_df, [PERMANENT_RIDER_FRIDAY_HDR, PERMANENT_RIDER_SUNDAY_HDR], PERMANENT_RIDE_THERE_KEYWORD)
 
 
 def standardize_weekly_responses(riders_df: pd.DataFrame):
     """Standardize the weekly responses for Friday and Sunday rides.
     """
-    for idx in riders_df.index:
-        response = riders_df.at[idx, WEEKLY_RIDER_FRIDAY_HDR]
-        riders_df.at[idx, WEEKLY_RIDER_FRIDAY_HDR] = RIDE_THERE_KEYWORD if WEEKLY_RIDE_THERE_KEYWORD in response.lower() else ''
-        response = riders_df.at[idx, WEEKLY_RIDER_SUNDAY_HDR]
-        riders_df.at[idx, WEEKLY_RIDER_SUNDAY_HDR] = RIDE_THERE_KEYWORD if WEEKLY_RIDE_THERE_KEYWORD in response.lower() else ''
+    _standardize_responses(riders_df, [WEEKLY_RIDER_FRIDAY_HDR, WEEKLY_RIDER_SUNDAY_HDR], WEEKLY_RIDE_THERE_KEYWORD)
+
+
+def _standardize_responses(riders_df: pd.DataFrame, hdrs: list[str], keyword: str):
+    """Replaces the responses containing the keyword with RIDE_THERE_KEYWORD and all others with blanks.
+    """
+    if len(riders_df.index) == 0:
+        return
+    for hdr in hdrs:
+        wants_ride = riders_df[hdr].astype(str).str.lower().str.contains(keyword, regex=False).to_numpy()
+        riders_df[hdr] = pd.Categorical.from_codes(np.where(wants_ride, 0, 1), dtype=RESPONSE_DTYPE)
 
 
 def clean_data(drivers_df: pd.DataFrame, riders_df: pd.DataFrame):
@@ -34,11 +40,31 @@ def clean_data(drivers_df: pd.DataFrame, riders_df: pd.DataFrame):
 def _enforce_types(drivers_df: pd.DataFrame, riders_df: pd.DataFrame):
     """Recovers proper datatypes, allows type specific operations in the future
     """
-    drivers_df[DRIVER_TIMESTAMP_HDR] = pd.to_datetime(drivers_df[DRIVER_TIMESTAMP_HDR])
+    drivers_df[DRIVER_TIMESTAMP_HDR] = _to_datetime(drivers_df[DRIVER_TIMESTAMP_HDR])
     drivers_df[DRIVER_CAPACITY_HDR]  = drivers_df[DRIVER_CAPACITY_HDR].astype(int)
     drivers_df[DRIVER_PHONE_HDR]     = drivers_df[DRIVER_PHONE_HDR].astype(str)
+    drivers_df[TMP_DRIVER_PHONE]     = phone_keys(drivers_df[DRIVER_PHONE_HDR])
     drivers_df[DRIVER_PREF_LOC_HDR]  = drivers_df[DRIVER_PREF_LOC_HDR].astype(str)
     drivers_df[DRIVER_NOTES_HDR]     = drivers_df[DRIVER_NOTES_HDR].astype(str)
 
-    riders_df[RIDER_TIMESTAMP_HDR] = pd.to_datetime(riders_df[RIDER_TIMESTAMP_HDR])
-    riders_df[RIDER_PHONE_HDR]     = riders_df[RIDER_PHONE_HDR].astype(str)
\ No newline at end of file
+    riders_df[RIDER_TIMESTAMP_HDR] = _to_datetime(riders_df[RIDER_TIMESTAMP_HDR])
+    riders_df[RIDER_PHONE_HDR]     = riders_df[RIDER_PHONE_HDR].astype(str)
+    riders_df[TMP_RIDER_PHONE]     = phone_keys(riders_df[RIDER_PHONE_HDR])
+
+
+def phone_keys(phones: pd.Series) -> pd.Series:
+    """Returns the phone numbers as integer keys, so that the same number written differently matches, e.g. (858) 555-1234 and 8585551234.
+    Only the digits are kept, without a US country code. Blank numbers are 0.
+    """
+    digits = phones.astype(str).str.replace(r'\.0$', '', regex=True).str.replace(r'\D', '', regex=True)
+    digits = digits.mask((digits.str.len() == 11) & digits.str.startswith('1'), digits.str[1:]).str[-PHONE_KEY_DIGITS:]
+    return pd.to_numeric(digits.mask(digits == '', '0')).astype(np.int64)
+
+
+def _to_datetime(timestamps: pd.Series) -> pd.Series:
+    """Parses the timestamps with TIMESTAMP_FORMAT, falling back to inferring the format if any do not match.
+    """
+    try:
+        return pd.to_datetime(timestamps, format=TIMESTAMP_FORMAT)
+    except (ValueError, TypeError):
+        return pd.to_datetime(timestamps)
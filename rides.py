@@ -4,46 +4,110 @@
 import argparse
 import cfg
 from cfg.config import *
+import lib.cache as cache
 import lib.custom_log as my_logger
 import lib.feature as feat
+import lib.history as history
 import lib.postprocessing as post
+import lib.profiling as profiling
 import lib.rides_data as data
-import lib.trace as trace
+import lib.routing as routing
 import logging
 import os
+import pandas as pd
 
 
-def main() -> None:
+def main(args: dict) -> dict:
     """ Assign riders to drivers, updating the sheet if specified
+    Returns a summary of the run.
     """
 
+    init_args(args)
     my_logger.init()
+    summary = create_summary()
 
     # Continue only if service_account.json exists for accessing the Google Sheets data
-    api_reqs_fulfilled = os.path.exists(SERVICE_ACCT_FILE) or not (args[PARAM_DOWNLOAD] or args[PARAM_UPLOAD]) 
+    api_reqs_fulfilled = os.path.exists(cfg.cfg_path(SERVICE_ACCT_FILE)) or not (ARGS[PARAM_DOWNLOAD] or ARGS[PARAM_UPLOAD])
     if not api_reqs_fulfilled:
-        logging.critical(f'{os.path.basename(SERVICE_ACCT_FILE)} not found.')
-        logging.error(f'Make sure {os.path.basename(SERVICE_ACCT_FILE)} is in the cfg directory.')
+        logging.critical(f'{SERVICE_ACCT_FILE} not found.')
+        logging.error(f'Make sure {SERVICE_ACCT_FILE} is in the cfg directory.')
         logging.error("Contact Timothy Wu if you don't have it.")
-        return
+        summary['status'] = f'{SERVICE_ACCT_FILE} not found'
+        return summary
 
     cfg.init()
+    error = check_args()
+    if error is not None:
+        logging.error(error)
+        summary['status'] = error
+        return summary
+
+    cache.init()
+    profiling.init()
+
+    with profiling.stage('run'):
+        _run(summary)
+
+    profiling.report()
+    return summary
+
+
+def init_args(args: dict):
+    """Sets the arguments of a run, using the defaults of the command line options for the ones not given.
+    """
+    ARGS.clear()
+    ARGS.update(vars(create_parser().parse_args([f'--{PARAM_DAY}', args[PARAM_DAY]])))
+    ARGS.update(args)
+    ARGS[PARAM_LOG] = ARGS[PARAM_LOG].upper()
+
 
+def check_args() -> str:
+    """Returns why the options of the run do not fit the configuration, or None if they do.
+    """
+    if ARGS[PARAM_DAY] == ARG_SUNDAY and ARGS[PARAM_SERVICE] not in SERVICES:
+        return f'unknown service {ARGS[PARAM_SERVICE]}, choose one of {", ".join(SERVICES)}'
+    return None
+
+
+def create_summary() -> dict:
+    return {PARAM_CFG_DIR: ARGS.get(PARAM_CFG_DIR, CFG_PATH), 'status': 'ok', 'riders': 0, 'assigned': 0, 'drivers': 0}
+
+
+def _run(summary: dict):
+    """Runs the stages of the assignments, filling in the summary.
+    """
     # Fetch data from sheets
-    if ARGS[PARAM_DOWNLOAD]:
-        data.update_pickles()
+    if ARGS[PARAM_DOWNLOAD] and not download(summary):
+        return
 
-    # Print input
-    trace.dbg_pickles()
-    
     (drivers, riders) = data.get_cached_input()
+    assign(drivers, riders, summary)
 
+
+def download(summary: dict) -> bool:
+    """Downloads the sheets into the cache. Returns False if an input sheet could not be downloaded, so the run does not
+    assign and upload from the data of an earlier download.
+    """
+    failed = [key for key in data.update_pickles() if key in INPUT_SHEET_KEYS]
+    if len(failed) > 0:
+        logging.error(f'Could not download {", ".join(failed)}, aborting')
+        summary['status'] = f'download failed: {", ".join(failed)}'
+        return False
+    return True
+
+
+def assign(drivers: pd.DataFrame, riders: pd.DataFrame, summary: dict) -> pd.DataFrame:
+    """Assigns the riders to the drivers and writes the assignments, filling in the summary.
+    Returns the formatted assignments, or None if there is no one to assign.
+    """
     if len(riders.index) == 0:
         logging.error('No riders, aborting')
-        return
+        summary['status'] = 'no riders'
+        return None
     if len(drivers.index) == 0:
         logging.error('No drivers, aborting')
-        return
+        summary['status'] = 'no drivers'
+        return None
 
     if ARGS[PARAM_ROTATE]:
         feat.rotate_drivers(drivers)
@@ -53,35 +117,65 @@ def main() -> None:
         out = feat.assign_friday(drivers, riders)
     else:
         out = feat.assign_sunday(drivers, riders)
+
+    summary['riders'] = len(out.index)
+    summary['assigned'] = int(out[OUTPUT_DRIVER_NAME_HDR].notna().sum())
+    summary['drivers'] = out[OUTPUT_DRIVER_PHONE_HDR].nunique()
     
+    with profiling.stage('order pickups'):
+        routing.order_pickups(out)
+    with profiling.stage('record history'):
+        history.record(out)
+
     # Print output
-    out = post.clean_output(out)
+    with profiling.stage('format output') as stage:
+        out = post.clean_output(out)
+        stage.rows = [len(out.index)]
 
     data.write_assignments(out, ARGS[PARAM_UPLOAD])
+    return out
 
 
-if __name__ == '__main__':
-
-    parser = argparse.ArgumentParser()
+def create_parser(add_help: bool = True) -> argparse.ArgumentParser:
+    """Returns the parser for the command line options of a run.
+    """
+    parser = argparse.ArgumentParser(add_help=add_help)
     parser.add_argument(f'--{PARAM_DAY}', required=True, choices=[ARG_FRIDAY, ARG_SUNDAY],
                         help=f'choose either \'{ARG_FRIDAY}\' for CL, or \'{ARG_SUNDAY}\' for church')
-    parser.add_argument(f'--{PARAM_SERVICE}', default=ARG_SECOND_SERVICE, choices=[ARG_FIRST_SERVICE, ARG_SECOND_SERVICE],
-                        help='select the main Sunday service (i.e. select 1st service during weeks with ACE classes)')
+    parser.add_argument(f'--{PARAM_SERVICE}', default=ARG_SECOND_SERVICE,
+                        help=f'select the main Sunday service, one of {ARG_FIRST_SERVICE} and {ARG_SECOND_SERVICE} or a service in {SERVICES_FILE} (i.e. select 1st service during weeks with ACE classes)')
     parser.add_argument(f'--{PARAM_ROTATE}', action='store_true',
                         help='drivers are rotated based on date last driven')
+    parser.add_argument(f'--{PARAM_DATE}', default=None,
+                        help='set the date of the rides, which is recorded in the driver history (default: today)')
     parser.add_argument(f'--{PARAM_DOWNLOAD}', action=argparse.BooleanOptionalAction, default=True,
                         help='choose whether to download Google Sheets data')
     parser.add_argument(f'--{PARAM_UPLOAD}', action=argparse.BooleanOptionalAction, default=True,
                         help='choose whether to upload output to Google Sheets')
+    parser.add_argument(f'--{PARAM_REWRITE}', action='store_true',
+                        help='rewrite the whole output sheet instead of only the cells that changed since the last upload')
+    parser.add_argument(f'--{PARAM_INCREMENTAL}', action='store_true',
+                        help='keep the last assignments of the same day and date and only place the riders and drivers that were added or removed since')
+    parser.add_argument(f'--{PARAM_SYNC}', default=ARG_FULL_SYNC, choices=[ARG_DELTA_SYNC, ARG_FULL_SYNC],
+                        help='choose whether to download every row, or only the rows whose form timestamp changed since the last download, which misses cells edited by hand (default: full)')
+    parser.add_argument(f'--{PARAM_CONNECTIONS}', type=int, default=4,
+                        help='set how many sheets can be downloaded at once')
     parser.add_argument(f'--{PARAM_JUST_WEEKLY}', action='store_true',
                         help='use only the weekly rides for for these assignments (i.e. holidays)')
     parser.add_argument(f'--{PARAM_DISTANCE}', type=int, default=2, choices=range(1, ARG_DISTANCE_MAX + 1),
                         help='set how many far a driver can be to pick up at a neighboring location before choosing a last resort driver')
     parser.add_argument(f'--{PARAM_GROUP_SZ}', type=int, default=1, choices=range(1, ARG_GROUP_SZ_MAX + 1),
                         help='set how many riders must be leftover at a location for a driver to pick up from there')
+    parser.add_argument(f'--{PARAM_SOLVER}', default=ARG_GREEDY, choices=[ARG_GREEDY, ARG_OPTIMAL],
+                        help='choose the greedy assignment phases, or a min-cost flow that also reports how it compares to greedy')
+    parser.add_argument(f'--{PARAM_TIME_BUDGET}', type=float, default=5.0,
+                        help='set how many seconds the optimal solver may spend improving the assignments')
+    parser.add_argument(f'--{PARAM_PROFILE}', nargs='?', const='', default=None, metavar='PATH',
+                        help=f'time each stage of the run, print a summary and write a JSON report to PATH (default: {PROFILE_FILE} in the data directory)')
     parser.add_argument(f'--{PARAM_LOG}', type=str.upper, default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
                         help='set a level of verbosity for logging')
-    
-    args = vars(parser.parse_args())
-    ARGS.update(args)
-    main()
+    return parser
+
+
+if __name__ == '__main__':
+    main(vars(create_parser().parse_args()))
@@ -0,0 +1,207 @@
+""" Serves driver assignments from a long-running process that keeps the cached sheets in memory.
+Requests are JSON objects with the rides.py options as keys, posted to /assign over local HTTP or a Unix socket.
+"""
+
+import argparse
+import cfg
+from cfg.config import *
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import lib.cache as cache
+import lib.custom_log as my_logger
+import lib.profiling as profiling
+import lib.rides_data as data
+import logging
+import os
+import pandas as pd
+import rides
+import socketserver
+import time
+
+PARAM_HOST = 'host'
+PARAM_PORT = 'port'
+PARAM_SOCKET = 'socket'
+
+
+class RequestError(Exception):
+    """Raised for requests with unknown options or invalid values.
+    """
+
+
+class WarmState:
+    """Input frames kept between requests, reloaded when the cache they come from changes.
+    The configuration is restored by cfg.init from the snapshot it compiles, which checks the configuration files itself.
+    """
+
+    def __init__(self, service_args: dict):
+        self.service_args = service_args
+        self.inputs = None # (file versions, drivers, riders)
+        self.requests = 0
+
+    def handle(self, request: dict) -> dict:
+        """Runs the assignments for a request, returning the summary and the formatted assignments.
+        """
+        start = time.perf_counter()
+        self.requests += 1
+        rides.init_args(_parse_request(request))
+        ARGS.update(self.service_args)
+        summary = rides.create_summary()
+
+        if (ARGS[PARAM_DOWNLOAD] or ARGS[PARAM_UPLOAD]) and not os.path.exists(cfg.cfg_path(SERVICE_ACCT_FILE)):
+            raise RequestError(f'{SERVICE_ACCT_FILE} not found, cannot download or upload')
+
+        cfg.init()
+        error = rides.check_args()
+        if error is not None:
+            raise RequestError(error)
+        cache.init()
+        profiling.init()
+        out = None
+        with profiling.stage('run'):
+            if not ARGS[PARAM_DOWNLOAD] or rides.download(summary):
+                (drivers, riders) = self._load_input()
+                out = rides.assign(drivers, riders, summary)
+        profiling.report()
+
+        out = pd.DataFrame() if out is None else out
+        return {
+            'summary': summary,
+            'columns': out.columns.tolist(),
+            'rows': out.fillna('').astype(str).values.tolist(),
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 1),
+        }
+
+    def _load_input(self) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """Returns copies of the drivers and riders, reading the cache again only if it changed.
+        """
+        versions = (ARGS[PARAM_JUST_WEEKLY], _versions([os.path.join(cfg.data_path(key), cache.MANIFEST_FILE) for key in INPUT_SHEET_KEYS]))
+        if self.inputs is None or self.inputs[0] != versions:
+            (drivers, riders) = data.get_cached_input()
+            self.inputs = (versions, drivers, riders)
+            logging.info(f'Loaded {len(drivers.index)} drivers and {len(riders.index)} riders')
+        return (self.inputs[1].copy(), self.inputs[2].copy())
+
+
+def _versions(paths: list[str]) -> tuple:
+    """Returns the modification time of every file, or None for the missing ones.
+    """
+    return tuple(os.stat(path).st_mtime_ns if os.path.exists(path) else None for path in paths)
+
+
+def _parse_request(request: dict) -> dict:
+    """Validates the options of a request with the rides.py parser. Sheets are neither downloaded nor uploaded unless requested.
+    """
+    if not isinstance(request, dict) or PARAM_DAY not in request:
+        raise RequestError(f'requests must be JSON objects with a "{PARAM_DAY}"')
+
+    argv = ['--no-download', '--no-upload']
+    for key, val in request.items():
+        if isinstance(val, bool):
+            argv += [f'--{key}'] if val else []
+        else:
+            argv += [f'--{key}', str(val)]
+
+    parser = rides.create_parser(add_help=False)
+    parser.exit_on_error = False
+    try:
+        (args, unknown) = parser.parse_known_args(argv)
+    except (argparse.ArgumentError, SystemExit) as e:
+        raise RequestError(f'invalid request: {e}')
+    if len(unknown) > 0:
+        raise RequestError(f'unknown options: {" ".join(arg for arg in unknown if arg.startswith("--"))}')
+    return vars(args)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Serves GET /status and POST /assign, one request at a time.
+    """
+
+    def do_GET(self):
+        if self.path != '/status':
+            self._reply(404, {'error': f'unknown path {self.path}'})
+            return
+        self._reply(200, {'status': 'ok', 'requests': self.server.state.requests})
+
+    def do_POST(self):
+        if self.path != '/assign':
+            self._reply(404, {'error': f'unknown path {self.path}'})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'null')
+            self._reply(200, self.server.state.handle(request))
+        except (json.JSONDecodeError, RequestError) as e:
+            self._reply(400, {'error': str(e)})
+        except Exception as e:
+            logging.exception('Request failed')
+            self._reply(500, {'error': f'{type(e).__name__}: {e}'})
+
+    def _reply(self, code: int, body: dict):
+        payload = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def address_string(self) -> str:
+        # Unix socket clients have no host
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'local'
+
+    def log_message(self, format: str, *args):
+        logging.debug(format % args)
+
+
+class _UnixHTTPServer(socketserver.UnixStreamServer):
+
+    def get_request(self):
+        (request, _) = super().get_request()
+        return (request, 'local')
+
+
+def main(args: dict):
+    """Serves requests until interrupted.
+    """
+    service_args = {PARAM_LOG: args[PARAM_LOG].upper()}
+    for param in (PARAM_CFG_DIR, PARAM_DATA_DIR):
+        if args[param] is not None:
+            service_args[param] = os.path.realpath(args[param])
+
+    ARGS.clear()
+    ARGS.update(service_args)
+    my_logger.init()
+
+    if args[PARAM_SOCKET] is not None:
+        if os.path.exists(args[PARAM_SOCKET]):
+            os.remove(args[PARAM_SOCKET])
+        server = _UnixHTTPServer(args[PARAM_SOCKET], _Handler)
+        logging.info(f'Serving assignments on {args[PARAM_SOCKET]}')
+    else:
+        server = HTTPServer((args[PARAM_HOST], args[PARAM_PORT]), _Handler)
+        logging.info(f'Serving assignments on http://{args[PARAM_HOST]}:{args[PARAM_PORT]}')
+    server.state = WarmState(service_args)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args[PARAM_SOCKET] is not None and os.path.exists(args[PARAM_SOCKET]):
+            os.remove(args[PARAM_SOCKET])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(f'--{PARAM_HOST}', default='127.0.0.1',
+                        help='set the address to listen on')
+    parser.add_argument(f'--{PARAM_PORT}', type=int, default=8642,
+                        help='set the port to listen on')
+    parser.add_argument(f'--{PARAM_SOCKET}', default=None, metavar='PATH',
+                        help='listen on a Unix socket instead of a port')
+    parser.add_argument(f'--{PARAM_CFG_DIR}', default=None,
+                        help='set the configuration directory (default: cfg)')
+    parser.add_argument(f'--{PARAM_DATA_DIR}', default=None,
+                        help='set the cache directory (default: pickle)')
+    parser.add_argument(f'--{PARAM_LOG}', type=str.upper, default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+                        help='set a level of verbosity for logging')
+    main(vars(parser.parse_args()))
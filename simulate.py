@@ -0,0 +1,162 @@
+""" Replays archived weekly snapshots of the sheets through the assignments, rotating drivers from week to week.
+Each parameter setting runs every week in its own worker process, and the report shows how often each driver drove.
+"""
+
+import argparse
+import cfg
+from cfg.config import *
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import json
+import lib.cache as cache
+import lib.custom_log as my_logger
+import lib.rides_data as data
+import lib.setup as setup
+import logging
+import os
+import pandas as pd
+import rides
+import shutil
+import tempfile
+import time
+
+PARAM_SNAPSHOTS = 'snapshots'
+PARAM_DAYS = 'days'
+PARAM_WORKERS = 'workers'
+PARAM_OUTPUT = 'output'
+
+### Sheets that are replaced by every snapshot, the output is kept to rotate drivers
+INPUT_KEYS = [PERMANENT_SHEET_KEY, WEEKLY_SHEET_KEY, DRIVER_SHEET_KEY]
+
+
+def main(args: dict) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Simulates every combination of the distance and group size settings, then prints the weekly runs and the driver loads.
+    """
+    weeks = sorted(entry.path for entry in os.scandir(args[PARAM_SNAPSHOTS]) if entry.is_dir())
+    if len(args[PARAM_GROUP_SZ]) > 1:
+        logging.warning(f'The assignments do not read --{PARAM_GROUP_SZ} yet, so every group size gives the same runs')
+    sims = []
+    for (distance, group_sz) in itertools.product(args[PARAM_DISTANCE], args[PARAM_GROUP_SZ]):
+        sims.append({
+            'weeks': weeks,
+            PARAM_DAYS: args[PARAM_DAYS],
+            PARAM_DISTANCE: distance,
+            PARAM_GROUP_SZ: group_sz,
+            PARAM_CFG_DIR: os.path.realpath(args[PARAM_CFG_DIR]),
+            PARAM_LOG: args[PARAM_LOG],
+        })
+
+    with ProcessPoolExecutor(max_workers=args[PARAM_WORKERS]) as pool:
+        results = list(pool.map(simulate, sims))
+
+    runs = pd.DataFrame([run for (sim_runs, _) in results for run in sim_runs])
+    loads = pd.DataFrame([load for (_, sim_loads) in results for load in sim_loads])
+    print(runs.to_string(index=False))
+    print()
+    print(_fairness(loads).to_string(index=False))
+    if args[PARAM_OUTPUT] is not None:
+        with open(args[PARAM_OUTPUT], 'w') as output_file:
+            json.dump({'runs': runs.to_dict('records'), 'loads': loads.to_dict('records')}, output_file, indent=2)
+        print(f'Saved results to {args[PARAM_OUTPUT]}')
+    return (runs, loads)
+
+
+def simulate(sim: dict) -> tuple[list[dict], list[dict]]:
+    """Runs every week of one setting in order, keeping the previous output so that drivers are rotated.
+    Returns a row per run with its size and time, and a row per driver with how many times they drove and riders they took.
+    """
+    runs = []
+    loads = {}
+    setting = {PARAM_DISTANCE: sim[PARAM_DISTANCE], PARAM_GROUP_SZ: sim[PARAM_GROUP_SZ]}
+    with tempfile.TemporaryDirectory() as data_dir:
+        # Weeks are a week apart and end today, so the driver history sees them as separate runs
+        dates = pd.date_range(end=pd.Timestamp.now().normalize(), periods=len(sim['weeks']), freq='7D')
+        for (week, date) in zip(sim['weeks'], dates):
+            for key in INPUT_KEYS:
+                _copy_sheet(os.path.join(week, key), os.path.join(data_dir, key))
+
+            for day in sim[PARAM_DAYS]:
+                rides.init_args({**setting, PARAM_DAY: day, PARAM_ROTATE: True, PARAM_DATE: date.strftime('%Y-%m-%d'), PARAM_DOWNLOAD: False, PARAM_UPLOAD: False,
+                                 PARAM_CFG_DIR: sim[PARAM_CFG_DIR], PARAM_DATA_DIR: data_dir, PARAM_LOG: sim[PARAM_LOG]})
+                my_logger.init()
+                summary = rides.create_summary()
+
+                start = time.perf_counter()
+                cfg.init()
+                cache.init()
+                (drivers, riders) = data.get_cached_input()
+                out = rides.assign(drivers, riders, summary)
+                elapsed = time.perf_counter() - start
+
+                runs.append({**setting, 'week': os.path.basename(week), PARAM_DAY: day, 'status': summary['status'],
+                             'riders': summary['riders'], 'assigned': summary['assigned'], 'drivers': summary['drivers'], 'seconds': round(elapsed, 3)})
+                _add_loads(loads, drivers, out)
+
+    return (runs, [{**setting, DRIVER_PHONE_HDR: phone, **load} for (phone, load) in loads.items()])
+
+
+def _copy_sheet(src: str, dst: str):
+    """Replaces a cached sheet with the one in a snapshot, which may still be an old pickle file.
+    """
+    if os.path.isdir(dst):
+        shutil.rmtree(dst)
+    elif os.path.isfile(dst):
+        os.remove(dst)
+    if os.path.isdir(src):
+        shutil.copytree(src, dst)
+    else:
+        shutil.copy2(src, dst)
+
+
+def _add_loads(loads: dict, drivers: pd.DataFrame, out: pd.DataFrame):
+    """Counts the runs each driver signed up for, drove in, and the riders they took.
+    """
+    for (phone, name) in zip(drivers[TMP_DRIVER_PHONE].tolist(), drivers[DRIVER_NAME_HDR]):
+        load = loads.setdefault(phone, {DRIVER_NAME_HDR: name, 'signed_up': 0, 'drove': 0, 'riders': 0})
+        load['signed_up'] += 1
+    if out is None:
+        return
+
+    groups = setup.get_prev_groups(out)
+    for phone in set(groups.values()):
+        loads.setdefault(phone, {DRIVER_NAME_HDR: '', 'signed_up': 0, 'drove': 0, 'riders': 0})['drove'] += 1
+    for phone in groups.values():
+        loads[phone]['riders'] += 1
+
+
+def _fairness(loads: pd.DataFrame) -> pd.DataFrame:
+    """Summarizes how evenly each setting spread the driving among the drivers who signed up.
+    """
+    if len(loads.index) == 0:
+        return loads
+    loads = loads[loads['signed_up'] > 0]
+    share = loads['drove'] / loads['signed_up']
+    return loads.assign(share=share).groupby([PARAM_DISTANCE, PARAM_GROUP_SZ], as_index=False).agg(
+        drivers=('drove', 'size'),
+        drove=('drove', 'sum'),
+        riders=('riders', 'sum'),
+        min_share=('share', 'min'),
+        max_share=('share', 'max'),
+        share_std=('share', 'std'),
+    ).round(3)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(PARAM_SNAPSHOTS,
+                        help='directory with a data directory per week, replayed in the order of their names')
+    parser.add_argument(f'--{PARAM_CFG_DIR}', default=CFG_PATH,
+                        help='set the configuration directory (default: cfg)')
+    parser.add_argument(f'--{PARAM_DAYS}', nargs='+', default=[ARG_FRIDAY, ARG_SUNDAY], choices=[ARG_FRIDAY, ARG_SUNDAY],
+                        help='choose the days run every week, in order')
+    parser.add_argument(f'--{PARAM_DISTANCE}', type=int, nargs='+', default=[2], choices=range(1, ARG_DISTANCE_MAX + 1),
+                        help='set the distances to compare')
+    parser.add_argument(f'--{PARAM_GROUP_SZ}', type=int, nargs='+', default=[1], choices=range(1, ARG_GROUP_SZ_MAX + 1),
+                        help='set the group sizes to compare, which the assignments do not read yet')
+    parser.add_argument(f'--{PARAM_WORKERS}', type=int, default=None,
+                        help='set how many settings can run at once (default: number of CPUs)')
+    parser.add_argument(f'--{PARAM_OUTPUT}', default=None,
+                        help='write the runs and driver loads to a JSON file')
+    parser.add_argument(f'--{PARAM_LOG}', type=str.upper, default='ERROR', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+                        help='set a level of verbosity for logging')
+    main(vars(parser.parse_args()))
@@ -0,0 +1,30 @@
+"""Shared setup of the tests that run the assignments offline, on data in the cfg and pickle directories of tmp_path.
+"""
+
+import os
+import sys
+curr = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(curr))
+
+from cfg.config import *
+import pytest
+import rides
+
+
+@pytest.fixture
+def offline_args(tmp_path):
+    """Returns a function that makes the arguments of a run that neither downloads nor uploads, with the given options.
+    """
+    def make(options: dict = None, day: str = ARG_SUNDAY) -> dict:
+        return {PARAM_DAY: day, PARAM_DOWNLOAD: False, PARAM_UPLOAD: False, PARAM_LOG: 'ERROR',
+                PARAM_CFG_DIR: str(tmp_path / 'cfg'), PARAM_DATA_DIR: str(tmp_path / 'pickle'), **(options or {})}
+    return make
+
+
+@pytest.fixture
+def run_offline(offline_args):
+    """Returns a function that runs the assignments offline with the given options, and returns the summary.
+    """
+    def run(options: dict = None, day: str = ARG_SUNDAY) -> dict:
+        return rides.main(offline_args(options, day))
+    return run
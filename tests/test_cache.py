@@ -0,0 +1,38 @@
+"""Tests for the columnar cache of the sheets.
+"""
+
+import os
+import sys
+curr = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(curr))
+
+from cfg.config import *
+import lib.cache as cache
+import numpy as np
+import pandas as pd
+
+
+def test_long_notes_do_not_widen_the_cache(tmp_path):
+    ARGS.clear()
+    ARGS.update({PARAM_DATA_DIR: str(tmp_path)})
+    rows = 20000
+    df = pd.DataFrame({
+        RIDER_NAME_HDR: [f'Rider {i}' for i in range(rows)],
+        RIDER_LOCATION_HDR: np.resize(['Revelle', 'Muir', 'Sixth', 'Warren'], rows),
+        RIDER_NOTES_HDR: [''] * rows,
+        DRIVER_CAPACITY_HDR: np.arange(rows) % 5,
+    })
+    df.loc[3, RIDER_NOTES_HDR] = 'é' * 2000
+    df.loc[4, RIDER_NOTES_HDR] = np.nan
+    cache.write(WEEKLY_SHEET_KEY, df)
+
+    size = sum(entry.stat().st_size for entry in os.scandir(tmp_path / WEEKLY_SHEET_KEY))
+    assert size < 1_000_000
+
+    cached = cache.read(WEEKLY_SHEET_KEY)
+    pd.testing.assert_frame_equal(cached, df)
+    assert isinstance(cached[DRIVER_CAPACITY_HDR].to_numpy().base, np.memmap)
+
+    # Frames can be changed in place without changing the cache
+    cached.loc[0, DRIVER_CAPACITY_HDR] = 9
+    assert cache.read(WEEKLY_SHEET_KEY).loc[0, DRIVER_CAPACITY_HDR] == 0
@@ -0,0 +1,73 @@
+"""Tests for the compiled configuration snapshot, the ignore lists and the driver preferences, using synthetic data.
+"""
+
+import os
+import sys
+curr = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(curr))
+
+import cfg
+from cfg.config import *
+import lib.cache as cache
+import lib.rides_data as data
+import lib.setup as setup
+import lib.synthetic as synthetic
+import rides
+
+
+def _init(offline_args):
+    rides.init_args(offline_args())
+    cfg.init()
+    cache.init()
+
+
+def test_snapshot_is_reused_until_files_change(tmp_path, offline_args, monkeypatch):
+    synthetic.write_config(str(tmp_path / 'cfg'), str(tmp_path / 'pickle'), areas=12, permanent=10, weekly=10, drivers=10)
+    _init(offline_args)
+    loc_map = dict(LOC_MAP)
+    assert os.path.isfile(tmp_path / 'pickle' / CFG_SNAPSHOT_FILE.format(day=ARG_SUNDAY))
+
+    def fail():
+        raise AssertionError('map.txt parsed again')
+    monkeypatch.setattr(cfg, 'load_map', fail)
+    _init(offline_args)
+    assert LOC_MAP == loc_map
+
+    # Touching a file keeps the snapshot, changing one compiles it again
+    os.utime(tmp_path / 'cfg' / MAP_FILE)
+    _init(offline_args)
+    with open(tmp_path / 'cfg' / IGNORE_DRIVERS_FILE, 'w') as ignore_file:
+        ignore_file.write('# name, phone\nSam Lee, (760) 555-0100\n')
+    monkeypatch.undo()
+    _init(offline_args)
+    assert IGNORED_DRIVERS == {('sam lee', 7605550100)}
+    assert LOC_MAP == loc_map
+
+
+def test_ignore_lists_and_preferences(tmp_path, offline_args):
+    synthetic.write_config(str(tmp_path / 'cfg'), str(tmp_path / 'pickle'), areas=12, permanent=40, weekly=20, drivers=20, seed=6)
+    _init(offline_args)
+    (drivers, riders) = data.get_cached_input()
+    (drivers, riders) = setup.filter_sunday(drivers, riders)
+    (ignored_driver, pref_driver) = (drivers.iloc[0], drivers.iloc[1])
+    ignored_rider = riders.iloc[0]
+    loc = next(iter(LOC_MAP))
+    with open(tmp_path / 'cfg' / IGNORE_DRIVERS_FILE, 'w') as ignore_file:
+        ignore_file.write(f'{ignored_driver[DRIVER_NAME_HDR].upper()}, +1 {ignored_driver[DRIVER_PHONE_HDR]}\n')
+    with open(tmp_path / 'cfg' / IGNORE_RIDERS_FILE, 'w') as ignore_file:
+        ignore_file.write(f'{ignored_rider[RIDER_NAME_HDR]}, {ignored_rider[RIDER_PHONE_HDR]}\nNo Phone\n')
+    with open(tmp_path / 'cfg' / DRIVER_PREFS_FILE, 'w') as prefs_file:
+        prefs_file.write(f'{pref_driver[DRIVER_NAME_HDR]}, {pref_driver[DRIVER_PHONE_HDR]}, {loc}, 3\n')
+
+    _init(offline_args)
+    assert len(IGNORED_RIDERS) == 1
+    (drivers, riders) = data.get_cached_input()
+    drivers.loc[drivers[DRIVER_PHONE_HDR] == pref_driver[DRIVER_PHONE_HDR], [DRIVER_PREF_LOC_HDR, DRIVER_NOTES_HDR]] = ''
+    (drivers, riders) = setup.filter_sunday(drivers, riders)
+    assert ignored_driver[DRIVER_PHONE_HDR] not in drivers[DRIVER_PHONE_HDR].tolist()
+    assert ignored_rider[RIDER_PHONE_HDR] not in riders[RIDER_PHONE_HDR].tolist()
+
+    groups = setup.split_sunday_services(drivers, riders)
+    (pref_drivers, _) = groups['3']
+    assert pref_drivers[DRIVER_PHONE_HDR].tolist() == [pref_driver[DRIVER_PHONE_HDR]]
+    assert pref_drivers[DRIVER_PREF_LOC_HDR].tolist() == [loc]
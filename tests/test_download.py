@@ -0,0 +1,76 @@
+"""Tests for downloading the sheets concurrently, using the offline fake client with simulated latency.
+"""
+
+import os
+import sys
+curr = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(curr))
+
+from cfg.config import *
+import lib.cache as cache
+from lib.fake_sheets import FakeClient, FakeWorksheet
+import gspread
+import lib.rides_data as data
+import lib.synthetic as synthetic
+import rides
+import time
+
+LATENCY = 0.1
+GID_DATA = {PERMANENT_SHEET_KEY: 'p', WEEKLY_SHEET_KEY: 'w', DRIVER_SHEET_KEY: 'd', OUTPUT_SHEET_KEY: 'o'}
+
+
+def _setup(tmp_path, connections: int, failures: dict[str, int] = None) -> FakeClient:
+    ARGS.clear()
+    ARGS.update({PARAM_DATA_DIR: str(tmp_path), PARAM_SYNC: ARG_DELTA_SYNC, PARAM_CONNECTIONS: connections})
+    cache.init()
+    sheets = {}
+    for key, sheet_id in GID_DATA.items():
+        values = [['Timestamp', 'Name']] + [[f'1/1/2023 10:00:{i:02}', f'{key} {i}'] for i in range(30)]
+        sheets[sheet_id] = FakeWorksheet(values, latency=LATENCY, failures=(failures or {}).get(key, 0))
+    return FakeClient(sheets, latency=LATENCY)
+
+
+def _download_time(tmp_path, connections: int) -> float:
+    gc = _setup(tmp_path, connections)
+    start = time.perf_counter()
+    assert data.download_sheets(gc, GID_DATA) == []
+    elapsed = time.perf_counter() - start
+    for key in GID_DATA:
+        assert len(cache.read(key).index) == 30
+    return elapsed
+
+
+def test_concurrent_downloads_are_faster(tmp_path):
+    sequential = _download_time(tmp_path / 'sequential', 1)
+    concurrent = _download_time(tmp_path / 'concurrent', len(GID_DATA))
+    assert concurrent < sequential / 2
+
+
+def test_failed_requests_are_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr(data, 'DOWNLOAD_BACKOFF', 0.01)
+    gc = _setup(tmp_path, 2, {WEEKLY_SHEET_KEY: 2})
+    assert data.download_sheets(gc, GID_DATA) == []
+    assert len(cache.read(WEEKLY_SHEET_KEY).index) == 30
+
+
+def test_failed_sheet_keeps_previous_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(data, 'DOWNLOAD_BACKOFF', 0.01)
+    gc = _setup(tmp_path, 2, {DRIVER_SHEET_KEY: DOWNLOAD_RETRIES + 1})
+    assert data.download_sheets(gc, GID_DATA) == [DRIVER_SHEET_KEY]
+    assert len(cache.read(DRIVER_SHEET_KEY).index) == 0
+    assert len(cache.read(PERMANENT_SHEET_KEY).index) == 30
+
+
+def test_failed_input_sheet_stops_the_run(tmp_path, monkeypatch):
+    monkeypatch.setattr(data, 'DOWNLOAD_BACKOFF', 0.01)
+    (cfg_dir, data_dir) = (tmp_path / 'cfg', tmp_path / 'pickle')
+    synthetic.write_config(str(cfg_dir), str(data_dir), areas=8, permanent=20, weekly=10, drivers=10)
+    (cfg_dir / SERVICE_ACCT_FILE).write_text('{}')
+    sheets = {f'synthetic-{key}': FakeWorksheet([['Timestamp', 'Name'], ['1/1/2023 10:00:00', 'Someone']]) for key in GID_DATA}
+    sheets[f'synthetic-{DRIVER_SHEET_KEY}'].failures = DOWNLOAD_RETRIES + 1
+    monkeypatch.setattr(gspread, 'service_account', lambda filename: FakeClient(sheets))
+
+    summary = rides.main({PARAM_DAY: ARG_SUNDAY, PARAM_LOG: 'ERROR', PARAM_CFG_DIR: str(cfg_dir), PARAM_DATA_DIR: str(data_dir)})
+    assert summary['status'] == f'download failed: {DRIVER_SHEET_KEY}'
+    assert summary['assigned'] == 0
+    assert sheets[f'synthetic-{OUTPUT_SHEET_KEY}'].cells_written == 0
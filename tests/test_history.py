@@ -0,0 +1,65 @@
+"""Tests for the driver history that rotation looks up, using synthetic data.
+"""
+
+import os
+import sys
+curr = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(curr))
+
+from cfg.config import *
+import lib.history as history
+import lib.rides_data as data
+import lib.setup as setup
+import lib.synthetic as synthetic
+import sqlite3
+
+
+def _groups(run_offline, date: str, options: dict = None) -> dict[int, int]:
+    run_offline({PARAM_DATE: date, **(options or {})})
+    return setup.get_prev_groups(data.get_cached_output())
+
+
+def test_records_every_run(tmp_path, run_offline):
+    synthetic.write_config(str(tmp_path / 'cfg'), str(tmp_path / 'pickle'), areas=12, permanent=60, weekly=20, drivers=40, seed=4)
+    first = _groups(run_offline, '2026-10-04')
+    _groups(run_offline, '2026-10-04')
+    second = _groups(run_offline, '2026-10-11', {PARAM_ROTATE: True})
+
+    (latest, loads) = history.lookup(data.get_cached_input()[0][TMP_DRIVER_PHONE])
+    assert latest == 2
+    # Running the same date again replaced the first run
+    assert set(loads.index) == set(first.values()) | set(second.values())
+    for phone, load in loads.iterrows():
+        runs = [groups for groups in (first, second) if phone in groups.values()]
+        assert load['drives'] == len(runs)
+        assert load['riders'] == sum(list(groups.values()).count(phone) for groups in runs)
+        assert load['last_date'] == ('2026-10-11' if phone in second.values() else '2026-10-04')
+
+
+def test_rotates_drivers_who_did_not_drive(tmp_path, run_offline):
+    synthetic.write_config(str(tmp_path / 'cfg'), str(tmp_path / 'pickle'), areas=12, permanent=60, weekly=20, drivers=40, seed=4)
+    first = set(_groups(run_offline, '2026-10-04').values())
+
+    (drivers, _) = data.get_cached_input()
+    setup.mark_unused_drivers(drivers)
+    drivers.sort_values(by=DRIVER_TIMESTAMP_HDR, inplace=True, ascending=False)
+    drove = drivers[TMP_DRIVER_PHONE].isin(first).tolist()
+    assert drove == sorted(drove)
+
+
+def test_migrates_phones_as_written(tmp_path, run_offline):
+    synthetic.write_config(str(tmp_path / 'cfg'), str(tmp_path / 'pickle'), areas=12, permanent=60, weekly=20, drivers=40, seed=4)
+    first = _groups(run_offline, '2026-10-04')
+
+    # Databases of older versions stored the phones as written in the sheet
+    drivers = data.get_cached_input()[0]
+    written = dict(zip(drivers[TMP_DRIVER_PHONE].astype(str), drivers[DRIVER_PHONE_HDR].astype(str)))
+    conn = sqlite3.connect(tmp_path / 'pickle' / HISTORY_FILE)
+    with conn:
+        conn.executemany('UPDATE drives SET driver_phone = ? WHERE driver_phone = ?', [(f'+1 {phone}', key) for (key, phone) in written.items()])
+        conn.execute('PRAGMA user_version = 0')
+    conn.close()
+
+    (latest, loads) = history.lookup(drivers[TMP_DRIVER_PHONE])
+    assert latest == 1
+    assert set(loads.index) == set(first.values())
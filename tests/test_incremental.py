@@ -0,0 +1,59 @@
+"""Tests for patching the last assignments when riders or drivers change, using synthetic data.
+"""
+
+import os
+import sys
+curr = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(curr))
+
+from cfg.config import *
+import lib.assignments as core
+import lib.cache as cache
+import lib.rides_data as data
+import lib.setup as setup
+import lib.synthetic as synthetic
+import lib.validation as prep
+import pandas as pd
+
+
+def _groups(run_offline, options: dict = None, day: str = ARG_SUNDAY) -> dict[int, int]:
+    run_offline({PARAM_DATE: '2026-10-04', **(options or {})}, day)
+    return setup.get_prev_groups(data.get_cached_output())
+
+
+def test_keeps_cars_of_unchanged_riders(tmp_path, run_offline, monkeypatch):
+    synthetic.write_config(str(tmp_path / 'cfg'), str(tmp_path / 'pickle'), areas=12, permanent=80, weekly=30, drivers=80, seed=3)
+    before = _groups(run_offline)
+
+    # One driver drops out and one weekly rider signs up late
+    drivers = cache.read(DRIVER_SHEET_KEY)
+    dropped = next(iter(before.values()))
+    cache.write(DRIVER_SHEET_KEY, drivers[drivers[DRIVER_PHONE_HDR].astype(str) != str(dropped)])
+    weekly = cache.read(WEEKLY_SHEET_KEY)
+    late = weekly[prep.phone_keys(weekly[WEEKLY_RIDER_PHONE_HDR]).isin(before)].iloc[[0]].copy()
+    late[WEEKLY_RIDER_NAME_HDR] = 'Late'
+    late[WEEKLY_RIDER_PHONE_HDR] = '(858) 999-0000'
+    cache.write(WEEKLY_SHEET_KEY, weekly._append(late, ignore_index=True))
+
+    # The cars of the Friday run in between are not the ones patched
+    _groups(run_offline, day=ARG_FRIDAY)
+    after = _groups(run_offline, {PARAM_INCREMENTAL: True})
+    assert 8589990000 in after
+    assert dropped not in after.values()
+    kept = {rider: driver for rider, driver in before.items() if driver != dropped}
+    assert all(after.get(rider) == driver for rider, driver in kept.items())
+
+    # Another date has no assignments to patch, so everyone is assigned again
+    def fail(*args):
+        raise AssertionError('patched the assignments of another date')
+    monkeypatch.setattr(core, 'patch_assignments', fail)
+    assert len(_groups(run_offline, {PARAM_DATE: '2026-10-11', PARAM_INCREMENTAL: True})) > 0
+
+
+def test_reads_groups_from_formatted_output():
+    out = pd.DataFrame({
+        OUTPUT_DRIVER_NAME_HDR: ['A', '', '', 'B', '', '?'],
+        OUTPUT_DRIVER_PHONE_HDR: ['1', '', '', '2', '', '?'],
+        RIDER_PHONE_HDR: ['10', '11', '', '20', '', '30'],
+    })
+    assert setup.get_prev_groups(out) == {10: 1, 11: 1, 20: 2}
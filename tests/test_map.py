@@ -0,0 +1,73 @@
+"""Tests for loading the map into route codes and graph distances.
+"""
+
+import os
+import sys
+curr = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(curr))
+
+import cfg
+from cfg.config import *
+import lib.rides_data as data
+import lib.spatial as spatial
+import lib.synthetic as synthetic
+import numpy as np
+
+
+def _load(tmp_path, map_text: str, edges_text: str = None):
+    (tmp_path / MAP_FILE).write_text(map_text)
+    if edges_text is not None:
+        (tmp_path / EDGES_FILE).write_text(edges_text)
+    ARGS.clear()
+    ARGS.update({PARAM_DAY: ARG_SUNDAY, PARAM_CFG_DIR: str(tmp_path), PARAM_DATA_DIR: str(tmp_path / 'pickle')})
+    cfg.init()
+
+
+def test_lines_are_one_apart(tmp_path):
+    _load(tmp_path, 'a\n# comment\nb, c\n\nd\n')
+    assert LOC_MAP == {'a': 0b1, 'b': 0b10, 'c': 0b10, '': 0b100, 'd': 0b1000}
+    assert np.array_equal(LOC_DIST, np.abs(np.subtract.outer(np.arange(4), np.arange(4))))
+    assert LOC_NEIGHBORS[LOC_MAP['b']] == [0b10, 0b101, 0b1000, 0]
+
+
+def test_edges_are_weighted_and_cached(tmp_path):
+    _load(tmp_path, 'a\nb\nc\nd\ne\n', 'a, b, 2\nb, c\na, c, 5\nd, e\nd, nowhere\n')
+    assert LOC_DIST[0][:3] == [0, 2, 3]
+    assert LOC_DIST[0][3] == MAX_ROUTE_DIST
+    assert LOC_DIST[3][4] == 1
+
+    # The distances are read back for the same files, and computed again when a file changes
+    stat = os.stat(tmp_path / 'pickle' / LOC_DIST_FILE)
+    _load(tmp_path, 'a\nb\nc\nd\ne\n')
+    assert os.stat(tmp_path / 'pickle' / LOC_DIST_FILE).st_mtime_ns == stat.st_mtime_ns
+    _load(tmp_path, 'a\nb\nc\nd\ne\n', 'a, b, 1\n')
+    assert LOC_DIST[0][1] == 1
+
+
+def test_locations_with_coordinates(tmp_path):
+    # b is 2 km east of a, c is 4 km north of b, d is far from everything
+    (tmp_path / LOCATIONS_FILE).write_text('Location,Latitude,Longitude\nA,32.88,-117.24\nB,32.88,-117.2186\nC,32.916,-117.2186\nD,33.5,-117.2186\nbad,x,y\n')
+    _load(tmp_path, 'a\n')
+    assert LOC_MAP == {'a': 0b1, 'b': 0b10, 'c': 0b100, 'd': 0b1000}
+    assert LOC_DIST[0][:3] == [0, 2, 5]
+    assert LOC_DIST[1][2] == 4
+    # d is only linked to its nearest location, c, which is farther than any distance
+    assert LOC_DIST[3][2] == MAX_ROUTE_DIST
+
+
+def test_grid_index_matches_brute_force():
+    rng = np.random.default_rng(0)
+    points = rng.random((200, 2)) * 30
+    index = spatial.GridIndex(points, 2.5)
+    for query in rng.random((50, 2)) * 40 - 5:
+        dist = np.hypot(*(points - query).T)
+        assert index.within(query, 4.0) == np.flatnonzero(dist <= 4.0).tolist()
+        assert index.nearest(query) == int(np.argmin(dist))
+
+
+def test_maps_wider_than_64_areas(tmp_path, run_offline):
+    synthetic.write_config(str(tmp_path / 'cfg'), str(tmp_path / 'pickle'), areas=100, permanent=200, weekly=50, drivers=120, seed=4)
+    summary = run_offline()
+    assert len(LOC_DIST) > 64
+    assert summary['assigned'] == summary['riders'] > 0
+    assert len(data.get_cached_output().index) > 0
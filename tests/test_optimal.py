@@ -0,0 +1,32 @@
+"""Tests for the optimal solver mode, using synthetic data.
+"""
+
+import os
+import sys
+curr = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(curr))
+
+from cfg.config import *
+import lib.optimal as opt
+import lib.synthetic as synthetic
+import numpy as np
+import time
+
+
+def test_flow_stops_at_the_deadline():
+    # Two locations with three riders each, into one car of four seats
+    cap = np.zeros((6, 6), dtype=np.int64)
+    cost = np.zeros((6, 6), dtype=np.int64)
+    cap[0, 1:3] = 3
+    cap[1:3, 3] = 3
+    cost[1:3, 3] = [1, 2]
+    cap[3, 5] = 4
+    assert opt._min_cost_flow(cap, cost, 0, 5)[0].sum() == 4
+    assert opt._min_cost_flow(cap, cost, 0, 5, deadline=time.perf_counter())[0].sum() == 0
+
+
+def test_optimal_honors_the_distance(tmp_path, run_offline):
+    synthetic.write_config(str(tmp_path / 'cfg'), str(tmp_path / 'pickle'), areas=8, permanent=30, weekly=10, drivers=12)
+    summary = run_offline({PARAM_SOLVER: ARG_OPTIMAL, PARAM_DISTANCE: 1})
+    assert summary['status'] == 'ok'
+    assert summary['assigned'] > 0
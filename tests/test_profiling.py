@@ -0,0 +1,26 @@
+"""Tests for the per-stage profiling report.
+"""
+
+import os
+import sys
+curr = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(curr))
+
+from cfg.config import *
+import lib.profiling as profiling
+
+
+def test_outer_stage_keeps_its_peak_before_a_nested_stage(tmp_path):
+    ARGS.clear()
+    ARGS.update({PARAM_DAY: ARG_SUNDAY, PARAM_SOLVER: ARG_GREEDY, PARAM_PROFILE: str(tmp_path / 'profile.json')})
+    profiling.init()
+    with profiling.stage('outer') as outer:
+        block = bytearray(20 * 2**20)
+        del block
+        with profiling.stage('inner') as inner:
+            block = bytearray(2**20)
+            del block
+    profiling.report()
+
+    assert outer.peak >= 20 * 2**20
+    assert 2**20 <= inner.peak < 2 * 2**20
@@ -0,0 +1,47 @@
+"""Tests for matching location answers that are not in the map.
+"""
+
+import os
+import sys
+curr = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(curr))
+
+import cfg
+from cfg.config import *
+import lib.resolver as resolver
+import pandas as pd
+import pytest
+
+MAP = 'Eighth\nRevelle\nMuir\nSixth\n\nWarren, Pepper Canyon Apts\nRita Atkinson\n'
+
+
+@pytest.fixture
+def map_dir(tmp_path):
+    (tmp_path / MAP_FILE).write_text(MAP)
+    ARGS.clear()
+    ARGS.update({PARAM_DAY: ARG_SUNDAY, PARAM_CFG_DIR: str(tmp_path), PARAM_DATA_DIR: str(tmp_path / 'pickle')})
+    cfg.init()
+    return tmp_path
+
+
+def test_misspelled_and_abbreviated_answers(map_dir):
+    answers = pd.Series(['Revele', 'pca', 'Rita', 'Muir College', ' sixth ', 'Village', 'La Jolla', 'Revele'])
+    resolver.resolve_locations(answers)
+    assert LOC_MAP['revele'] == LOC_MAP['revelle']
+    assert LOC_MAP['pca'] == LOC_MAP['pepper canyon apts']
+    assert LOC_MAP['rita'] == LOC_MAP['rita atkinson']
+    assert LOC_MAP['muir college'] == LOC_MAP['muir']
+    assert 'village' not in LOC_MAP
+    assert 'la jolla' not in LOC_MAP
+
+
+def test_matches_are_saved(map_dir, monkeypatch):
+    resolver.resolve_locations(pd.Series(['Revele', 'Village']))
+    assert os.path.isfile(map_dir / 'pickle' / LOC_RESOLVED_FILE)
+
+    # The next run reads the matches instead of building the index
+    cfg.init()
+    monkeypatch.setattr(resolver, 'LocationIndex', None)
+    resolver.resolve_locations(pd.Series(['Revele', 'Village']))
+    assert LOC_MAP['revele'] == LOC_MAP['revelle']
+    assert 'village' not in LOC_MAP
@@ -0,0 +1,67 @@
+"""Tests for ordering the pickups of every car.
+"""
+
+import os
+import sys
+curr = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(curr))
+
+import cfg
+from cfg.config import *
+import itertools
+import lib.postprocessing as post
+import lib.routing as routing
+import numpy as np
+import pandas as pd
+
+
+def _load(tmp_path, map_text: str):
+    (tmp_path / MAP_FILE).write_text(map_text)
+    ARGS.clear()
+    ARGS.update({PARAM_DAY: ARG_SUNDAY, PARAM_CFG_DIR: str(tmp_path), PARAM_DATA_DIR: str(tmp_path / 'pickle')})
+    cfg.init()
+
+
+def test_cars_pick_up_along_the_map(tmp_path):
+    _load(tmp_path, 'a\nb\nc\nd\ne\n')
+    out = pd.DataFrame({
+        OUTPUT_DRIVER_NAME_HDR: ['X', 'X', 'X', 'X', 'Y', np.nan],
+        OUTPUT_DRIVER_PHONE_HDR: ['1', '1', '1', '1', '2', np.nan],
+        OUTPUT_DRIVER_CAPACITY_HDR: ['4', '4', '4', '4', '2', np.nan],
+        DRIVER_GROUP_HDR: ['1', '1', '1', '1', '1', np.nan],
+        RIDER_NAME_HDR: ['r1', 'r2', 'r3', 'r4', 'r5', 'r6'],
+        RIDER_PHONE_HDR: ['11', '12', '13', '14', '15', '16'],
+        RIDER_LOCATION_HDR: ['E', 'a', 'nowhere', 'c', 'b', 'a'],
+        RIDER_NOTES_HDR: [''] * 6,
+    })
+    unordered = post.clean_output(out.copy())
+    assert unordered[OUTPUT_PICKUP_ORDER_HDR].tolist()[1:7] == [''] * 6
+
+    routing.order_pickups(out)
+    assert out[OUTPUT_PICKUP_ORDER_HDR].tolist()[:5] == [3, 1, 4, 2, 1]
+    assert np.isnan(out[OUTPUT_PICKUP_ORDER_HDR].iloc[5])
+
+    formatted = post.clean_output(out)
+    assert formatted[RIDER_NAME_HDR].tolist()[1:5] == ['r2', 'r4', 'r1', 'r3']
+    assert formatted[OUTPUT_PICKUP_ORDER_HDR].tolist()[1:5] == ['1', '2', '3', '4']
+
+    # Routes are saved for the next run on the same map
+    LOC_ROUTES.clear()
+    routing.order_pickups(out)
+    assert len(LOC_ROUTES) == 2
+
+
+def test_exact_and_close_routes(tmp_path):
+    _load(tmp_path, ''.join(f'l{i}\n' for i in range(12)))
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        dist = rng.integers(1, 20, (6, 6))
+        dist = np.minimum(dist, dist.T)
+        np.fill_diagonal(dist, 0)
+        shortest = min(routing._route_len(dist, list(order)) for order in itertools.permutations(range(6)))
+        assert routing._route_len(dist, routing._exact_route(dist)) == shortest
+        assert sorted(routing._two_opt(dist, routing._nearest_neighbor_route(dist))) == list(range(6))
+
+    # Large cars on a line still go end to end
+    stops = [LOC_MAP[f'l{i}'] for i in rng.permutation(12)]
+    assert routing.find_route(stops) == tuple(LOC_MAP[f'l{i}'] for i in range(12))
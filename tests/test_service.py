@@ -0,0 +1,55 @@
+"""Tests for serving assignments from warm state, using synthetic data.
+"""
+
+import os
+import sys
+curr = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(curr))
+
+from cfg.config import *
+import lib.rides_data as data
+import lib.synthetic as synthetic
+import pytest
+import service
+
+
+def _state(tmp_path) -> service.WarmState:
+    cfg_dir = str(tmp_path / 'cfg')
+    data_dir = str(tmp_path / 'pickle')
+    synthetic.write_config(cfg_dir, data_dir, areas=12, permanent=80, weekly=30, drivers=20, seed=2)
+    return service.WarmState({PARAM_CFG_DIR: cfg_dir, PARAM_DATA_DIR: data_dir, PARAM_LOG: 'ERROR'})
+
+
+def test_matches_a_normal_run(tmp_path, run_offline):
+    state = _state(tmp_path)
+    reply = state.handle({PARAM_DAY: ARG_SUNDAY, PARAM_DISTANCE: 3})
+
+    summary = run_offline({PARAM_DISTANCE: 3})
+    out = data.get_cached_output()
+    assert reply['summary'] == summary
+    assert reply['rows'] == out.fillna('').astype(str).values.tolist()
+
+
+def test_reloads_only_changed_files(tmp_path):
+    state = _state(tmp_path)
+    state.handle({PARAM_DAY: ARG_SUNDAY})
+    inputs = state.inputs
+
+    state.handle({PARAM_DAY: ARG_SUNDAY, PARAM_GROUP_SZ: 2})
+    assert state.inputs is inputs
+
+    map_file = os.path.join(state.service_args[PARAM_CFG_DIR], MAP_FILE)
+    with open(map_file, 'a') as map_txt:
+        map_txt.write('\nNew Hall\n')
+    state.handle({PARAM_DAY: ARG_SUNDAY, PARAM_ROTATE: True})
+    assert 'new hall' in LOC_MAP
+    # Rotating rewrites the drivers cache
+    state.handle({PARAM_DAY: ARG_SUNDAY})
+    assert state.inputs is not inputs
+
+
+def test_rejects_invalid_requests(tmp_path):
+    state = _state(tmp_path)
+    for request in [{}, {PARAM_DAY: 'monday'}, {PARAM_DAY: ARG_SUNDAY, PARAM_CFG_DIR: '/etc'}, {PARAM_DAY: ARG_SUNDAY, PARAM_DISTANCE: 99}, {PARAM_DAY: ARG_SUNDAY, PARAM_SERVICE: '1st'}]:
+        with pytest.raises(service.RequestError):
+            state.handle(request)
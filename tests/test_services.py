@@ -0,0 +1,52 @@
+"""Tests for splitting the riders and drivers into any number of services, using synthetic data.
+"""
+
+import os
+import sys
+curr = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(curr))
+
+import cfg
+from cfg.config import *
+import lib.cache as cache
+import lib.feature as feat
+import lib.rides_data as data
+import lib.synthetic as synthetic
+import rides
+
+
+def _assign(offline_args) -> tuple:
+    rides.init_args(offline_args())
+    cfg.init()
+    cache.init()
+    (drivers, riders) = data.get_cached_input()
+    return (riders, feat.assign_sunday(drivers, riders))
+
+
+def test_services_from_config_in_parallel(tmp_path, offline_args, monkeypatch):
+    synthetic.write_config(str(tmp_path / 'cfg'), str(tmp_path / 'pickle'), areas=12, permanent=80, weekly=30, drivers=40, seed=5)
+    with open(tmp_path / 'cfg' / SERVICES_FILE, 'w') as services_file:
+        services_file.write('# day, service, words in the notes\nsunday, 1, first, 1st\nsunday, 2, second, 2nd\nsunday, 3, late\nfriday, 1\n')
+    # A few drivers go to the third service
+    rides.init_args(offline_args())
+    drivers = cache.read(DRIVER_SHEET_KEY)
+    drivers.loc[drivers.index[:6], DRIVER_NOTES_HDR] = 'late service'
+    cache.write(DRIVER_SHEET_KEY, drivers)
+
+    (riders, sequential) = _assign(offline_args)
+    assert list(SERVICES) == ['1', '2', '3']
+    monkeypatch.setattr(feat, 'ORGANIZE_PARALLEL_MIN', 0)
+    (_, parallel) = _assign(offline_args)
+
+    assert parallel.astype(str).equals(sequential.astype(str))
+    assert set(parallel[DRIVER_GROUP_HDR]) == {'1', '2', '3'}
+    late = parallel[parallel[RIDER_NOTES_HDR].str.contains('late')]
+    assert len(late.index) > 0 and (late[DRIVER_GROUP_HDR] == '3').all()
+    assert late[OUTPUT_DRIVER_PHONE_HDR].notna().any()
+
+
+def test_rejects_unknown_main_service(tmp_path, run_offline):
+    synthetic.write_config(str(tmp_path / 'cfg'), str(tmp_path / 'pickle'), areas=8, permanent=20, weekly=10, drivers=10)
+    summary = run_offline({PARAM_SERVICE: '1st'})
+    assert summary['status'] == 'unknown service 1st, choose one of 1, 2'
+    assert summary['riders'] == 0
@@ -0,0 +1,33 @@
+"""Tests for replaying weekly snapshots with driver rotation, using synthetic data.
+"""
+
+import os
+import sys
+curr = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(curr))
+
+from cfg.config import *
+import lib.synthetic as synthetic
+import simulate
+
+
+def test_rotates_drivers_across_weeks(tmp_path):
+    for week in ['week1', 'week2']:
+        synthetic.write_config(str(tmp_path / 'cfg'), str(tmp_path / 'weeks' / week), areas=12, permanent=60, weekly=20, drivers=30, seed=2)
+
+    (runs, loads) = simulate.main({
+        simulate.PARAM_SNAPSHOTS: str(tmp_path / 'weeks'),
+        PARAM_CFG_DIR: str(tmp_path / 'cfg'),
+        simulate.PARAM_DAYS: [ARG_SUNDAY],
+        PARAM_DISTANCE: [1, 3],
+        PARAM_GROUP_SZ: [1],
+        simulate.PARAM_WORKERS: 2,
+        simulate.PARAM_OUTPUT: str(tmp_path / 'simulation.json'),
+        PARAM_LOG: 'ERROR',
+    })
+    assert len(runs.index) == 4
+    assert (runs['status'] == 'ok').all()
+    assert list(runs['week'].iloc[:2]) == ['week1', 'week2']
+    assert (loads['signed_up'] == 2).all()
+    assert loads.groupby(PARAM_DISTANCE)['riders'].sum().tolist() == runs.groupby(PARAM_DISTANCE)['assigned'].sum().tolist()
+    assert os.path.isfile(tmp_path / 'simulation.json')
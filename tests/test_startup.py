@@ -0,0 +1,26 @@
+"""Tests that offline runs do not load the Google Sheets client.
+"""
+
+import os
+import sys
+curr = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(curr))
+
+import lib.synthetic as synthetic
+import subprocess
+
+
+def test_offline_run_skips_gspread(tmp_path):
+    cfg_dir = str(tmp_path / 'cfg')
+    data_dir = str(tmp_path / 'pickle')
+    synthetic.write_config(cfg_dir, data_dir, areas=8, permanent=30, weekly=10, drivers=10)
+    code = '; '.join([
+        f'import sys; sys.path.insert(0, {os.path.dirname(curr)!r})',
+        'import rides',
+        "args = vars(rides.create_parser().parse_args(['--day', 'sunday', '--no-download', '--no-upload', '--log', 'ERROR']))",
+        f"args.update({{'cfg_dir': {cfg_dir!r}, 'data_dir': {data_dir!r}}})",
+        "print(rides.main(args)['status'])",
+        "print(sorted(m for m in sys.modules if m.split('.')[0] in ('gspread', 'google', 'requests')))",
+    ])
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert result.stdout.splitlines()[-2:] == ['ok', '[]']
@@ -0,0 +1,84 @@
+"""Tests for delta syncing the sheets cache, using the offline fake worksheet.
+"""
+
+import os
+import sys
+curr = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(curr))
+
+from cfg.config import *
+import lib.cache as cache
+from lib.fake_sheets import FakeClient, FakeWorksheet
+import lib.rides_data as data
+import pandas as pd
+import rides
+
+HEADER = PERMANENT_RIDER_HDRS
+
+
+def _row(i: int, stamp: str = '1/1/2023 10:00:00') -> list:
+    return [stamp.replace('10:', f'{10 + i % 10}:'), f'Rider {i}', 8585550000 + i, 'Muir' if i % 2 else '', 'Yes', 'No', '']
+
+
+def _setup(tmp_path, rows: int) -> FakeWorksheet:
+    ARGS.clear()
+    ARGS[PARAM_DATA_DIR] = str(tmp_path)
+    cache.init()
+    return FakeWorksheet([HEADER] + [_row(i) for i in range(rows)])
+
+
+def _expected(ws: FakeWorksheet) -> pd.DataFrame:
+    return pd.DataFrame(FakeWorksheet(ws.values).get_all_records())
+
+
+def test_first_sync_downloads_everything(tmp_path):
+    ws = _setup(tmp_path, 20)
+    assert data.sync_sheet(PERMANENT_SHEET_KEY, ws) == 20
+    pd.testing.assert_frame_equal(cache.read(PERMANENT_SHEET_KEY), _expected(ws), check_dtype=False)
+
+
+def test_delta_sync_fetches_edited_and_new_rows(tmp_path):
+    ws = _setup(tmp_path, 500)
+    data.sync_sheet(PERMANENT_SHEET_KEY, ws)
+    full_cells = ws.cells_read
+
+    ws.update_row(10, _row(8, '2/1/2023 10:00:00'))
+    ws.update_row(502, _row(500))
+    ws.update_row(503, _row(501))
+    ws.requests = ws.cells_read = 0
+    assert data.sync_sheet(PERMANENT_SHEET_KEY, ws) == 3
+    assert ws.requests == 2
+    assert ws.cells_read < full_cells / 4
+    pd.testing.assert_frame_equal(cache.read(PERMANENT_SHEET_KEY), _expected(ws), check_dtype=False)
+
+
+def test_unchanged_sheet_fetches_nothing(tmp_path):
+    ws = _setup(tmp_path, 50)
+    data.sync_sheet(PERMANENT_SHEET_KEY, ws)
+    assert data.sync_sheet(PERMANENT_SHEET_KEY, ws) == 0
+
+
+def test_removed_rows_fall_back_to_full_sync(tmp_path):
+    ws = _setup(tmp_path, 50)
+    data.sync_sheet(PERMANENT_SHEET_KEY, ws)
+    del ws.values[5]
+    assert data.sync_sheet(PERMANENT_SHEET_KEY, ws) == 49
+    pd.testing.assert_frame_equal(cache.read(PERMANENT_SHEET_KEY), _expected(ws), check_dtype=False)
+
+
+def test_full_sync_on_request(tmp_path):
+    ws = _setup(tmp_path, 50)
+    data.sync_sheet(PERMANENT_SHEET_KEY, ws)
+    assert data.sync_sheet(PERMANENT_SHEET_KEY, ws, full=True) == 50
+
+
+def test_default_sync_fetches_cells_edited_by_hand(tmp_path):
+    ws = _setup(tmp_path, 50)
+    rides.init_args({PARAM_DAY: ARG_SUNDAY, PARAM_DATA_DIR: str(tmp_path)})
+    gc = FakeClient({'p': ws})
+    assert data.download_sheets(gc, {PERMANENT_SHEET_KEY: 'p'}) == []
+
+    # Editing the notes in the sheet leaves the form timestamp alone
+    ws.values[6][HEADER.index(PERMANENT_RIDER_NOTES_HDR)] = 'ignore'
+    assert data.download_sheets(gc, {PERMANENT_SHEET_KEY: 'p'}) == []
+    assert cache.read(PERMANENT_SHEET_KEY).at[5, PERMANENT_RIDER_NOTES_HDR] == 'ignore'
@@ -0,0 +1,26 @@
+"""Tests that the synthetic benchmark data runs through the whole pipeline.
+"""
+
+import os
+import sys
+curr = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(curr))
+
+from cfg.config import *
+import lib.rides_data as data
+import lib.synthetic as synthetic
+
+
+def test_sunday(tmp_path, run_offline):
+    synthetic.write_config(str(tmp_path / 'cfg'), str(tmp_path / 'pickle'), areas=12, permanent=80, weekly=30, drivers=20, seed=1)
+    summary = run_offline()
+    assert summary['status'] == 'ok'
+    assert summary['assigned'] > 0
+    assert len(data.get_cached_output().index) > summary['riders']
+
+
+def test_friday(tmp_path, run_offline):
+    synthetic.write_config(str(tmp_path / 'cfg'), str(tmp_path / 'pickle'), areas=12, permanent=80, weekly=30, drivers=20, seed=1)
+    summary = run_offline(day=ARG_FRIDAY)
+    assert summary['status'] == 'ok'
+    assert summary['assigned'] > 0
@@ -0,0 +1,66 @@
+"""Tests for uploading only the changed cells of the assignments, using the offline fake worksheet.
+"""
+
+import os
+import sys
+curr = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(curr))
+
+from cfg.config import *
+from lib.fake_sheets import FakeWorksheet
+import lib.rides_data as data
+import numpy as np
+import pandas as pd
+
+HEADER = [DRIVER_NAME_HDR, DRIVER_PHONE_HDR, RIDER_NAME_HDR, RIDER_PHONE_HDR, RIDER_LOCATION_HDR]
+
+
+def _assignments(cars: int) -> pd.DataFrame:
+    rows = []
+    for car in range(cars):
+        for seat in range(4):
+            rider = [f'Rider {car}-{seat}', 8585550000 + car * 10 + seat, 'Muir']
+            rows.append(([f'Driver {car}', 8585551000 + car] if seat == 0 else [np.nan, np.nan]) + rider)
+    return pd.DataFrame(rows, columns=HEADER)
+
+
+def _sheet(df: pd.DataFrame) -> list[list[str]]:
+    ws = FakeWorksheet([])
+    data.upload_assignments(ws, df)
+    return ws.values
+
+
+def test_first_upload_writes_everything():
+    df = _assignments(10)
+    ws = FakeWorksheet([])
+    assert data.upload_assignments(ws, df) == (len(df.index) + 1) * len(HEADER)
+    assert ws.values == _sheet(df)
+
+
+def test_only_changed_cells_are_sent():
+    prev = _assignments(100)
+    ws = FakeWorksheet(_sheet(prev))
+    df = prev.copy()
+    df.loc[5, RIDER_NAME_HDR] = 'Someone else'
+    df.loc[6, [RIDER_NAME_HDR, RIDER_PHONE_HDR]] = ['Another rider', 8585559999]
+    df.loc[300, RIDER_LOCATION_HDR] = 'Revelle'
+
+    sent = data.upload_assignments(ws, df, prev)
+    assert ws.requests == 1
+    assert sent <= 6
+    assert ws.values == _sheet(df)
+
+
+def test_fewer_rows_shrink_the_sheet():
+    prev = _assignments(10)
+    ws = FakeWorksheet(_sheet(prev))
+    df = _assignments(8)
+    data.upload_assignments(ws, df, prev)
+    assert ws.values == _sheet(df)
+
+
+def test_unchanged_output_sends_nothing():
+    prev = _assignments(10)
+    ws = FakeWorksheet(_sheet(prev))
+    assert data.upload_assignments(ws, prev.copy(), prev) == 0
+    assert ws.requests == 0
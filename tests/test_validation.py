@@ -0,0 +1,34 @@
+"""Tests for matching phone numbers by their keys.
+"""
+
+import os
+import sys
+curr = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(curr))
+
+from cfg.config import *
+import lib.setup as setup
+import lib.validation as prep
+import pandas as pd
+
+
+def test_phone_keys():
+    phones = pd.Series(['(858) 555-1234', '858.555.1234', '+1 858 555 1234', '8585551234.0', '', 'nan', '?', '+44 20 7946 0958'])
+    assert prep.phone_keys(phones).tolist() == [8585551234] * 4 + [0] * 3 + [442079460958]
+
+
+def test_drops_same_phone_written_differently(monkeypatch):
+    monkeypatch.setitem(ARGS, PARAM_LOG, 'ERROR')
+    drivers = pd.DataFrame({DRIVER_NAME_HDR: ['A', 'A', 'B'], DRIVER_PHONE_HDR: ['858-555-0001', '8585550001', '']})
+    riders = pd.DataFrame({
+        RIDER_NAME_HDR: ['C', 'C', 'D'],
+        RIDER_PHONE_HDR: ['(619) 555-0002', '6195550002', '6195550003'],
+        RIDER_TIMESTAMP_HDR: pd.to_datetime(['2026-10-02', '2026-10-01', '2026-10-03']),
+    })
+    drivers[TMP_DRIVER_PHONE] = prep.phone_keys(drivers[DRIVER_PHONE_HDR])
+    riders[TMP_RIDER_PHONE] = prep.phone_keys(riders[RIDER_PHONE_HDR])
+
+    setup._drop_invalid(drivers, riders)
+    assert drivers[DRIVER_PHONE_HDR].tolist() == ['8585550001']
+    # The latest sign up is kept
+    assert riders[RIDER_PHONE_HDR].tolist() == ['(619) 555-0002', '6195550003']